@@ -0,0 +1,49 @@
+#-*- coding:utf-8 -*-
+"""
+dumps + loads time and encoded size of common cache values with pickle and
+with smartcache.serializers registries, no redis server is needed
+
+    python benchmarks/codecs.py [rounds]
+"""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import sys
+import timeit
+
+try:
+    import cPickle as pickle
+except Exception as e:
+    import pickle
+
+from smartcache.serializers import CodecRegistry, default_registry
+
+VALUES = [
+    ('int', 123456),
+    ('float', 3.25),
+    ('text', u'user:profile:display-name'),
+    ('bytes', b'x' * 64),
+    ('dict', {'id': 1, 'name': u'name', 'tags': [u'a', u'b', u'c'], 'score': 1.5}),
+]
+
+
+class PickleCodec(object):
+
+    def dumps(self, obj):
+        return pickle.dumps(obj)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    codecs = [('pickle', PickleCodec()), ('tagged', CodecRegistry()), ('default', default_registry())]
+    for kind, value in VALUES:
+        for label, codec in codecs:
+            data = codec.dumps(value)
+            seconds = timeit.timeit(lambda: codec.loads(codec.dumps(value)), number=rounds)
+            print('%-6s %-8s %8.3f us/round trip %5d bytes' % (kind, label, seconds / rounds * 1e6, len(data)))
+
+
+if __name__ == '__main__':
+    main()
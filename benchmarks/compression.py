@@ -0,0 +1,49 @@
+#-*- coding:utf-8 -*-
+"""
+stored size and compress + decompress time of large html fragments with
+each smartcache.compression codec, no redis server is needed
+
+    python benchmarks/compression.py [rounds]
+"""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import sys
+import timeit
+
+try:
+    import cPickle as pickle
+except Exception as e:
+    import pickle
+
+from smartcache.compression import Compressor, ZlibCodec, LzmaCodec, lzma
+
+ROW = u'<tr><td class="name">item %d</td><td class="price">%d.99</td></tr>\n'
+
+
+def fragment(size):
+    rows = []
+    while sum(len(r) for r in rows) < size:
+        rows.append(ROW % (len(rows), len(rows) * 7 % 100))
+    return pickle.dumps(u'<table>%s</table>' % u''.join(rows))
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    codecs = [('zlib-1', ZlibCodec(1)), ('zlib-6', ZlibCodec(6))]
+    if lzma is not None:
+        codecs.append(('lzma-1', LzmaCodec(1)))
+
+    for size in (50 * 1024, 500 * 1024):
+        data = fragment(size)
+        print('%4d KB  none      %8d bytes' % (size // 1024, len(data)))
+        for label, codec in codecs:
+            compressor = Compressor(codec)
+            stored = compressor.compress('page', data)
+            seconds = timeit.timeit(lambda: compressor.decompress(compressor.compress('page', data)),
+                                    number=rounds)
+            print('%4d KB  %-8s  %8d bytes %8.3f ms/round trip' % (
+                size // 1024, label, len(stored), seconds / rounds * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+#-*- coding:utf-8 -*-
+"""
+bytes per entry of the DataObject store against the compact array store
+
+    python benchmarks/object_cache_memory.py [entries]
+
+keys are ints and every entry shares the same value, so the numbers are the
+per entry overhead of each layout
+"""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import gc
+import sys
+import tracemalloc
+
+from smartcache.compact_cache import CompactCache
+from smartcache.object_cache import ObjectCache
+
+VALUE = 'v'
+
+
+def measure(factory, entries):
+    gc.collect()
+    tracemalloc.start()
+    cache = factory()
+    for i in range(entries):
+        cache.set(i, VALUE)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # int keys below 2 ** 30 cost 28 bytes each in both layouts
+    return current / entries, peak / entries
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    for name, factory in (('DataObject', ObjectCache), ('compact', CompactCache)):
+        current, peak = measure(factory, entries)
+        print('%-12s entries=%-9d %7.1f bytes/entry  (peak %7.1f)' % (name, entries, current, peak))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#-*- coding:utf-8 -*-
+"""
+multi-thread throughput of smartcache.object_cache.Cache
+
+    python benchmarks/object_cache_threads.py [threads] [ops_per_thread]
+
+each thread runs a 90% get / 10% set mix over a shared keyspace, once with a
+single locked segment and once per striped configuration
+"""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import random
+import sys
+import threading
+import time
+
+from smartcache.object_cache import Cache
+
+KEYSPACE = 10000
+
+
+def worker(ops, seed, barrier):
+    rnd = random.Random(seed)
+    keys = [rnd.randrange(KEYSPACE) for i in range(1024)]
+    get, set_ = Cache.get, Cache.set
+    barrier.wait()
+    for i in range(ops):
+        key = keys[i & 1023]
+        if i % 10 == 0:
+            set_(key, i)
+        else:
+            get(key)
+
+
+def run(threads, ops, segments):
+    Cache.clear()
+    Cache.configure(max_entries=KEYSPACE // 2, segments=segments)
+    barrier = threading.Barrier(threads + 1)
+    thread_list = [threading.Thread(target=worker, args=(ops, n, barrier)) for n in range(threads)]
+    for t in thread_list:
+        t.start()
+    barrier.wait()
+    start = time.time()
+    for t in thread_list:
+        t.join()
+    elapsed = time.time() - start
+    return threads * ops / elapsed
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    ops = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    for segments in (1, 4, 16, 64):
+        print('threads=%-4d segments=%-4d %12.0f ops/s' % (threads, segments, run(threads, ops, segments)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#-*- coding:utf-8 -*-
+"""
+per call overhead of resolving a redis command in redis_cache.Cache, no
+redis server is needed since commands are only looked up, not sent
+
+    python benchmarks/redis_dispatch.py [calls]
+
+before: __getattr__ on every call and a new StrictRedis (and pool) each time
+after: pooled client from the ConnectionManager and the dispatch table
+"""
+from __future__ import absolute_import, division, print_function, with_statement
+
+import sys
+import timeit
+
+import redis
+
+from smartcache.commands import READ_COMMANDS
+from smartcache.redis_cache import Cache
+
+
+class LegacyCache(Cache):
+
+    def __getattr__(self, name):
+        new_name = name.replace('_Cache', '', 1)
+        if new_name.startswith('__'):
+            command = new_name[2:]
+            if command in READ_COMMANDS:
+                redis_client = self.slave_connection()
+            else:
+                redis_client = self.master_connection()
+            attr = getattr(redis_client, command, None)
+            if attr is not None:
+                return attr
+
+        raise AttributeError('cache has no attribute %s'%name)
+
+    def get_connection(self, host='localhost', port=6379, db=0):
+        return redis.StrictRedis(host=host, port=port, db=db)
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    for label, cc in (('before', LegacyCache()), ('after', Cache())):
+        seconds = timeit.timeit(lambda: cc._Cache__get, number=calls)
+        print('%-7s %8.3f us/call' % (label, seconds / calls * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,804 @@
+#-*- coding:utf-8 -*-
+from __future__ import absolute_import, division, print_function, with_statement
+
+import os
+import time
+import asyncio
+import inspect
+import weakref
+from types import MethodType
+
+import redis.asyncio as aioredis
+from redis.exceptions import NoScriptError
+
+from smartcache.chunked import Manifest, Assembler, ChunkMissing, split, CHUNK_SIZE, CHUNK_WINDOW, REPLACED_GRACE
+from smartcache.commands import READ_COMMANDS
+from smartcache.connection import ConnectionManager, pool_connection
+from smartcache.keyspace import suffixed
+from smartcache.redis_cache import (Cache, ShardClient, ShardCache, MasterSlaveClient,
+                                    LOCK_SUFFIX, STALE_SUFFIX, MANY_CHUNK_SIZE)
+from smartcache.refresh import Envelope, should_refresh
+from smartcache.scanner import SCAN_COUNT
+from smartcache.scripts import scripts
+from smartcache.log import object_cache_log
+
+# replies and values at least this many bytes long are decoded and encoded
+# in an executor instead of on the event loop
+OFFLOAD_BYTES = 64 * 1024
+
+# containers with at least this many items are encoded in an executor
+OFFLOAD_ITEMS = 1000
+
+
+class AsyncConnectionManager(ConnectionManager):
+
+    """
+    ConnectionManager of redis.asyncio clients. asyncio connections belong
+    to the event loop that opened them, so every running loop gets its own
+    clients, dropped with the loop. configure and disconnect are coroutines.
+    """
+
+    def __init__(self, max_connections=None, **pool_kwargs):
+        super(AsyncConnectionManager, self).__init__(max_connections, **pool_kwargs)
+        self._loops = weakref.WeakKeyDictionary()
+
+    async def configure(self, max_connections=None, **pool_kwargs):
+        self.max_connections = max_connections
+        self.pool_kwargs = pool_kwargs
+        await self.disconnect()
+
+    def client(self, host='localhost', port=6379, db=0):
+        if self._pid != os.getpid():
+            self._after_fork()
+
+        loop = asyncio.get_event_loop()
+        clients = self._loops.get(loop)
+        if clients is None:
+            clients = self._loops[loop] = {}
+        client = clients.get((host, port, db))
+        if client is None:
+            client = clients[(host, port, db)] = self._create(host, port, db)
+        return client
+
+    def _create(self, host, port, db):
+        pool = aioredis.ConnectionPool(host=host, port=port, db=db,
+                                       max_connections=self.max_connections,
+                                       **self.pool_kwargs)
+        return aioredis.StrictRedis(connection_pool=pool)
+
+    async def warmup(self, host='localhost', port=6379, db=0, connections=1):
+        pool = self.client(host, port, db).connection_pool
+        opened = []
+        try:
+            for i in range(connections):
+                opened.append(await pool_connection(pool))
+        finally:
+            for connection in opened:
+                await pool.release(connection)
+        return len(opened)
+
+    async def disconnect(self):
+        """disconnect the clients of the running loop
+        """
+        clients = self._loops.pop(asyncio.get_event_loop(), {})
+        for client in clients.values():
+            await client.connection_pool.disconnect()
+
+    def _after_fork(self):
+        super(AsyncConnectionManager, self)._after_fork()
+        self._loops = weakref.WeakKeyDictionary()
+
+
+async_connections = AsyncConnectionManager()
+
+
+def _payload_size(data):
+    if isinstance(data, bytes):
+        return len(data)
+    if isinstance(data, dict):
+        data = data.values()
+    elif not isinstance(data, (list, tuple, set)):
+        return 0
+    return sum(len(i) for i in data if isinstance(i, bytes))
+
+
+class AsyncCache(Cache):
+
+    """
+    asyncio version of redis_cache.Cache over redis.asyncio, every command
+    method is a coroutine with the arguments and result of its Cache
+    counterpart. An instance is bound to the event loop of its first command.
+
+    Replies of OFFLOAD_BYTES or more are decoded in executor, None for the
+    loop default, so large values do not block the loop.
+
+    ::code-block
+        cache = AsyncCache()
+        await cache.set('a', 1)
+        a, b = await asyncio.gather(cache.get('a'), cache.get('b'))
+    """
+
+    executor = None
+
+    def __init__(self):
+        self._refreshing = set()
+        # the loop only keeps weak references to tasks
+        self._tasks = set()
+
+    def __getattr__(self, name):
+        for prefix in ('_Cache__', '_AsyncCache__'):
+            if name.startswith(prefix):
+                command = name[len(prefix):]
+                if command in READ_COMMANDS:
+                    redis_client = self.slave_connection()
+                else:
+                    redis_client = self.master_connection()
+                attr = getattr(redis_client, command, None)
+                if attr is not None:
+                    self.__dict__[name] = attr
+                    return attr
+
+        raise AttributeError('cache has no attribute %s'%name)
+
+    def get_connection(self, host='localhost', port=6379, db=0):
+        return async_connections.client(host, port, db)
+
+    def _reset_dispatch(self):
+        for name in [k for k in self.__dict__ if k.startswith(('_Cache__', '_AsyncCache__'))]:
+            del self.__dict__[name]
+
+    def pipeline(self):
+        raise NotImplementedError('batch with get_many, set_many, delete_many or asyncio.gather')
+
+    def __contains__(self, item):
+        raise TypeError('use await cache.exists(name)')
+
+    def _result(self, reply, callback):
+        return self._apply(reply, callback)
+
+    async def _script(self, name, keys, args=(), read=False):
+        client = self.slave_connection() if read else self.master_connection()
+        script = scripts.get(name)
+        argv = tuple(keys) + tuple(args)
+        try:
+            return await client.evalsha(script.sha, len(keys), *argv)
+        except NoScriptError:
+            await client.script_load(script.source)
+            return await client.evalsha(script.sha, len(keys), *argv)
+
+    async def load_scripts(self):
+        for client in set([self.master_connection(), self.slave_connection()]):
+            for script in scripts:
+                await client.script_load(script.source)
+
+    async def _apply(self, reply, callback):
+        data = await reply
+        if _payload_size(data) >= OFFLOAD_BYTES:
+            return await asyncio.get_event_loop().run_in_executor(self.executor, callback, data)
+        return callback(data)
+
+    async def _offload(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(self.executor, func, *args)
+
+    async def _encode(self, name, value):
+        size = len(value) if isinstance(value, (bytes, str)) else 0
+        items = len(value) if isinstance(value, (list, tuple, set, dict)) else 0
+        if size >= OFFLOAD_BYTES or items >= OFFLOAD_ITEMS:
+            return await self._offload(self._dumps_value, name, value)
+        return self._dumps_value(name, value)
+
+    async def set(self, name, value):
+        """redis set command
+        """
+        if not self.valid(value):
+            return
+
+        if not self.valid(name):
+            return
+        name = self._key(name)
+        await self.__set(name, await self._encode(name, value), ex=self._ttl(name, None))
+        self._bloom_add(name)
+        await self._invalidate(name)
+
+    async def get_or_set(self, name, loader, ttl=None, stale_ttl=None, soft_ttl=None, beta=1.0,
+                         lock_timeout=10, wait=5, interval=0.05):
+        """see Cache.get_or_set, loader may be a plain function or a coroutine
+        function, a background refresh runs as a task of the current loop
+        """
+        name = self._key(name)
+        value = await self._get_value(name)
+        if value.__class__ is Envelope:
+            if should_refresh(value, beta) and name not in self._refreshing:
+                self._refreshing.add(name)
+                task = asyncio.ensure_future(self._refresh(name, loader, ttl, stale_ttl, soft_ttl, lock_timeout))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return value.value
+
+        if value is not None:
+            return value
+
+        lock_name = suffixed(name, LOCK_SUFFIX)
+        token = await self.acquire_lock(lock_name, lock_timeout)
+        if token:
+            try:
+                value = await self.get(name)
+                if value is None:
+                    value = await self._load(name, loader, ttl, stale_ttl, soft_ttl)
+                return value
+            finally:
+                await self.release_lock(lock_name, token)
+
+        if stale_ttl:
+            value = await self.get(suffixed(name, STALE_SUFFIX))
+            if value is not None:
+                return value
+
+        deadline = time.time() + wait
+        while time.time() < deadline:
+            await asyncio.sleep(interval)
+            value = await self.get(name)
+            if value is not None:
+                return value
+
+        return await self._call(loader)
+
+    async def _refresh(self, name, loader, ttl, stale_ttl, soft_ttl, lock_timeout):
+        try:
+            lock_name = suffixed(name, LOCK_SUFFIX)
+            token = await self.acquire_lock(lock_name, lock_timeout)
+            if not token:
+                return
+
+            try:
+                await self._load(name, loader, ttl, stale_ttl, soft_ttl)
+            finally:
+                await self.release_lock(lock_name, token)
+        except Exception as e:
+            object_cache_log.exception(e)
+        finally:
+            self._refreshing.discard(name)
+
+    @staticmethod
+    async def _call(loader):
+        value = loader()
+        if inspect.isawaitable(value):
+            value = await value
+        return value
+
+    async def _load(self, name, loader, ttl, stale_ttl, soft_ttl):
+        start = time.time()
+        value = await self._call(loader)
+        stored = value
+        if soft_ttl is not None:
+            now = time.time()
+            stored = Envelope(value, now - start, now + soft_ttl)
+
+        if self.valid(value):
+            await self._set_with_stale(name, stored, ttl, stale_ttl)
+        return value
+
+    async def _set_with_stale(self, name, value, ttl, stale_ttl):
+        ttl = self._ttl(name, ttl)
+        data = await self._encode(name, value)
+        await self.__set(name, data, ex=ttl)
+        self._bloom_add(name)
+        if stale_ttl:
+            stale_name = suffixed(name, STALE_SUFFIX)
+            await self.__set(stale_name, data, ex=(ttl or 0) + stale_ttl)
+            self._bloom_add(stale_name)
+        await self._invalidate(name)
+
+    async def get(self, name):
+        """redis get command
+        """
+        name = self._key(name)
+        if self.bloom is not None and name not in self.bloom:
+            return None
+
+        return await self._apply(self.__get(name), self._decode_value)
+
+    async def _get_value(self, name):
+        if self.bloom is not None and name not in self.bloom:
+            return None
+
+        return await self._apply(self.__get(name), self._loads_value)
+
+    async def get_many(self, names, chunk_size=MANY_CHUNK_SIZE):
+        """mget command, the chunks of chunk_size names are sent concurrently
+        :returns dict of the names that exist to their value
+        """
+        names = [self._key(name) for name in names]
+        if self.bloom is not None:
+            names = [name for name in names if name in self.bloom]
+
+        result = {}
+        for decoded in await asyncio.gather(*[
+                self._apply(self.__mget(chunk), lambda data, chunk=chunk: self._decode_many(chunk, data))
+                for chunk in self._chunks(names, chunk_size)]):
+            result.update(decoded)
+        return result
+
+    async def set_many(self, mapping, ttl=None, chunk_size=MANY_CHUNK_SIZE):
+        """mset command, or pipelined set commands with ttl, the chunks of
+        chunk_size names are sent concurrently
+        """
+        encode = lambda: [(self._key(name), self._dumps_value(self._key(name), value)) for name, value in mapping.items()
+                          if self.valid(name) and self.valid(value)]
+        items = await self._offload(encode) if len(mapping) >= OFFLOAD_ITEMS else encode()
+
+        pipes = []
+        for chunk in self._chunks(items, chunk_size):
+            pipe = self.__pipeline(transaction=False)
+            ttls = [self._ttl(name, ttl) for name, data in chunk]
+            if not any(ttls):
+                pipe.mset(dict(chunk))
+            else:
+                for (name, data), name_ttl in zip(chunk, ttls):
+                    pipe.set(name, data, ex=name_ttl)
+            for name, data in chunk:
+                self._bloom_add(name)
+                if self.invalidation_channel:
+                    pipe.publish(self.invalidation_channel, name)
+            pipes.append(pipe.execute())
+        await asyncio.gather(*pipes)
+
+    async def delete_many(self, names, chunk_size=MANY_CHUNK_SIZE):
+        """del command, the chunks of chunk_size names are sent concurrently
+        :returns number of names deleted
+        """
+        names = [self._key(name) for name in names]
+        pipes = []
+        for chunk in self._chunks(names, chunk_size):
+            pipe = self.__pipeline(transaction=False)
+            pipe.delete(*chunk)
+            if self.invalidation_channel:
+                for name in chunk:
+                    pipe.publish(self.invalidation_channel, name)
+            pipes.append(pipe.execute())
+        return sum(replies[0] for replies in await asyncio.gather(*pipes))
+
+    async def set_large(self, name, value, ttl=None, chunk_size=CHUNK_SIZE):
+        """see Cache.set_large
+        """
+        if not self.valid(name) or not self.valid(value):
+            return
+
+        name = self._key(name)
+        ttl = self._ttl(name, ttl)
+        data = await self._encode(name, value)
+        manifest = Manifest.new(len(data), chunk_size)
+        keys = manifest.chunk_keys(name)
+        pipe = self.__pipeline(transaction=False)
+        for key, chunk in zip(keys, split(data, chunk_size)):
+            pipe.set(key, chunk, ex=ttl)
+        try:
+            await pipe.execute()
+        except Exception:
+            try:
+                await self.__delete(*keys)
+            except Exception as e:
+                object_cache_log.exception(e)
+            raise
+
+        pipe = self.__pipeline(transaction=False)
+        pipe.getset(name, manifest.pack())
+        if ttl:
+            pipe.expire(name, ttl)
+        replaced = Manifest.unpack((await pipe.execute())[0])
+        self._bloom_add(name)
+        await self._invalidate(name)
+
+        if replaced is not None:
+            pipe = self.__pipeline(transaction=False)
+            for key in replaced.chunk_keys(name):
+                pipe.expire(key, REPLACED_GRACE)
+            await pipe.execute()
+        return value
+
+    async def get_large(self, name, window=CHUNK_WINDOW):
+        """see Cache.get_large, the buffer is decoded in executor
+        """
+        name = self._key(name)
+        data = await self.__get(name)
+        manifest = Manifest.unpack(data)
+        if manifest is None:
+            return self._decode_value(data)
+
+        assembler = Assembler(manifest)
+        try:
+            for keys in self._chunks(manifest.chunk_keys(name), window):
+                for chunk in await self.__mget(keys):
+                    assembler.add(chunk)
+        except ChunkMissing:
+            return None
+        if not assembler.complete:
+            return None
+        return await self._offload(self._decode_value, assembler.buffer)
+
+    async def delete_large(self, name):
+        """see Cache.delete_large
+        """
+        name = self._key(name)
+        manifest = Manifest.unpack(await self.__get(name))
+        keys = manifest.chunk_keys(name) if manifest is not None else []
+        result = await self.__delete(name, *keys)
+        await self._invalidate(name)
+        return result
+
+    async def iter_large(self, name, window=CHUNK_WINDOW):
+        """async generator of the serialized chunks, see Cache.iter_large
+        """
+        name = self._key(name)
+        manifest = Manifest.unpack(await self.__get(name))
+        if manifest is None:
+            return
+
+        for keys in self._chunks(manifest.chunk_keys(name), window):
+            for chunk in await self.__mget(keys):
+                if chunk is None:
+                    raise ChunkMissing('chunk of %s expired or evicted' % name)
+                yield chunk
+
+    async def exists(self, name):
+        """redis exists command
+        """
+        name = self._key(name)
+        if self.bloom is not None and name not in self.bloom:
+            return False
+
+        return bool(await self.__exists(name))
+
+    async def delete(self, name):
+        """redis delete command
+        """
+        name = self._key(name)
+        result = await self.__delete(name)
+        await self._invalidate(name)
+        return result
+
+    async def rebuild_bloom(self):
+        """refill the bloom filter from every key of the db, reads keep using
+        the previous filter until the scan is done
+        """
+        fresh = self.bloom.start_rebuild()
+        try:
+            async for keys in self.scan_db():
+                for key in keys:
+                    fresh.add(key)
+        except Exception:
+            self.bloom.abort_rebuild()
+            raise
+        self.bloom.finish_rebuild(fresh)
+
+    async def inc(self, key, amount=1):
+        """inc command, None when counters buffers the delta
+        """
+        key = self._key(key)
+        self._bloom_add(key)
+        if self.counters is not None:
+            return self.counters.inc(key, amount)
+        result = await self.__incrby(key, amount)
+        await self._invalidate(key)
+        return result
+
+    async def hinc(self, name, key, amount=1):
+        """hset hincrby command
+        """
+        name = self._key(name)
+        self._bloom_add(name)
+        if self.counters is not None:
+            return self.counters.hinc(name, key, amount)
+        return await self.__hincrby(name, key, amount)
+
+    async def inc_score(self, name, value, amount=1):
+        """sortedset zincrby command
+        """
+        name = self._key(name)
+        self._bloom_add(name)
+        if self.counters is not None:
+            return self.counters.inc_score(name, value, amount)
+        return await self.__zincrby(name, amount, self.dumps(value))
+
+    async def append(self, name, value):
+        """redis append command
+        """
+        name = self._key(name)
+        self._bloom_add(name)
+        result = await self.__append(name, value)
+        await self._invalidate(name)
+        return result
+
+    async def rename(self, name, newname):
+        """redis rename command
+        """
+        name, newname = self._key(name), self._key(newname)
+        self._bloom_add(newname)
+        result = await self.__rename(name, newname)
+        await self._invalidate(name)
+        await self._invalidate(newname)
+        return result
+
+    async def renamenx(self, name, newname):
+        """redis renamenx command
+        """
+        name, newname = self._key(name), self._key(newname)
+        self._bloom_add(newname)
+        result = await self.__renamenx(name, newname)
+        await self._invalidate(name)
+        await self._invalidate(newname)
+        return result
+
+    async def _invalidate(self, name):
+        if self.invalidation_channel:
+            await self.__publish(self.invalidation_channel, name)
+
+    async def scan(self, match=None, count=SCAN_COUNT, type=None):
+        """async generator of the keys matching match, of type type, the TYPE
+        option needs redis 6.0
+        """
+        cursor = None
+        while cursor != 0:
+            cursor, keys = await self.__scan(cursor or 0, match=match, count=count, _type=type)
+            for key in keys:
+                yield key
+
+    async def scan_db(self):
+        """async generator of the key batches returned by scan
+        """
+        start = None
+        while start != 0:
+            start, result = await self.__scan(start or 0)
+            yield result
+
+    @staticmethod
+    async def _scan_pages(fetch, prefetch):
+        cursor, page = await fetch(0)
+        while True:
+            pending = asyncio.ensure_future(fetch(cursor)) if prefetch and cursor != 0 else None
+            yield page
+            if cursor == 0:
+                return
+            cursor, page = await (pending if pending is not None else fetch(cursor))
+
+    async def iter_hash(self, name, match=None, count=SCAN_COUNT, prefetch=False):
+        """async generator of (field, value) pairs, see Cache.iter_hash
+        """
+        hscan, loads, name = self.__hscan, self._loads_value, self._key(name)
+        async for page in self._scan_pages(lambda cursor: hscan(name, cursor, match=match, count=count), prefetch):
+            for pair in [(field, loads(value)) for field, value in page.items()]:
+                yield pair
+
+    async def iter_set(self, name, match=None, count=SCAN_COUNT, prefetch=False):
+        """async generator of set members, see Cache.iter_set
+        """
+        sscan, loads, name = self.__sscan, self._loads_value, self._key(name)
+        async for page in self._scan_pages(lambda cursor: sscan(name, cursor, match=match, count=count), prefetch):
+            for member in [loads(member) for member in page]:
+                yield member
+
+    async def iter_sortedset(self, name, match=None, count=SCAN_COUNT, prefetch=False):
+        """async generator of (member, score) pairs, see Cache.iter_sortedset
+        """
+        zscan, loads, name = self.__zscan, self._loads_value, self._key(name)
+        async for page in self._scan_pages(lambda cursor: zscan(name, cursor, match=match, count=count), prefetch):
+            for pair in [(loads(member), score) for member, score in page]:
+                yield pair
+
+    async def hash(self, name, key=None, value=None):
+        """hset and hget command
+        """
+        if key is None and value is None:
+            return await self._hash_all(name)
+
+        if value is not None:
+            return await self._update_hash(name, key, value)
+        else:
+            return await self._apply(self.__hget(self._key(name), key), self._loads_value)
+
+    async def _update_hash(self, name, key, value):
+        if not self.valid(name) or not self.valid(key) or not self.valid(value):
+            return
+
+        name, key = self._key(name), str(key)
+        self._bloom_add(name)
+        await self.__hset(name, key, await self._encode(name, value))
+
+    async def lupdate(self, name, data):
+        """lpush command
+        """
+        await self._update_list(name, data, 'lpush')
+
+    async def rupdate(self, name, data):
+        """rpush command
+        """
+        await self._update_list(name, data, 'rpush')
+
+    async def _update_list(self, name, data, command):
+        if not self.valid(name):
+            return
+
+        if self._is_iterable(data):
+            result = [self.dumps(i) for i in data]
+        else:
+            result = [self.dumps(data)]
+
+        if not result:
+            return
+        name = self._key(name)
+        self._bloom_add(name)
+        await getattr(self, '_Cache__' + command)(name, *result)
+
+    async def members(self, name, count=1, with_all=False):
+        """set srandmember command
+        :return set members
+        """
+        name = self._key(name)
+        if with_all:
+            result = self.__smembers(name)
+        else:
+            result = self.__srandmember(name, abs(count))
+        return await self._apply(result, self._loads_members)
+
+    async def update_set(self, name, member):
+        if not self.valid(name):
+            return
+
+        name = self._key(name)
+        self._bloom_add(name)
+        if self._is_iterable(member):
+            result = [self.dumps(i) for i in member]
+            if not result:
+                return 0
+            return await self.__sadd(name, *result)
+        return await self.__sadd(name, self.dumps(member))
+
+    async def update_sortedset(self, name, value_list):
+        """sortedset zadd command
+        """
+        if not self.valid(name):
+            return
+
+        if not self._is_iterable(value_list):
+            return
+
+        if isinstance(value_list, tuple):
+            value_list = [value_list]
+        mapping = dict((self.dumps(value), score) for value, score in value_list)
+        if not mapping:
+            return
+
+        name = self._key(name)
+        self._bloom_add(name)
+        return await self.__zadd(name, mapping)
+
+
+class AsyncShardClient(ShardClient):
+
+    def connect_redis(self, host='localhost', port=6379, db=0, **kwargs):
+        # clients are created per loop on first use
+        return lambda: async_connections.client(host, port, db)
+
+
+class AsyncShardCache(object):
+
+    """
+    asyncio version of redis_cache.ShardCache, with one AsyncCache per node
+    so concurrent commands never share an injected connection
+    """
+
+    slots = ShardCache.slots
+
+    def __init__(self, servers):
+        self.shard_client = AsyncShardClient(servers)
+        self._caches = {}
+        for node, connection in self.shard_client._connections.items():
+            cc = self.get_cache()
+            cc.inject_connection(connection)
+            self._caches[node] = cc
+
+    def get_cache(self):
+        return AsyncCache()
+
+    def node_cache(self, key):
+        return self._caches[self.shard_client.get_server(key)]
+
+    def __getattr__(self, name):
+        if name in self.slots or name.startswith('_') or not hasattr(AsyncCache, name):
+            raise AttributeError('AsyncShardCache has no attribute %s'%name)
+
+        def route(key, *args, **kwargs):
+            return getattr(self.node_cache(key), name)(key, *args, **kwargs)
+
+        return route
+
+    def _node_groups(self, names):
+        groups = {}
+        for name in names:
+            groups.setdefault(self.shard_client.get_server(name), []).append(name)
+        return [(self._caches[node], group) for node, group in groups.items()]
+
+    async def get_many(self, names, **kwargs):
+        result = {}
+        for decoded in await asyncio.gather(*[cc.get_many(group, **kwargs)
+                                              for cc, group in self._node_groups(names)]):
+            result.update(decoded)
+        return result
+
+    async def set_many(self, mapping, ttl=None, **kwargs):
+        await asyncio.gather(*[cc.set_many(dict((name, mapping[name]) for name in group), ttl, **kwargs)
+                               for cc, group in self._node_groups(list(mapping))])
+
+    async def delete_many(self, names, **kwargs):
+        return sum(await asyncio.gather(*[cc.delete_many(group, **kwargs)
+                                          for cc, group in self._node_groups(names)]))
+
+    async def scan(self, match=None, count=SCAN_COUNT, type=None):
+        """async generator of the keys matching match on every node, one node
+        after the other
+        """
+        for cc in self._caches.values():
+            async for key in cc.scan(match, count, type):
+                yield key
+
+    async def scan_db(self):
+        for cc in self._caches.values():
+            async for batch in cc.scan_db():
+                yield batch
+
+
+class AsyncMasterSlaveClient(MasterSlaveClient):
+
+    def connect_redis(self, host='localhost', port=6379, db=0, **kwargs):
+        return lambda: async_connections.client(host, port, db)
+
+    def get_master(self):
+        return self._master.client()
+
+    def get_slave(self, key):
+        return self._slave[self.hash_method(key)].client()
+
+
+class AsyncMasterSlaveCache(object):
+
+    """
+    asyncio version of redis_cache.MasterSlaveCache, with one AsyncCache
+    per slave, every one writing to the master
+    """
+
+    slots = ShardCache.slots
+
+    def __init__(self, servers):
+        self.master_slave_client = AsyncMasterSlaveClient(servers)
+        master = self.master_slave_client._master.client
+        slaves = [nc.client for nc in self.master_slave_client._slave] or [master]
+        self._caches = []
+        for slave in slaves:
+            cc = self.get_cache()
+            cc.master_connection = MethodType(lambda x: master(), cc)
+            cc.slave_connection = MethodType(lambda x, slave=slave: slave(), cc)
+            self._caches.append(cc)
+
+    def get_cache(self):
+        return AsyncCache()
+
+    def __getattr__(self, name):
+        if name in self.slots or name.startswith('_') or not hasattr(AsyncCache, name):
+            raise AttributeError('AsyncMasterSlaveCache has no attribute %s'%name)
+
+        def route(key, *args, **kwargs):
+            if len(self._caches) == 1:
+                cc = self._caches[0]
+            else:
+                cc = self._caches[self.master_slave_client.hash_method(key)]
+            return getattr(cc, name)(key, *args, **kwargs)
+
+        return route
+
+    def scan(self, match=None, count=SCAN_COUNT, type=None):
+        """scan the master, every cache writes and scans there
+        """
+        return self._caches[0].scan(match, count, type)
+
+    def scan_db(self):
+        return self._caches[0].scan_db()
@@ -0,0 +1,242 @@
+#-*- coding:utf-8 -*-
+from __future__ import absolute_import, division, print_function, with_statement
+
+import math
+import struct
+import hashlib
+import threading
+
+
+def to_bytes(key):
+    if isinstance(key, bytes):
+        return key
+    if not isinstance(key, str):
+        key = str(key)
+    return key.encode('utf-8')
+
+
+class BloomFilter(object):
+
+    """
+    client side Bloom filter over redis key names, sized for capacity keys at
+    error_rate false positives.
+
+    Bits are numbered like redis SETBIT/GETBIT (most significant bit of each
+    byte first), so the filter can be stored as a plain redis bitmap with
+    save and merged with the copies of other processes with sync.
+
+    A key missing from the filter was never added, as long as every writer
+    adds to the filter: keys written by other processes are only known once
+    their filter was synced.
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self.checks = 0
+        self.negatives = 0
+        self._lock = threading.Lock()
+        # filter being rebuilt, it gets every add until it is swapped in
+        self._shadow = None
+
+    def _positions(self, key):
+        # double hashing, the two halves of one md5 give every position
+        h1, h2 = struct.unpack('<QQ', hashlib.md5(to_bytes(key)).digest())
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, key):
+        """:returns whether a bit changed, count only grows for new keys
+        """
+        changed = False
+        with self._lock:
+            bits = self.bits
+            for pos in self._positions(key):
+                mask = 0x80 >> (pos & 7)
+                if not bits[pos >> 3] & mask:
+                    bits[pos >> 3] |= mask
+                    changed = True
+            if changed:
+                self.count += 1
+            if self._shadow is not None:
+                self._shadow.add(key)
+        return changed
+
+    def __contains__(self, key):
+        self.checks += 1
+        if not self.has(key):
+            self.negatives += 1
+            return False
+        return True
+
+    def has(self, key):
+        """membership without counting checks
+        """
+        bits = self.bits
+        for pos in self._positions(key):
+            if not bits[pos >> 3] & (0x80 >> (pos & 7)):
+                return False
+        return True
+
+    def clear(self):
+        with self._lock:
+            self.bits = bytearray(len(self.bits))
+            self.count = 0
+
+    def rebuild(self, keys):
+        """refill the filter from keys in a new bitmap swapped in at the end,
+        reads see the previous bits meanwhile and keys added meanwhile are kept
+        """
+        fresh = self.start_rebuild()
+        try:
+            for key in keys:
+                fresh.add(key)
+        except Exception:
+            self.abort_rebuild()
+            raise
+        self.finish_rebuild(fresh)
+
+    def start_rebuild(self):
+        """empty filter to refill, it also gets every key added here until
+        finish_rebuild swaps it in
+        """
+        fresh = self._shadow = BloomFilter(self.capacity, self.error_rate)
+        return fresh
+
+    def finish_rebuild(self, fresh):
+        with self._lock:
+            self.bits, self.count = fresh.bits, fresh.count
+            self._shadow = None
+
+    def abort_rebuild(self):
+        self._shadow = None
+
+    def update(self, data):
+        """or the bitmap data into this filter
+        """
+        if len(data) != len(self.bits):
+            raise ValueError('bitmap size %s does not match %s' % (len(data), len(self.bits)))
+
+        with self._lock:
+            bits = bytearray(data)
+            for i, b in enumerate(self.bits):
+                bits[i] |= b
+            self.bits = bits
+
+    def save(self, client, name):
+        """overwrite the redis bitmap name with this filter
+        """
+        client.set(name, bytes(self.bits))
+
+    def load(self, client, name):
+        """or the redis bitmap name into this filter
+        :returns False when there is no such bitmap
+        """
+        data = client.get(name)
+        if not data:
+            return False
+
+        self.update(data)
+        return True
+
+    def sync(self, client, name):
+        """merge this filter into the redis bitmap name with BITOP OR and take
+        back the union, in one pipelined round trip
+        """
+        tmp = '%s:sync:%s' % (name, id(self))
+        pipe = client.pipeline()
+        pipe.set(tmp, bytes(self.bits), ex=60)
+        pipe.bitop('OR', name, name, tmp)
+        pipe.delete(tmp)
+        pipe.get(name)
+        data = pipe.execute()[-1]
+        # a shorter bitmap in redis is padded with zeros by BITOP
+        self.update(data[:len(self.bits)])
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'hashes': self.hashes,
+            'count': self.count,
+            'checks': self.checks,
+            'negatives': self.negatives,
+        }
+
+
+class ScalableBloomFilter(object):
+
+    """
+    chain of BloomFilters, a new one with grow times the capacity and a
+    tighter error rate is added once the last one holds its capacity keys
+    """
+
+    def __init__(self, capacity=100000, error_rate=0.01, grow=2, tightening=0.5):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.grow = grow
+        self.tightening = tightening
+        self.filters = [BloomFilter(capacity, error_rate * (1 - tightening))]
+        self.checks = 0
+        self.negatives = 0
+        self._shadow = None
+
+    def add(self, key):
+        shadow = self._shadow
+        filters = self.filters
+        # a key already in an earlier filter must not use up capacity
+        if not any(f.has(key) for f in filters[:-1]):
+            last = filters[-1]
+            if last.count >= last.capacity and not last.has(key):
+                last = BloomFilter(last.capacity * self.grow, last.error_rate * self.tightening)
+                filters.append(last)
+            last.add(key)
+        if shadow is not None:
+            shadow.add(key)
+
+    def __contains__(self, key):
+        self.checks += 1
+        for f in reversed(self.filters):
+            if key in f:
+                return True
+        self.negatives += 1
+        return False
+
+    def clear(self):
+        first = self.filters[0]
+        first.clear()
+        self.filters = [first]
+
+    def rebuild(self, keys):
+        """see BloomFilter.rebuild
+        """
+        fresh = self.start_rebuild()
+        try:
+            for key in keys:
+                fresh.add(key)
+        except Exception:
+            self.abort_rebuild()
+            raise
+        self.finish_rebuild(fresh)
+
+    def start_rebuild(self):
+        fresh = self._shadow = ScalableBloomFilter(self.capacity, self.error_rate, self.grow, self.tightening)
+        return fresh
+
+    def finish_rebuild(self, fresh):
+        self.filters = fresh.filters
+        self._shadow = None
+
+    def abort_rebuild(self):
+        self._shadow = None
+
+    def stats(self):
+        return {
+            'filters': len(self.filters),
+            'count': sum(f.count for f in self.filters),
+            'checks': self.checks,
+            'negatives': self.negatives,
+        }
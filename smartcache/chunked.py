@@ -0,0 +1,99 @@
+#-*- coding:utf-8 -*-
+from __future__ import absolute_import, division, print_function, with_statement
+
+import struct
+import uuid
+import binascii
+
+from smartcache.keyspace import suffixed
+
+# first bytes of a manifest, \x1e is reserved by smartcache.serializers so
+# a manifest never reads as a plain value
+MANIFEST_MAGIC = b'\x1eM'
+
+# magic, version, serialized size, chunk size
+MANIFEST = struct.Struct('<2s16sQI')
+
+# bytes per chunk key
+CHUNK_SIZE = 1024 * 1024
+
+# chunks read per round trip
+CHUNK_WINDOW = 8
+
+# seconds the chunks of a replaced value stay readable, for readers that
+# fetched the previous manifest
+REPLACED_GRACE = 60
+
+
+class ChunkMissing(LookupError):
+    pass
+
+
+class Manifest(object):
+
+    """
+    layout of a value split across chunk keys. Chunk keys carry the version
+    of their manifest, so a new write never touches the chunks a reader of
+    the previous manifest is fetching.
+    """
+
+    __slots__ = ['version', 'size', 'chunk_size']
+
+    def __init__(self, version, size, chunk_size):
+        self.version = version
+        self.size = size
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def new(cls, size, chunk_size=CHUNK_SIZE):
+        return cls(uuid.uuid4().bytes, size, chunk_size)
+
+    @classmethod
+    def unpack(cls, data):
+        """the manifest stored in data, None for any other value
+        """
+        if not data or len(data) != MANIFEST.size or data[:2] != MANIFEST_MAGIC:
+            return None
+        magic, version, size, chunk_size = MANIFEST.unpack(data)
+        return cls(version, size, chunk_size)
+
+    def pack(self):
+        return MANIFEST.pack(MANIFEST_MAGIC, self.version, self.size, self.chunk_size)
+
+    @property
+    def chunks(self):
+        return (self.size + self.chunk_size - 1) // self.chunk_size
+
+    def chunk_keys(self, name):
+        version = binascii.hexlify(self.version).decode('ascii')
+        return [suffixed(name, ':chunk:%s:%d' % (version, index)) for index in range(self.chunks)]
+
+
+def split(data, chunk_size):
+    """memoryview slices of data, no copy is made
+    """
+    view = memoryview(data)
+    return [view[start:start + chunk_size] for start in range(0, len(data), chunk_size)]
+
+
+class Assembler(object):
+
+    """
+    preallocated buffer the chunks of a manifest are copied into, in order
+    """
+
+    def __init__(self, manifest):
+        self.buffer = bytearray(manifest.size)
+        self._view = memoryview(self.buffer)
+        self._offset = 0
+
+    def add(self, chunk):
+        if chunk is None:
+            raise ChunkMissing('chunk expired or evicted')
+        end = self._offset + len(chunk)
+        self._view[self._offset:end] = chunk
+        self._offset = end
+
+    @property
+    def complete(self):
+        return self._offset == len(self.buffer)
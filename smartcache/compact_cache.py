@@ -0,0 +1,254 @@
+#-*- coding:utf-8 -*-
+from __future__ import absolute_import, division, print_function, with_statement
+
+import time
+import random
+import threading
+from array import array
+
+from smartcache.object_cache import DataObject, ObjectCache, REAP_STEPS
+
+EMPTY, USED, DELETED = 0, 1, 2
+
+# the table is grown once used and deleted slots exceed this share
+LOAD_FACTOR = 0.6
+
+# used slots sampled per eviction, the least recently visited one goes
+EVICTION_SAMPLES = 5
+
+
+class CompactStore(object):
+
+    """
+    object cache store without a per entry object: keys and values live in
+    two lists and the metadata in parallel arrays, all indexed by an open
+    addressing table with linear probing.
+
+    Eviction samples EVICTION_SAMPLES entries and removes the least recently
+    visited one, expired entries are reclaimed by a cursor sweeping a few
+    slots on every write.
+    """
+
+    def __init__(self, capacity=1024, max_entries=None):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._initial = self._round(capacity)
+        self._lock = threading.Lock()
+        self._alloc(self._initial)
+
+    @staticmethod
+    def _round(capacity):
+        size = 8
+        while size < capacity:
+            size <<= 1
+        return size
+
+    def _alloc(self, capacity):
+        self._mask = capacity - 1
+        self._state = array('b', [EMPTY]) * capacity
+        self._hashes = array('q', [0]) * capacity
+        self._expire = array('d', [0.0]) * capacity
+        self._updated = array('d', [0.0]) * capacity
+        self._visited = array('d', [0.0]) * capacity
+        self._keys = [None] * capacity
+        self._values = [None] * capacity
+        self._used = 0
+        self._filled = 0
+        self._reap_cursor = 0
+
+    def _lookup(self, key, h):
+        state, hashes, keys, mask = self._state, self._hashes, self._keys, self._mask
+        i = h & mask
+        while True:
+            s = state[i]
+            if s == EMPTY:
+                return -1
+            if s == USED and hashes[i] == h and (keys[i] is key or keys[i] == key):
+                return i
+            i = (i + 1) & mask
+
+    def _free_slot(self, h):
+        state, mask = self._state, self._mask
+        i = h & mask
+        while state[i] == USED:
+            i = (i + 1) & mask
+        return i
+
+    def _resize(self):
+        state, hashes, keys, values = self._state, self._hashes, self._keys, self._values
+        expire, updated, visited = self._expire, self._updated, self._visited
+        used = [i for i in range(len(state)) if state[i] == USED]
+        self._alloc(max(self._initial, self._round(int(len(used) / LOAD_FACTOR * 2))))
+        for i in used:
+            j = self._free_slot(hashes[i])
+            self._state[j] = USED
+            self._hashes[j] = hashes[i]
+            self._keys[j] = keys[i]
+            self._values[j] = values[i]
+            self._expire[j] = expire[i]
+            self._updated[j] = updated[i]
+            self._visited[j] = visited[i]
+        self._used = self._filled = len(used)
+
+    def _delete_slot(self, i):
+        self._state[i] = DELETED
+        self._keys[i] = None
+        self._values[i] = None
+        self._used -= 1
+
+    def _set(self, key, value, expire, updated):
+        h = hash(key)
+        i = self._lookup(key, h)
+        if i < 0:
+            if self._filled + 1 > (self._mask + 1) * LOAD_FACTOR:
+                self._resize()
+            i = self._free_slot(h)
+            if self._state[i] == EMPTY:
+                self._filled += 1
+            self._state[i] = USED
+            self._hashes[i] = h
+            self._keys[i] = key
+            self._used += 1
+
+        self._values[i] = value
+        self._expire[i] = expire
+        self._updated[i] = updated
+        self._visited[i] = updated
+        if self.max_entries:
+            while self._used > self.max_entries:
+                self._evict(i)
+
+    def _evict(self, keep=-1):
+        state, visited, mask = self._state, self._visited, self._mask
+        victim = -1
+        samples = 0
+        while samples < EVICTION_SAMPLES:
+            i = random.randint(0, mask)
+            if state[i] != USED or i == keep:
+                if self._used <= 1:
+                    break
+                continue
+            samples += 1
+            if victim < 0 or visited[i] < visited[victim]:
+                victim = i
+        if victim >= 0:
+            self._delete_slot(victim)
+            self.evictions += 1
+
+    def _reap(self, steps):
+        state, expire, updated = self._state, self._expire, self._updated
+        now = time.time()
+        capacity = self._mask + 1
+        steps = capacity if steps is None else min(steps, capacity)
+        i = self._reap_cursor
+        reaped = 0
+        for n in range(steps):
+            if state[i] == USED and now - updated[i] > expire[i]:
+                self._delete_slot(i)
+                self.expirations += 1
+                reaped += 1
+            i = (i + 1) & self._mask
+        self._reap_cursor = i
+        return reaped
+
+    def configure(self, max_entries=None, max_bytes=None, segments=None):
+        if max_bytes or segments:
+            raise ValueError('compact store only supports max_entries')
+
+        with self._lock:
+            self.max_entries = max_entries
+            if max_entries:
+                while self._used > max_entries:
+                    self._evict()
+
+    def __len__(self):
+        return self._used
+
+    def __contains__(self, key):
+        return self._lookup(key, hash(key)) >= 0
+
+    def get(self, key, default=None):
+        h = hash(key)
+        with self._lock:
+            i = self._lookup(key, h)
+            if i < 0:
+                self.misses += 1
+                return default
+
+            now = time.time()
+            if now - self._updated[i] > self._expire[i]:
+                self._delete_slot(i)
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self._visited[i] = now
+            return self._values[i]
+
+    def set(self, key, value, expire):
+        with self._lock:
+            self._set(key, value, expire, time.time())
+            self._reap(REAP_STEPS)
+
+    def restore(self, obj):
+        with self._lock:
+            self._set(obj.name, obj.get_value(), obj.expire, obj.last_update_atime)
+
+    def pop(self, key):
+        with self._lock:
+            i = self._lookup(key, hash(key))
+            if i < 0:
+                return None
+            value = self._values[i]
+            self._delete_slot(i)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._alloc(self._initial)
+
+    def reap(self, steps=None):
+        with self._lock:
+            return self._reap(steps)
+
+    def items(self):
+        '''
+        snapshot of (key, DataObject) pairs
+        '''
+        with self._lock:
+            result = []
+            for i in range(self._mask + 1):
+                if self._state[i] == USED:
+                    obj = DataObject(self._keys[i], self._values[i], self._expire[i])
+                    obj.last_update_atime = self._updated[i]
+                    result.append((self._keys[i], obj))
+            return result
+
+    def stats(self):
+        capacity = self._mask + 1
+        arrays = (self._state, self._hashes, self._expire, self._updated, self._visited)
+        return {
+            'entries': self._used,
+            'capacity': capacity,
+            'table_bytes': sum(a.itemsize * capacity for a in arrays) + 2 * 8 * capacity,
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class CompactCache(ObjectCache):
+
+    """
+    ObjectCache over a CompactStore, for caches holding millions of small
+    entries where a DataObject per entry costs more than the values
+    """
+
+    def __init__(self, name=None, max_entries=None, expire=24*3600, capacity=1024):
+        super(CompactCache, self).__init__(name, expire=expire, store=CompactStore(capacity, max_entries))
@@ -0,0 +1,176 @@
+#-*- coding:utf-8 -*-
+from __future__ import absolute_import, division, print_function, with_statement
+
+import time
+import zlib
+import threading
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+# first bytes of a compressed value, followed by the one byte codec id and
+# the compressed payload. Neither pickles nor smartcache.serializers tags
+# start with \x1e, so compressed and plain values can share a keyspace.
+COMPRESSED_HEADER = b'\x1eZ'
+HEADER_SIZE = len(COMPRESSED_HEADER) + 1
+
+# values shorter than this many bytes are stored as they are
+DEFAULT_THRESHOLD = 1024
+
+
+class ZlibCodec(object):
+    id = b'z'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class LzmaCodec(object):
+    """better ratio than zlib for large text at several times the cpu time
+    """
+    id = b'x'
+
+    def __init__(self, preset=1):
+        if lzma is None:
+            raise ImportError('lzma is not available')
+        self.preset = preset
+
+    def compress(self, data):
+        return lzma.compress(data, preset=self.preset)
+
+    def decompress(self, data):
+        return lzma.decompress(data)
+
+
+# codec id -> codec able to decompress values written with it
+codecs = {ZlibCodec.id: ZlibCodec()}
+if lzma is not None:
+    codecs[LzmaCodec.id] = LzmaCodec()
+
+
+def register_codec(codec):
+    if len(codec.id) != 1:
+        raise ValueError('codec id must be one byte')
+    codecs[codec.id] = codec
+
+
+def is_compressed(data):
+    return data[:2] == COMPRESSED_HEADER
+
+
+def decompress(data):
+    """payload of a compressed value, any other value is returned as it is
+    """
+    if not is_compressed(data):
+        return data
+
+    codec = codecs.get(bytes(data[2:3]))
+    if codec is None:
+        raise ValueError('unknown compression codec %r' % data[2:3])
+    return codec.decompress(data[HEADER_SIZE:])
+
+
+class Policy(object):
+
+    __slots__ = ['codec', 'threshold']
+
+    def __init__(self, codec, threshold):
+        self.codec = codec
+        self.threshold = threshold
+
+
+class Compressor(object):
+
+    """
+    threshold based compression of serialized values for redis_cache.Cache
+
+    A value of at least threshold bytes is compressed with codec and kept
+    only when that makes it smaller. policies maps key prefixes to a
+    (codec, threshold) pair, the longest matching prefix wins and a None
+    codec stores the values of that prefix uncompressed.
+
+    ::code-block
+        cache.compressor = Compressor(policies={
+            'html:': (LzmaCodec(), 4096),
+            'counter:': (None, 0),
+        })
+    """
+
+    def __init__(self, codec=None, threshold=DEFAULT_THRESHOLD, policies=None):
+        self.default = Policy(codec or ZlibCodec(), threshold)
+        self.policies = {}
+        for prefix, (codec, threshold) in (policies or {}).items():
+            self.add_policy(prefix, codec, threshold)
+
+        self.compressed = 0
+        self.skipped = 0
+        self.decompressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compress_time = 0.0
+        self.decompress_time = 0.0
+        self._lock = threading.Lock()
+
+    def add_policy(self, prefix, codec=None, threshold=DEFAULT_THRESHOLD):
+        if codec is not None:
+            register_codec(codec)
+        self.policies[prefix] = Policy(codec, threshold)
+
+    def policy(self, name):
+        if isinstance(name, bytes) and not isinstance(name, str):
+            name = name.decode('utf-8', 'replace')
+        best = None
+        for prefix in self.policies:
+            if name.startswith(prefix) and (best is None or len(prefix) > len(best)):
+                best = prefix
+        return self.default if best is None else self.policies[best]
+
+    def compress(self, name, data):
+        policy = self.policy(name) if self.policies else self.default
+        if policy.codec is None or len(data) < policy.threshold:
+            return data
+
+        start = time.time()
+        payload = policy.codec.compress(data)
+        elapsed = time.time() - start
+        with self._lock:
+            self.compress_time += elapsed
+            if len(payload) + HEADER_SIZE >= len(data):
+                self.skipped += 1
+                return data
+            self.compressed += 1
+            self.bytes_in += len(data)
+            self.bytes_out += len(payload) + HEADER_SIZE
+        return COMPRESSED_HEADER + policy.codec.id + payload
+
+    def decompress(self, data):
+        if not is_compressed(data):
+            return data
+
+        start = time.time()
+        data = decompress(data)
+        elapsed = time.time() - start
+        with self._lock:
+            self.decompressed += 1
+            self.decompress_time += elapsed
+        return data
+
+    def stats(self):
+        return {
+            'compressed': self.compressed,
+            'skipped': self.skipped,
+            'decompressed': self.decompressed,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'ratio': self.bytes_in / self.bytes_out if self.bytes_out else 1.0,
+            'compress_time': self.compress_time,
+            'decompress_time': self.decompress_time,
+        }
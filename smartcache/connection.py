@@ -0,0 +1,102 @@
+#-*- coding:utf-8 -*-
+from __future__ import absolute_import, division, print_function, with_statement
+
+import os
+import weakref
+import threading
+
+import redis
+
+
+def pool_connection(pool):
+    """a connection of pool, redis-py < 5.3 requires a command name that
+    newer versions deprecate
+    """
+    try:
+        return pool.get_connection()
+    except TypeError:
+        return pool.get_connection('PING')
+
+
+class ConnectionManager(object):
+
+    """
+    one redis client with its own connection pool per endpoint, created on
+    first use and shared by every Cache, ShardClient and MasterSlaveClient.
+
+    Clients are dropped in a forked child so that it never reuses sockets
+    of its parent, with the methods bound to them in the dispatch table of
+    every tracked Cache.
+    """
+
+    def __init__(self, max_connections=None, **pool_kwargs):
+        self.max_connections = max_connections
+        self.pool_kwargs = pool_kwargs
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._caches = weakref.WeakSet()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def configure(self, max_connections=None, **pool_kwargs):
+        """change pool options, existing clients are disconnected
+        """
+        self.max_connections = max_connections
+        self.pool_kwargs = pool_kwargs
+        self.disconnect()
+
+    def client(self, host='localhost', port=6379, db=0):
+        if self._pid != os.getpid():
+            self._after_fork()
+
+        key = (host, port, db)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = self._create(host, port, db)
+        return client
+
+    def _create(self, host, port, db):
+        pool = redis.ConnectionPool(host=host, port=port, db=db,
+                                    max_connections=self.max_connections,
+                                    **self.pool_kwargs)
+        return redis.StrictRedis(connection_pool=pool)
+
+    def warmup(self, host='localhost', port=6379, db=0, connections=1):
+        """open connections ahead of the first commands
+        """
+        pool = self.client(host, port, db).connection_pool
+        opened = []
+        try:
+            for i in range(connections):
+                connection = pool_connection(pool)
+                connection.connect()
+                opened.append(connection)
+        finally:
+            for connection in opened:
+                pool.release(connection)
+        return len(opened)
+
+    def disconnect(self):
+        with self._lock:
+            clients, self._clients = self._clients, {}
+        for client in clients.values():
+            client.connection_pool.disconnect()
+
+    def track(self, cache):
+        """reset the dispatch table of cache with the clients after a fork
+        """
+        self._caches.add(cache)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._pid = os.getpid()
+        for cache in list(self._caches):
+            cache._reset_dispatch()
+
+
+connections = ConnectionManager()
@@ -0,0 +1,227 @@
+#-*- coding:utf-8 -*-
+from __future__ import absolute_import, division, print_function, with_statement
+
+import os
+import atexit
+import weakref
+import threading
+
+from smartcache.log import redis_cache_log
+
+# seconds between two background flushes
+FLUSH_INTERVAL = 1.0
+
+# distinct pending counters that trigger a flush from the caller
+MAX_PENDING = 1000
+
+
+class Flusher(threading.Thread):
+    '''
+    daemon thread flushing a CounterBuffer every interval seconds
+    '''
+
+    def __init__(self, buffer, interval):
+        super(Flusher, self).__init__(name='smartcache-counters')
+        self.daemon = True
+        # weak, the thread ends once the buffer is garbage collected
+        self.buffer = weakref.ref(buffer)
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            buffer = self.buffer()
+            if buffer is None:
+                return
+            try:
+                buffer.flush()
+            except Exception as e:
+                redis_cache_log.exception(e)
+            del buffer
+
+    def stop(self):
+        self._stopped.set()
+
+
+class CounterBuffer(object):
+
+    """
+    write-behind buffer for inc, hinc and inc_score. Deltas are summed per
+    counter in process and sent in one pipeline per node every interval
+    seconds, or as soon as max_pending distinct counters are waiting. The
+    buffer is also flushed at exit and in the parent before a fork; a
+    forked child starts empty.
+
+    Buffered calls return None, the new value is only known after a flush.
+    Deltas of a failed round trip are kept for the next flush.
+
+    ::code-block
+        counters = CounterBuffer(cache)
+        counters.inc('pv:home')
+        counters.hinc('pv', 'home')
+
+        cache.counters = counters    # cache.inc goes through the buffer
+    """
+
+    def __init__(self, cache, interval=FLUSH_INTERVAL, max_pending=MAX_PENDING):
+        self.cache = cache
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._pid = os.getpid()
+
+        self.added = 0
+        self.sent = 0
+        self.flushes = 0
+        self.errors = 0
+
+        _buffers.add(self)
+
+    def inc(self, key, amount=1):
+        self._add(('inc', _name(key)), amount)
+
+    def hinc(self, name, key, amount=1):
+        self._add(('hinc', _name(name), str(key)), amount)
+
+    def inc_score(self, name, value, amount=1):
+        """value must be hashable, it is serialized at flush time
+        """
+        self._add(('inc_score', _name(name), value), amount)
+
+    def _add(self, counter, amount):
+        if self._pid != os.getpid():
+            self._after_fork()
+        if self._flusher is None and self.interval:
+            self._start()
+
+        with self._lock:
+            self._pending[counter] = self._pending.get(counter, 0) + amount
+            self.added += 1
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self.flush()
+
+    def _start(self):
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = Flusher(self, self.interval)
+                self._flusher.start()
+
+    def flush(self):
+        """send the pending deltas
+        :returns number of commands sent
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        pending = dict((counter, amount) for counter, amount in pending.items() if amount)
+        if not pending:
+            return 0
+
+        sent = 0
+        try:
+            for cache, counters in self._groups(pending):
+                p = cache.pipeline()
+                # the pipeline may also queue invalidation messages, only
+                # the increments are counted
+                results = [getattr(p, counter[0])(*(counter[1:] + (pending[counter],)))
+                           for counter in counters]
+                p.execute()
+                for counter in counters:
+                    del pending[counter]
+                sent += len(results)
+
+                errors = [_error(result) for result in results]
+                errors = [error for error in errors if error is not None]
+                with self._lock:
+                    self.sent += len(results)
+                    self.errors += len(errors)
+                for error in errors:
+                    redis_cache_log.error('counter flush failed: %s', error)
+        except Exception:
+            # keep the deltas of the nodes that were not reached
+            self._restore(pending)
+            raise
+        finally:
+            with self._lock:
+                self.flushes += 1
+        return sent
+
+    def _groups(self, pending):
+        # ShardCache pipelines are per node, MasterSlaveCache writes to the master
+        node_caches = getattr(type(self.cache), '_node_caches', None)
+        if node_caches is None:
+            return [(self.cache, list(pending))]
+
+        by_name = {}
+        for counter in pending:
+            by_name.setdefault(counter[1], []).append(counter)
+        return [(cache, [counter for name in names for counter in by_name[name]])
+                for cache, names in node_caches(self.cache, list(by_name))]
+
+    def _restore(self, pending):
+        with self._lock:
+            for counter, amount in pending.items():
+                self._pending[counter] = self._pending.get(counter, 0) + amount
+
+    def _after_fork(self):
+        # the parent flushed before forking, its flusher thread is gone
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flusher = None
+        self._pid = os.getpid()
+
+    def close(self):
+        """stop the flusher thread and send the pending deltas
+        """
+        if self._flusher is not None:
+            self._flusher.stop()
+            self._flusher = None
+        return self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'added': self.added,
+                'sent': self.sent,
+                'coalesced': self.added - self.sent - len(self._pending),
+                'pending': len(self._pending),
+                'flushes': self.flushes,
+                'errors': self.errors,
+            }
+
+
+# live buffers, flushed at exit and before a fork by the hooks below
+_buffers = weakref.WeakSet()
+
+
+def _flush_all():
+    for buffer in list(_buffers):
+        try:
+            buffer.flush()
+        except Exception as e:
+            redis_cache_log.error('counter flush failed: %s', e)
+
+
+def _after_fork_all():
+    for buffer in list(_buffers):
+        buffer._after_fork()
+
+
+atexit.register(_flush_all)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_flush_all, after_in_child=_after_fork_all)
+
+
+def _name(name):
+    if isinstance(name, (str, bytes)):
+        return name
+    return str(name)
+
+
+def _error(deferred):
+    try:
+        deferred.value
+    except Exception as e:
+        return e
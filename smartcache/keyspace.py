@@ -0,0 +1,177 @@
+#-*- coding:utf-8 -*-
+from __future__ import absolute_import, division, print_function, with_statement
+
+import re
+from collections import namedtuple
+
+try:
+    text_type = unicode
+except NameError:
+    text_type = str
+
+SEPARATOR = b':'
+
+# bytes escaped in str and bytes fields so that keys stay reversible and
+# only the hash tag section holds braces
+_SPECIAL = re.compile(b'[%:{}]')
+_ESCAPED = re.compile(b'%([0-9A-F]{2})')
+
+
+def _escape(data):
+    if _SPECIAL.search(data) is None:
+        return data
+    return _SPECIAL.sub(lambda m: ('%%%02X' % ord(m.group())).encode('ascii'), data)
+
+
+def _unescape(data):
+    if b'%' not in data:
+        return data
+    return _ESCAPED.sub(lambda m: bytes(bytearray([int(m.group(1), 16)])), data)
+
+
+# field type -> (encoder, decoder)
+CODECS = {
+    int: (lambda v: str(int(v)).encode('ascii'), int),
+    text_type: (lambda v: _escape(v.encode('utf-8')), lambda b: _unescape(b).decode('utf-8')),
+    bytes: (_escape, _unescape),
+}
+
+
+class Key(bytes):
+
+    """
+    key encoded by a KeySpace, plain bytes for redis. Every KeySpace has its
+    own subclass whose space attribute gives the fields, tag and ttl back.
+    """
+
+    __slots__ = ()
+    space = None
+
+    def __add__(self, other):
+        # name + ':lock' and the other suffixes of redis_cache
+        if isinstance(other, text_type):
+            other = other.encode('utf-8')
+        return bytes.__add__(self, other)
+
+    @property
+    def ttl(self):
+        return self.space.ttl
+
+    @property
+    def tag(self):
+        """content of the hash tag section, None without one
+        """
+        if not self.space.hash_tag:
+            return None
+        start = self.find(b'{')
+        return self[start + 1:self.find(b'}', start)]
+
+    def fields(self):
+        return self.space.parse(self)
+
+
+def routing_key(key):
+    """what ShardCache hashes to pick the node of key: the hash tag of a
+    tagged Key, so the keys sharing a tag live on one node
+    """
+    if isinstance(key, Key):
+        tag = key.tag
+        return (key if tag is None else tag).decode('utf-8', 'replace')
+    return str(key)
+
+
+def suffixed(name, suffix):
+    """name + suffix, as bytes when name is bytes: the name of a lock, stale
+    copy or chunk derived from a redis key
+    """
+    if isinstance(name, bytes) and not isinstance(suffix, bytes):
+        suffix = suffix.encode('utf-8')
+    return name + suffix
+
+
+class KeySpace(object):
+
+    """
+    prefix plus typed fields, compiled once into a bytes encoder and its
+    reverse. Fields are int, str or bytes; str and bytes values are escaped
+    so any value round-trips.
+
+    hash_tag names a run of consecutive fields written inside {} so that
+    redis cluster and ShardCache keep keys sharing them on one node. ttl is
+    the default expire of the values set under the keys.
+
+    ::code-block
+        profiles = KeySpace('profile', [('user_id', int), ('part', str)], hash_tag=['user_id'], ttl=3600)
+        key = profiles(42, 'avatar')    # b'profile:{42}:avatar'
+        profiles.parse(key)             # Fields(user_id=42, part='avatar')
+        cache.set(key, data)            # expires in 3600s
+    """
+
+    def __init__(self, prefix, fields, hash_tag=(), ttl=None):
+        if _SPECIAL.search(prefix.encode('utf-8')):
+            raise ValueError('prefix %r must not contain %%, :, { or }' % prefix)
+
+        self.prefix = prefix
+        self.names = [name for name, ftype in fields]
+        self.types = [ftype for name, ftype in fields]
+        self.hash_tag = list(hash_tag)
+        self.ttl = ttl
+        for ftype in self.types:
+            if ftype not in CODECS:
+                raise TypeError('%s fields are not supported' % ftype)
+
+        self._encoders = [CODECS[ftype][0] for ftype in self.types]
+        self._decoders = [CODECS[ftype][1] for ftype in self.types]
+        self._head = prefix.encode('utf-8') + SEPARATOR
+        self._tag = None
+        if self.hash_tag:
+            start = self.names.index(self.hash_tag[0])
+            if self.names[start:start + len(self.hash_tag)] != self.hash_tag:
+                raise ValueError('hash_tag fields must be consecutive')
+            self._tag = (start, start + len(self.hash_tag) - 1)
+
+        self.Fields = namedtuple('Fields', self.names)
+        self.Key = type('Key', (Key,), {'__slots__': (), 'space': self})
+
+    def __call__(self, *values):
+        """the Key of values, in field order
+        """
+        if len(values) != len(self._encoders):
+            raise TypeError('%s takes %d fields' % (self.prefix, len(self._encoders)))
+
+        parts = [encode(value) for encode, value in zip(self._encoders, values)]
+        if self._tag is not None:
+            first, last = self._tag
+            parts[first] = b'{' + parts[first]
+            parts[last] = parts[last] + b'}'
+        return self.Key(self._head + SEPARATOR.join(parts))
+
+    def key(self, **values):
+        return self(*[values[name] for name in self.names])
+
+    def __contains__(self, key):
+        return isinstance(key, bytes) and key.startswith(self._head)
+
+    def parse(self, key):
+        """Fields of a key of this space
+        """
+        if isinstance(key, text_type):
+            key = key.encode('utf-8')
+        if not key.startswith(self._head):
+            raise ValueError('%r is not a %s key' % (key, self.prefix))
+
+        body = key[len(self._head):]
+        if self._tag is not None:
+            body = body.replace(b'{', b'').replace(b'}', b'')
+        parts = body.split(SEPARATOR)
+        if len(parts) != len(self._decoders):
+            raise ValueError('%r does not have %d fields' % (key, len(self._decoders)))
+        return self.Fields(*[decode(part) for decode, part in zip(self._decoders, parts)])
+
+    def pattern(self):
+        """SCAN MATCH pattern of every key of this space
+        """
+        return self.prefix + ':*'
+
+    def __repr__(self):
+        return '<KeySpace %s:%s>' % (self.prefix, ':'.join(self.names))
@@ -0,0 +1,132 @@
+#-*- coding:utf-8 -*-
+from __future__ import absolute_import, division, print_function, with_statement
+
+import threading
+
+from smartcache.log import redis_cache_log
+from smartcache.object_cache import ObjectCache
+from smartcache.redis_cache import Cache
+
+INVALIDATION_CHANNEL = 'smartcache:invalidate'
+
+_missing = object()
+
+# invalidation counters, a get only fills the local copy when the counter
+# of its key did not move during the redis read
+GENERATION_STRIPES = 64
+
+
+def local_key(name):
+    """key of the local copy, the text form redis publishes on invalidation
+    """
+    if isinstance(name, bytes) and not isinstance(name, str):
+        return name.decode('utf-8')
+    return str(name)
+
+
+class NearCache(object):
+
+    """
+    two tier cache, reads are served from an in-process ObjectCache and fall
+    through to redis on a miss. Writes and deletes go to redis, which
+    publishes the name on the invalidation channel so that every NearCache
+    listening on it drops its local copy.
+
+    Invalidations missed while the subscriber is disconnected are bounded by
+    the local expire.
+
+    Cache.set, set_many, get_or_set, delete, delete_many, inc, append,
+    rename, set_large and delete_large publish on the channel. expire, hash,
+    list and set commands do not: they leave get values untouched or are not
+    read through get, a local copy of such a key lives until the local expire.
+
+    ::code-block
+        nc = NearCache(Cache(), expire=30)
+        nc.set('config', {'feature': True})
+        nc.get('config')
+    """
+
+    def __init__(self, cache=None, local=None, channel=INVALIDATION_CHANNEL,
+                 expire=60, max_entries=10000, listen=True):
+        self.cache = cache if cache is not None else Cache()
+        self.cache.invalidation_channel = channel
+        self.local = local if local is not None else ObjectCache(max_entries=max_entries, expire=expire)
+        self.channel = channel
+        self._pubsub = None
+        self._listener = None
+        self._generations = [0] * GENERATION_STRIPES
+        self._lock = threading.Lock()
+        if listen:
+            self.start()
+
+    def start(self, sleep_time=0.01):
+        """subscribe to the invalidation channel in a daemon thread
+        """
+        if self._listener is not None:
+            return
+
+        self._pubsub = self.cache.master_connection().pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.channel: self._on_message})
+        self._listener = self._pubsub.run_in_thread(sleep_time=sleep_time, daemon=True)
+
+    def stop(self):
+        if self._listener is None:
+            return
+
+        self._listener.stop()
+        self._pubsub.close()
+        self._listener = self._pubsub = None
+
+    def _on_message(self, message):
+        try:
+            self.invalidate(message['data'])
+        except Exception as e:
+            redis_cache_log.exception(e)
+
+    def get(self, name):
+        key = local_key(name)
+        value = self.local.get(key, _missing)
+        if value is _missing:
+            stripe = hash(key) % GENERATION_STRIPES
+            generation = self._generations[stripe]
+            value = self.cache.get(name)
+            if value is not None:
+                with self._lock:
+                    # an invalidation that arrived during the read may be
+                    # about the value just read
+                    if self._generations[stripe] == generation:
+                        self.local.set(key, value)
+        return value
+
+    def set(self, name, value):
+        # the local copy is refilled by the next get, filling it here could
+        # race with an older invalidation still in flight
+        self.cache.set(name, value)
+        self.invalidate(name)
+
+    def delete(self, name):
+        result = self.cache.delete(name)
+        self.invalidate(name)
+        return result
+
+    def inc(self, name, amount=1):
+        result = self.cache.inc(name, amount)
+        self.invalidate(name)
+        return result
+
+    def exists(self, name):
+        return local_key(name) in self.local or self.cache.exists(name)
+
+    def __contains__(self, item):
+        return self.exists(item)
+
+    def invalidate(self, name):
+        """drop the local copy only
+        """
+        key = local_key(name)
+        with self._lock:
+            self._generations[hash(key) % GENERATION_STRIPES] += 1
+            self.local.delete(key)
+
+    def stats(self):
+        return self.local.stats()
@@ -1,14 +1,63 @@
 #-*- conding:utf-8-*-
 from __future__ import absolute_import, division, print_function, with_statement
 
+import os
+import sys
 import time
+import mmap
+import heapq
+import struct
+import atexit
+import weakref
+import itertools
+import functools
+import threading
+from collections import OrderedDict
+
+try:
+    import cPickle as pickle
+except Exception as e:
+    import pickle
+
+from smartcache.log import object_cache_log
+from smartcache.refresh import Envelope, make_envelope, should_refresh, refresher
+
+# expired entries reclaimed from the expiry heap on every write
+REAP_STEPS = 8
+
+# snapshot file: magic, record count, then per record expire,
+# last_update_atime, key and value lengths followed by both pickles
+SNAPSHOT_MAGIC = b'SCSNAP01'
+SNAPSHOT_HEADER = struct.Struct('<8sI')
+SNAPSHOT_RECORD = struct.Struct('<ddII')
+
+
+if hasattr(OrderedDict, 'move_to_end'):
+    def move_to_end(data, key):
+        data.move_to_end(key)
+else:
+    def move_to_end(data, key):
+        # python 2 OrderedDict has no move_to_end
+        data[key] = data.pop(key)
+
+
+def sizeof(obj):
+    '''
+    approximate bytes used by obj, container items are counted one level deep
+    '''
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(sys.getsizeof(i) for i in obj)
+    return size
 
 
 class DataObject(object):
     '''
     object cahced by app
     '''
-    __slots__ = ['name', 'expire', '_value', 'last_visit_atime', 'last_update_atime']
+    __slots__ = ['name', 'expire', '_value', 'last_visit_atime', 'last_update_atime', 'size']
 
     def __init__(self, name, value=None, expire=24*3600):
         self.name = name
@@ -16,6 +65,7 @@ class DataObject(object):
         self.last_visit_atime = time.time()
         self.last_update_atime = time.time()
         self._value = value
+        self.size = 0
 
     def is_expired(self):
         return time.time() - self.last_update_atime > self.expire
@@ -29,8 +79,640 @@ class DataObject(object):
         return self._value
 
 
+class LazyDataObject(DataObject):
+    '''
+    DataObject restored from a snapshot, the value is unpickled on first read
+    '''
+    __slots__ = ['_raw']
+
+    def __init__(self, name, raw, expire, last_update_atime):
+        DataObject.__init__(self, name, None, expire)
+        self.last_update_atime = last_update_atime
+        self._raw = raw
+
+    def set_value(self, value):
+        self._raw = None
+        DataObject.set_value(self, value)
+
+    def get_value(self):
+        if self._raw is not None:
+            self._value = pickle.loads(self._raw)
+            self._raw = None
+        return DataObject.get_value(self)
+
+
+class LRUStore(object):
+    '''
+    DataObject store kept in visit order, the least recently visited
+    entries are evicted once max_entries or max_bytes is exceeded.
+
+    Deadlines are also pushed on a min-heap so that expired entries which
+    are never read again are reclaimed a few at a time by reap.
+    '''
+
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._heap = []
+        self._counter = itertools.count()
+
+    def configure(self, max_entries=None, max_bytes=None):
+        with self._lock:
+            if max_entries is None:
+                max_entries = self.max_entries
+            if max_bytes is None:
+                max_bytes = self.max_bytes
+            if max_bytes and not self.max_bytes:
+                self.nbytes = 0
+                for obj in self._data.values():
+                    obj.size = sizeof(obj.name) + sizeof(obj._value)
+                    self.nbytes += obj.size
+
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            obj = self._data.get(key)
+            if obj is None:
+                self.misses += 1
+                return default
+
+            if obj.is_expired():
+                self.misses += 1
+                self.expirations += 1
+                self._pop(key)
+                return default
+
+            self.hits += 1
+            move_to_end(self._data, key)
+            return obj.get_value()
+
+    def set(self, key, value, expire):
+        size = sizeof(key) + sizeof(value) if self.max_bytes else 0
+        with self._lock:
+            obj = self._data.get(key)
+            if obj is None:
+                obj = self._data[key] = DataObject(key, value, expire)
+            else:
+                self.nbytes -= obj.size
+                obj.expire = expire
+                obj.set_value(value)
+                move_to_end(self._data, key)
+
+            obj.size = size
+            self.nbytes += size
+            heapq.heappush(self._heap, (obj.last_update_atime + expire, next(self._counter), key))
+            self._evict()
+            self._reap(REAP_STEPS)
+
+    def pop(self, key):
+        with self._lock:
+            return self._pop(key)
+
+    def _pop(self, key):
+        obj = self._data.pop(key, None)
+        if obj is not None:
+            self.nbytes -= obj.size
+        return obj
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._heap = []
+            self.nbytes = 0
+
+    def reap(self, steps=None):
+        '''
+        remove at most steps expired entries, all of them when steps is None
+        '''
+        with self._lock:
+            return self._reap(steps)
+
+    def _reap(self, steps):
+        heap, data = self._heap, self._data
+        now = time.time()
+        reaped = 0
+        while heap and heap[0][0] < now and (steps is None or steps > 0):
+            key = heapq.heappop(heap)[2]
+            if steps is not None:
+                steps -= 1
+            obj = data.get(key)
+            # the key may have been deleted or rewritten since it was pushed
+            if obj is not None and obj.is_expired():
+                self._pop(key)
+                self.expirations += 1
+                reaped += 1
+
+        if len(heap) > 2 * len(data) + 64:
+            self._heap = [(obj.last_update_atime + obj.expire, next(self._counter), key)
+                          for key, obj in data.items()]
+            heapq.heapify(self._heap)
+
+        return reaped
+
+    def restore(self, obj):
+        '''
+        insert a DataObject keeping its own timestamps
+        '''
+        value = getattr(obj, '_raw', None) or obj._value
+        size = sizeof(obj.name) + sizeof(value) if self.max_bytes else 0
+        with self._lock:
+            self._pop(obj.name)
+            obj.size = size
+            self.nbytes += size
+            self._data[obj.name] = obj
+            heapq.heappush(self._heap, (obj.last_update_atime + obj.expire, next(self._counter), obj.name))
+            self._evict()
+
+    def items(self):
+        '''
+        snapshot of (key, DataObject) pairs from least to most recently visited
+        '''
+        with self._lock:
+            return list(self._data.items())
+
+    def _evict(self):
+        data = self._data
+        while data and ((self.max_entries and len(data) > self.max_entries) or
+                        (self.max_bytes and self.nbytes > self.max_bytes)):
+            key, obj = data.popitem(last=False)
+            self.nbytes -= obj.size
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            'entries': len(self._data),
+            'bytes': self.nbytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class StripedStore(object):
+    '''
+    LRUStore split into lock-striped segments by key hash, threads working
+    on keys of different segments never wait on the same lock
+    '''
+
+    def __init__(self, segments=1, max_entries=None, max_bytes=None):
+        self._segments = [LRUStore() for i in range(segments)]
+        self.max_entries = None
+        self.max_bytes = None
+        self.configure(max_entries, max_bytes)
+
+    @property
+    def segments(self):
+        return len(self._segments)
+
+    def configure(self, max_entries=None, max_bytes=None, segments=None):
+        if segments and segments != len(self._segments):
+            # entries go through restore so that each new segment takes its
+            # lock and pushes their deadlines on its expiry heap
+            resized = [LRUStore() for i in range(segments)]
+            for store in self._segments:
+                for key, obj in store.items():
+                    resized[hash(key) % segments].restore(obj)
+            self._segments = resized
+
+        if max_entries is None:
+            max_entries = self.max_entries
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        count = len(self._segments)
+        for store in self._segments:
+            # limits are split evenly, rounding up so that a single
+            # segment keeps the exact limit
+            store.configure(max_entries and -(-max_entries // count),
+                            max_bytes and -(-max_bytes // count))
+
+    def segment(self, key):
+        segments = self._segments
+        if len(segments) == 1:
+            return segments[0]
+        return segments[hash(key) % len(segments)]
+
+    def __len__(self):
+        return sum(len(store) for store in self._segments)
+
+    def __contains__(self, key):
+        return key in self.segment(key)
+
+    def get(self, key, default=None):
+        return self.segment(key).get(key, default)
+
+    def set(self, key, value, expire):
+        self.segment(key).set(key, value, expire)
+
+    def pop(self, key):
+        return self.segment(key).pop(key)
+
+    def clear(self):
+        for store in self._segments:
+            store.clear()
+
+    def reap(self, steps=None):
+        return sum(store.reap(steps) for store in self._segments)
+
+    def restore(self, obj):
+        self.segment(obj.name).restore(obj)
+
+    def items(self):
+        return [item for store in self._segments for item in store.items()]
+
+    def stats(self):
+        result = {
+            'segments': len(self._segments),
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+        }
+        for store in self._segments:
+            for k, v in store.stats().items():
+                if not k.startswith('max_'):
+                    result[k] = result.get(k, 0) + v
+        return result
+
+
+class Reaper(threading.Thread):
+    '''
+    daemon thread reclaiming expired entries of a store every interval seconds
+    '''
+
+    def __init__(self, store, interval=1.0, steps=1000):
+        super(Reaper, self).__init__(name='smartcache-reaper')
+        self.daemon = True
+        self.store = store
+        self.interval = interval
+        self.steps = steps
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.store.reap(self.steps)
+            except Exception as e:
+                object_cache_log.exception(e)
+
+    def stop(self):
+        self._stopped.set()
+
+
+class ObjectCache(object):
+    '''
+    cache instance with its own store, limits, default expire and stats,
+    named instances are kept in the registry, see get_cache
+    '''
+
+    def __init__(self, name=None, max_entries=None, max_bytes=None, expire=24*3600, segments=1, store=None):
+        self.name = name
+        self.expire = expire
+        if store is None:
+            store = StripedStore(segments, max_entries, max_bytes)
+        self._store = store
+        self._reaper = None
+        if name is not None:
+            register_cache(self)
+
+    @staticmethod
+    def pack(*args):
+        return '_'.join(map(str, args))
+
+    @staticmethod
+    def unpack(key):
+        return tuple(key.split('_'))
+
+    def configure(self, max_entries=None, max_bytes=None, segments=None):
+        '''
+        bound the cache, max_bytes is an approximate budget of key and value sizes,
+        segments splits the store into independently locked parts for threaded use.
+        arguments left to None keep their current value, 0 removes a limit
+        '''
+        self._store.configure(max_entries, max_bytes, segments)
+
+    def stats(self):
+        result = self._store.stats()
+        result['name'] = self.name
+        result['expire'] = self.expire
+        return result
+
+    def clear(self):
+        self._store.clear()
+
+    def reap(self, steps=None):
+        '''
+        remove expired entries without waiting for them to be read
+        '''
+        return self._store.reap(steps)
+
+    def start_reaper(self, interval=1.0, steps=1000):
+        if self._reaper is None:
+            self._reaper = Reaper(self._store, interval, steps)
+            self._reaper.start()
+
+    def stop_reaper(self):
+        if self._reaper is not None:
+            self._reaper.stop()
+            self._reaper = None
+
+    def set(self, key, value, expire=None):
+        self._store.set(key, value, self.expire if expire is None else expire)
+
+    def dump(self, path):
+        '''
+        write live entries to a snapshot file, replaced atomically
+        :returns number of entries written
+        '''
+        now = time.time()
+        count = 0
+        tmp = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, 0))
+            for key, obj in self._store.items():
+                if now - obj.last_update_atime > obj.expire:
+                    continue
+                try:
+                    kb = pickle.dumps(key, pickle.HIGHEST_PROTOCOL)
+                    vb = getattr(obj, '_raw', None) or pickle.dumps(obj._value, pickle.HIGHEST_PROTOCOL)
+                except Exception as e:
+                    object_cache_log.warning('skip %r in snapshot: %s', key, e)
+                    continue
+                f.write(SNAPSHOT_RECORD.pack(obj.expire, obj.last_update_atime, len(kb), len(vb)))
+                f.write(kb)
+                f.write(vb)
+                count += 1
+            f.seek(0)
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, count))
+        os.rename(tmp, path)
+        return count
+
+    def load(self, path):
+        '''
+        restore entries from a snapshot file, expired records are skipped
+        without being decoded and values are unpickled on first read
+        :returns number of entries restored
+        '''
+        if not os.path.exists(path) or os.path.getsize(path) < SNAPSHOT_HEADER.size:
+            return 0
+
+        now = time.time()
+        restored = 0
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                magic, count = SNAPSHOT_HEADER.unpack_from(mm, 0)
+                if magic != SNAPSHOT_MAGIC:
+                    raise ValueError('%s is not an object cache snapshot' % path)
+
+                off = SNAPSHOT_HEADER.size
+                for i in range(count):
+                    expire, updated, klen, vlen = SNAPSHOT_RECORD.unpack_from(mm, off)
+                    off += SNAPSHOT_RECORD.size
+                    if now - updated <= expire:
+                        key = pickle.loads(mm[off:off + klen])
+                        self._restore(LazyDataObject(key, mm[off + klen:off + klen + vlen], expire, updated))
+                        restored += 1
+                    off += klen + vlen
+            finally:
+                mm.close()
+        return restored
+
+    def _restore(self, obj):
+        restore = getattr(self._store, 'restore', None)
+        if restore is not None:
+            restore(obj)
+        else:
+            remaining = obj.expire - (time.time() - obj.last_update_atime)
+            self._store.set(obj.name, obj.get_value(), remaining)
+
+    def dump_at_exit(self, path):
+        '''
+        load the snapshot at path now and write it back when the process exits
+        '''
+        atexit.register(self.dump, path)
+        return self.load(path)
+
+    def get(self, key, default=None):
+        value = self._store.get(key, default)
+        if value.__class__ is Envelope:
+            return value.value
+        return value
+
+    def get_or_set(self, key, loader, expire=None, soft_expire=None, beta=1.0):
+        '''
+        get key, calling loader() to fill it on a miss. Past soft_expire the
+        cached value is still returned while loader() runs in the background,
+        XFetch spreads those refreshes ahead of the deadline. The value is
+        dropped after expire like any other entry.
+        '''
+        expire = self.expire if expire is None else expire
+        if soft_expire is None:
+            soft_expire = expire
+
+        envelope = self._store.get(key)
+        if envelope.__class__ is not Envelope:
+            envelope = make_envelope(loader, soft_expire)
+            self._store.set(key, envelope, expire)
+        elif should_refresh(envelope, beta):
+            refresher.submit((id(self), key),
+                             lambda: self._store.set(key, make_envelope(loader, soft_expire), expire))
+
+        return envelope.value
+
+    def __contains__(self, item):
+        return item in self._store
+
+    def __len__(self):
+        return len(self._store)
+
+    def exists(self, name):
+        return name in self._store
+
+    def delete(self, name):
+        self._store.pop(name)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+# caches of memoize, owned by their Memoized wrapper: an entry goes away
+# with the decorated function
+_memoized_caches = weakref.WeakValueDictionary()
+_memoized_ids = itertools.count(2)
+
+
+def register_cache(cache):
+    with _caches_lock:
+        if cache.name in _caches:
+            raise ValueError('object cache %s already exists' % cache.name)
+        _caches[cache.name] = cache
+
+
+def register_memoized(cache):
+    '''
+    register a memoize cache weakly, a #n suffix is added to a taken name
+    '''
+    with _caches_lock:
+        if cache.name in _caches or cache.name in _memoized_caches:
+            cache.name = '%s#%s' % (cache.name, next(_memoized_ids))
+        _memoized_caches[cache.name] = cache
+
+
+def remove_cache(name):
+    with _caches_lock:
+        cache = _caches.pop(name, None)
+        if cache is None:
+            cache = _memoized_caches.pop(name, None)
+    if cache is not None:
+        cache.stop_reaper()
+    return cache
+
+
+def get_cache(name, **options):
+    '''
+    return the registered cache called name, creating it with options if needed
+    '''
+    with _caches_lock:
+        cache = _caches.get(name)
+    if cache is None:
+        try:
+            cache = ObjectCache(name, **options)
+        except ValueError:
+            # created by another thread meanwhile
+            cache = _caches[name]
+    return cache
+
+
+def caches():
+    with _caches_lock:
+        result = dict(_memoized_caches.items())
+        result.update(_caches)
+        return result
+
+
+def cache_stats():
+    return dict((name, cache.stats()) for name, cache in caches().items())
+
+
+_kwd_mark = (object(),)
+_fast_types = frozenset([int, float, str, bytes, type(None)])
+_missing = object()
+
+
+def make_key(args, kwargs):
+    '''
+    hashable key for a call, a single scalar argument is used as is
+    '''
+    if kwargs:
+        return args + _kwd_mark + tuple(sorted(kwargs.items()))
+    if len(args) == 1 and type(args[0]) in _fast_types:
+        return args[0]
+    return args
+
+
+class Memoized(object):
+    '''
+    function wrapper returned by memoize
+    '''
+
+    def __init__(self, func, cache):
+        self.func = func
+        self.cache = cache
+        functools.update_wrapper(self, func)
+
+    def __call__(self, *args, **kwargs):
+        key = make_key(args, kwargs)
+        value = self.cache.get(key, _missing)
+        if value is _missing:
+            value = self.func(*args, **kwargs)
+            self.cache.set(key, value)
+        return value
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return BoundMemoized(self, obj)
+
+    def invalidate(self, *args, **kwargs):
+        '''
+        drop the cached result for these call arguments
+        '''
+        self.cache.delete(make_key(args, kwargs))
+
+    def cache_clear(self):
+        self.cache.clear()
+
+    def cache_info(self):
+        return self.cache.stats()
+
+
+class BoundMemoized(object):
+    '''
+    Memoized method bound to an instance, the instance is part of the key
+    '''
+    __slots__ = ['memoized', 'obj']
+
+    def __init__(self, memoized, obj):
+        self.memoized = memoized
+        self.obj = obj
+
+    def __call__(self, *args, **kwargs):
+        return self.memoized(self.obj, *args, **kwargs)
+
+    def invalidate(self, *args, **kwargs):
+        self.memoized.invalidate(self.obj, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.memoized, name)
+
+
+def memoize(ttl=None, maxsize=None, name=None):
+    '''
+    cache results of a function in its own ObjectCache, listed by caches()
+    while the function is alive. ttl None keeps results until they are
+    evicted or invalidated
+
+    ::code-block
+        @memoize(ttl=60, maxsize=1000)
+        def user_profile(user_id, fields=None):
+            ...
+
+        user_profile.invalidate(1)
+        user_profile.cache_info()['hits']
+    '''
+    def decorator(func):
+        cache = ObjectCache(max_entries=maxsize, expire=float('inf') if ttl is None else ttl)
+        cache.name = name or '%s.%s' % (func.__module__, getattr(func, '__qualname__', func.__name__))
+        register_memoized(cache)
+        return Memoized(func, cache)
+
+    return decorator
+
+
 class Cache(object):
-    __data = {}
+    '''
+    static api over the default ObjectCache instance
+    '''
+    default = get_cache('default')
 
     @staticmethod
     def pack(*args):
@@ -40,37 +722,59 @@ class Cache(object):
     def unpack(key):
         return tuple(key.split('_'))
 
+    @staticmethod
+    def configure(max_entries=None, max_bytes=None, segments=None):
+        Cache.default.configure(max_entries, max_bytes, segments)
+
+    @staticmethod
+    def stats():
+        return Cache.default.stats()
+
+    @staticmethod
+    def clear():
+        Cache.default.clear()
+
+    @staticmethod
+    def reap(steps=None):
+        return Cache.default.reap(steps)
+
+    @staticmethod
+    def start_reaper(interval=1.0, steps=1000):
+        Cache.default.start_reaper(interval, steps)
+
+    @staticmethod
+    def stop_reaper():
+        Cache.default.stop_reaper()
+
     @staticmethod
     def set(key, value, expire=24*3600):
         if not hash(key):
             raise ValueError('%s is not hashable' % key)
 
-        if key not in Cache.__data:
-            Cache.__data[key] = DataObject(key, value, expire)
-
-        Cache.__data[key].set_value(value)
+        Cache.default.set(key, value, expire)
 
     @staticmethod
     def get(key):
-        if key not in Cache.__data:
-            return None
+        return Cache.default.get(key)
 
-        if Cache.__data[key].is_expired():
-            del Cache.__data[key]
-            return None
+    @staticmethod
+    def dump(path):
+        return Cache.default.dump(path)
 
-        return Cache.__data[key].get_value()
+    @staticmethod
+    def load(path):
+        return Cache.default.load(path)
 
     def __contains__(self, item):
-        return item and item in Cache.__data
+        return item and item in Cache.default
 
     @staticmethod
     def exists(name):
-        return name and name in Cache.__data
+        return name and name in Cache.default
 
     @staticmethod
     def delete(name):
-        Cache.__data.pop(name, None)
+        Cache.default.delete(name)
 
 if __name__ == '__main__':
     import time
@@ -0,0 +1,199 @@
+#-*- coding:utf-8 -*-
+from __future__ import absolute_import, division, print_function, with_statement
+
+from smartcache.redis_cache import Cache
+from smartcache.scripts import scripts
+
+
+class PipelineNotExecuted(Exception):
+    pass
+
+
+class Deferred(object):
+
+    """
+    result of a command queued in a PipelineCache, value is available once
+    the pipeline has been executed
+    """
+
+    __slots__ = ['_value', '_error', '_done', '_children']
+
+    def __init__(self):
+        self._value = None
+        self._error = None
+        self._done = False
+        self._children = []
+
+    def then(self, callback):
+        """deferred result of callback(value)
+        """
+        child = Deferred()
+        if self._done:
+            child._settle(self, callback)
+        else:
+            self._children.append((child, callback))
+        return child
+
+    def resolve(self, value):
+        if isinstance(value, Exception):
+            self._error = value
+        else:
+            self._value = value
+        self._done = True
+        for child, callback in self._children:
+            child._settle(self, callback)
+        self._children = []
+
+    def _settle(self, parent, callback):
+        if parent._error is not None:
+            self.resolve(parent._error)
+            return
+        try:
+            self.resolve(callback(parent._value))
+        except Exception as e:
+            self.resolve(e)
+
+    @property
+    def done(self):
+        return self._done
+
+    @property
+    def value(self):
+        if not self._done:
+            raise PipelineNotExecuted('pipeline has not been executed')
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def __repr__(self):
+        if not self._done:
+            return '<Deferred pending>'
+        return '<Deferred %r>' % (self._error or self._value,)
+
+
+class PipelineCache(Cache):
+
+    """
+    Cache whose high-level methods queue their commands on one redis
+    pipeline and return Deferred results, decoded with the dumps and loads
+    of the wrapped cache. Leaving the with block executes the pipeline.
+
+    Reads are sent to the master with the rest of the queue. Methods that
+    need a reply before sending their next command are not available.
+    """
+
+    def __init__(self, cache):
+        self._cache = cache
+        self._pipe = cache.master_connection().pipeline(transaction=False)
+        self._queued = []
+        self.invalidation_channel = cache.invalidation_channel
+        self.bloom = cache.bloom
+        self.compressor = cache.compressor
+        self.lazy_views = cache.lazy_views
+        # queued increments are already batched
+        self.counters = None
+
+    def __getattr__(self, name):
+        for prefix in ('_Cache__', '_PipelineCache__'):
+            if name.startswith(prefix):
+                method = getattr(self._pipe, name[len(prefix):], None)
+                if method is not None:
+                    return self._queue(method)
+
+        raise AttributeError('pipeline has no attribute %s' % name)
+
+    def _queue(self, method):
+        def queue(*args, **kwargs):
+            method(*args, **kwargs)
+            deferred = Deferred()
+            self._queued.append(deferred)
+            return deferred
+        return queue
+
+    def _result(self, reply, callback):
+        return reply.then(callback)
+
+    def _resolved(self, value):
+        deferred = Deferred()
+        deferred.resolve(value)
+        return deferred
+
+    def _script(self, name, keys, args=(), read=False):
+        # a NOSCRIPT reply could not be retried once the pipeline has been
+        # sent, so scripts are queued with their source
+        script = scripts.get(name)
+        return self.__eval(script.source, len(keys), *(tuple(keys) + tuple(args)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+        else:
+            self.reset()
+
+    def __len__(self):
+        return len(self._queued)
+
+    def execute(self):
+        """send every queued command in one round trip and resolve their results
+        :returns the list of raw replies
+        """
+        queued, self._queued = self._queued, []
+        if not queued:
+            return []
+
+        replies = self._pipe.execute(raise_on_error=False)
+        for deferred, reply in zip(queued, replies):
+            deferred.resolve(reply)
+        return replies
+
+    def reset(self):
+        self._pipe.reset()
+        self._queued = []
+
+    def valid(self, key):
+        return self._cache.valid(key)
+
+    def dumps(self, obj):
+        return self._cache.dumps(obj)
+
+    def loads(self, obj):
+        return self._cache.loads(obj)
+
+    def get_many(self, names, chunk_size=None):
+        names = [self._key(name) for name in names]
+        if self.bloom is not None:
+            names = [name for name in names if name in self.bloom]
+        return self._result(self.__mget(names), lambda data: self._decode_many(names, data))
+
+    def set_many(self, mapping, ttl=None, chunk_size=None):
+        items = [(self._key(name), self._dumps_value(self._key(name), value)) for name, value in mapping.items()
+                 if self.valid(name) and self.valid(value)]
+        if not items:
+            return
+
+        ttls = [self._ttl(name, ttl) for name, data in items]
+        if not any(ttls):
+            self.__mset(dict(items))
+        else:
+            for (name, data), name_ttl in zip(items, ttls):
+                self.__set(name, data, ex=name_ttl)
+        for name, data in items:
+            self._bloom_add(name)
+            self._invalidate(name)
+
+    def delete_many(self, names, chunk_size=None):
+        names = [self._key(name) for name in names]
+        result = self.__delete(*names)
+        for name in names:
+            self._invalidate(name)
+        return result
+
+    def _not_pipelined(self, *args, **kwargs):
+        raise NotImplementedError('this command needs a reply before its next command')
+
+    get_or_set = scan = scan_db = rebuild_bloom = load_scripts = pipeline = _not_pipelined
+    iter_hash = iter_set = iter_sortedset = _not_pipelined
+    set_large = get_large = iter_large = delete_large = _not_pipelined
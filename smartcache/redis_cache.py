@@ -5,6 +5,8 @@ import hashlib
 import logging
 import functools
 import random
+import time
+import uuid
 from collections import namedtuple
 from types import MethodType
 
@@ -13,13 +15,54 @@ try:
 except Exception as e:
     import pickle
 
-import redis
 from hash_ring import HashRing
 from smartcache.commands import READ_COMMANDS
+from smartcache.chunked import Manifest, Assembler, ChunkMissing, split, CHUNK_SIZE, CHUNK_WINDOW, REPLACED_GRACE
+from smartcache.compression import COMPRESSED_HEADER, decompress
+from smartcache.connection import connections
+from smartcache.keyspace import Key, routing_key, suffixed
+from smartcache.log import redis_cache_log
+from smartcache.scanner import Scanner, ParallelScanner, SCAN_COUNT, scan_pages
+from smartcache.scripts import scripts
+from smartcache.views import LazyDict, LazyList
+from smartcache.refresh import Envelope, make_envelope, should_refresh, refresher
+
+LOCK_SUFFIX = ':lock'
+
+# keys per MGET, MSET or DEL sent by the *_many methods
+MANY_CHUNK_SIZE = 500
+STALE_SUFFIX = ':stale'
 
 
 class Cache(object):
 
+    # channel on which set and delete publish the names they touch,
+    # see smartcache.near_cache
+    invalidation_channel = None
+
+    # optional smartcache.bloom filter of written names, reads of names
+    # missing from it return without a round trip
+    bloom = None
+
+    # optional smartcache.serializers.CodecRegistry used by dumps and loads
+    # instead of pickle, off by default so that processes still running
+    # older versions can read every value
+    codecs = None
+
+    # optional smartcache.compression.Compressor for the values written by
+    # set, get_or_set, set_many and hash. Compressed values are read back
+    # whether or not a compressor is set.
+    compressor = None
+
+    # True for hash, hash_values, list and members to return
+    # smartcache.views that decode an item on its first read instead of
+    # plain dicts and lists
+    lazy_views = False
+
+    # optional smartcache.counters.CounterBuffer, inc, hinc and inc_score
+    # add their delta to it and return None instead of the new value
+    counters = None
+
     def __getattr__(self, name):
         new_name = name.replace('_Cache', '', 1)
         if new_name.startswith('__'):
@@ -30,19 +73,66 @@ class Cache(object):
                 redis_client = self.master_connection()
             attr = getattr(redis_client, command, None)
             if attr is not None:
+                # dispatch table: later lookups find the bound method in
+                # the instance dict and skip __getattr__, reset after a fork
+                self.__dict__[name] = attr
+                connections.track(self)
                 return attr
 
         raise AttributeError('cache has no attribute %s'%name)
 
     def get_connection(self, host='localhost', port=6379, db=0):
-        return redis.StrictRedis(host=host, port=port, db=db)
+        return connections.client(host, port, db)
 
     def inject_connection(self, connection):
         self.get_connection = connection
+        self._reset_dispatch()
+
+    def _reset_dispatch(self):
+        for name in [k for k in self.__dict__ if k.startswith('_Cache__')]:
+            del self.__dict__[name]
 
     def master_connection(self):
         return self.get_connection()
 
+    def pipeline(self):
+        """queue high-level commands and send them in one round trip
+
+        ::code-block
+            with cache.pipeline() as p:
+                p.set('a', 1)
+                b = p.get('b')
+            b.value
+        """
+        from smartcache.pipeline import PipelineCache
+        return PipelineCache(self)
+
+    def _script(self, name, keys, args=(), read=False):
+        """run the smartcache.scripts script name with EVALSHA, read only
+        scripts on the slave
+        """
+        client = self.slave_connection() if read else self.master_connection()
+        return scripts.run(client, name, keys, args)
+
+    def load_scripts(self):
+        """load the scripts on the master and the slave ahead of their first run
+        """
+        scripts.preload(self.master_connection())
+        if self.slave_connection() is not self.master_connection():
+            scripts.preload(self.slave_connection())
+
+    def _result(self, reply, callback):
+        """post-process a command reply, PipelineCache defers the callback
+        until the reply is available
+        """
+        return callback(reply)
+
+    def _resolved(self, value):
+        """result known without a round trip, PipelineCache wraps it in a
+        resolved Deferred
+        """
+        return value
+
     def slave_connection(self):
         return self.get_connection()
 
@@ -54,8 +144,24 @@ class Cache(object):
             return False
         return True
 
+    def _key(self, name):
+        """redis key of name, bytes such as smartcache.keyspace keys and their
+        suffixed forms are used as they are
+        """
+        if isinstance(name, (str, bytes)):
+            return name
+        return str(name)
+
+    @staticmethod
+    def _ttl(name, ttl):
+        """ttl, or the default ttl of the KeySpace of name
+        """
+        if ttl is None and isinstance(name, Key):
+            return name.space.ttl
+        return ttl
+
     def pack(self, *args):
-        """pack args to redis key
+        """pack args to redis key, see smartcache.keyspace for reversible keys
         """
         return '_'.join(map(str, args))
 
@@ -72,126 +178,438 @@ class Cache(object):
 
         if not self.valid(name):
             return
-        name = str(name)
-        self.__set(name, self.dumps(value))
+        name = self._key(name)
+        self.__set(name, self._dumps_value(name, value), ex=self._ttl(name, None))
+        self._bloom_add(name)
+        self._invalidate(name)
+
+    def acquire_lock(self, name, timeout=10):
+        """set name with nx and a px timeout
+        :returns the token needed by release_lock, None if the lock is taken
+        """
+        token = uuid.uuid4().hex
+        return self._result(self.__set(self._key(name), token, nx=True, px=int(timeout * 1000)),
+                            lambda ok: token if ok else None)
+
+    def release_lock(self, name, token):
+        """delete the lock only if it is still held with token
+        """
+        return self._result(self._script('release_lock', [self._key(name)], [token]), bool)
+
+    def get_or_set(self, name, loader, ttl=None, stale_ttl=None, soft_ttl=None, beta=1.0,
+                   lock_timeout=10, wait=5, interval=0.05):
+        """get name, on a miss only the process holding name:lock calls loader().
+        The others return the copy kept under name:stale when stale_ttl is
+        given, otherwise they re-read name until it is filled or wait seconds
+        pass, after which they call loader() themselves.
+
+        With soft_ttl the value is stored in an Envelope: past soft_ttl (or
+        earlier, by XFetch) it is still returned while one process refreshes
+        it in the background, ttl stays the hard expire.
+        """
+        name = self._key(name)
+        value = self._get_value(name)
+        if value.__class__ is Envelope:
+            if should_refresh(value, beta):
+                refresher.submit((name, id(self)), functools.partial(
+                    self._refresh, name, loader, ttl, stale_ttl, soft_ttl, lock_timeout))
+            return value.value
+
+        if value is not None:
+            return value
+
+        lock_name = suffixed(name, LOCK_SUFFIX)
+        token = self.acquire_lock(lock_name, lock_timeout)
+        if token:
+            try:
+                value = self.get(name)
+                if value is None:
+                    value = self._load(name, loader, ttl, stale_ttl, soft_ttl)
+                return value
+            finally:
+                self.release_lock(lock_name, token)
+
+        if stale_ttl:
+            value = self.get(suffixed(name, STALE_SUFFIX))
+            if value is not None:
+                return value
+
+        deadline = time.time() + wait
+        while time.time() < deadline:
+            time.sleep(interval)
+            value = self.get(name)
+            if value is not None:
+                return value
+
+        return loader()
+
+    def _refresh(self, name, loader, ttl, stale_ttl, soft_ttl, lock_timeout):
+        lock_name = suffixed(name, LOCK_SUFFIX)
+        token = self.acquire_lock(lock_name, lock_timeout)
+        if not token:
+            return
+
+        try:
+            self._load(name, loader, ttl, stale_ttl, soft_ttl)
+        finally:
+            self.release_lock(lock_name, token)
+
+    def _load(self, name, loader, ttl, stale_ttl, soft_ttl):
+        if soft_ttl is None:
+            value = loader()
+            stored = value
+        else:
+            stored = make_envelope(loader, soft_ttl)
+            value = stored.value
+
+        if self.valid(value):
+            self._set_with_stale(name, stored, ttl, stale_ttl)
+        return value
+
+    def _set_with_stale(self, name, value, ttl, stale_ttl):
+        ttl = self._ttl(name, ttl)
+        data = self._dumps_value(name, value)
+        self.__set(name, data, ex=ttl)
+        self._bloom_add(name)
+        if stale_ttl:
+            stale_name = suffixed(name, STALE_SUFFIX)
+            self.__set(stale_name, data, ex=(ttl or 0) + stale_ttl)
+            self._bloom_add(stale_name)
+        self._invalidate(name)
 
     def inc(self, key, amount=1):
         """inc command
         """
-        return self.__incrby(str(key), amount)
+        key = self._key(key)
+        self._bloom_add(key)
+        if self.counters is not None:
+            return self.counters.inc(key, amount)
+        result = self.__incrby(key, amount)
+        self._invalidate(key)
+        return result
 
     def hinc(self, name, key, amount=1):
         """hset hincrby command
         warnings: if the value has been serialized, be careful to call this command
         """
-        return self.__hincrby(str(name), key, amount)
+        name = self._key(name)
+        self._bloom_add(name)
+        if self.counters is not None:
+            return self.counters.hinc(name, key, amount)
+        return self.__hincrby(name, key, amount)
 
     def inc_score(self, name, value, amount=1):
         """sortedset h
         """
-        return self.__zincrby(str(name), self.dumps(value), amount)
+        name = self._key(name)
+        self._bloom_add(name)
+        if self.counters is not None:
+            return self.counters.inc_score(name, value, amount)
+        return self.__zincrby(name, self.dumps(value), amount)
 
     def get(self, name):
         """redis get command
         """
-        data = self.__get(str(name))
+        name = self._key(name)
+        if self.bloom is not None and name not in self.bloom:
+            return self._resolved(None)
+
+        return self._result(self.__get(name), self._decode_value)
+
+    def _decode_value(self, data):
+        value = self._loads_value(data)
+        if value.__class__ is Envelope:
+            return value.value
+        return value
+
+    def _get_value(self, name):
+        if self.bloom is not None and name not in self.bloom:
+            return None
+
+        return self._loads_value(self.__get(name))
+
+    def _loads_value(self, data):
         try:
+            if data and data[:2] == COMPRESSED_HEADER:
+                data = decompress(data) if self.compressor is None else self.compressor.decompress(data)
             return self.loads(data) if data else data
         except:
             return data
 
+    @staticmethod
+    def _chunks(items, size):
+        for index in range(0, len(items), size):
+            yield items[index:index+size]
+
+    def get_many(self, names, chunk_size=MANY_CHUNK_SIZE):
+        """mget command, chunk_size names per round trip
+        :returns dict of the names that exist to their value
+        """
+        names = [self._key(name) for name in names]
+        if self.bloom is not None:
+            names = [name for name in names if name in self.bloom]
+
+        result = {}
+        for chunk in self._chunks(names, chunk_size):
+            result.update(self._decode_many(chunk, self.__mget(chunk)))
+        return result
+
+    def _decode_many(self, names, data):
+        decode = self._decode_value
+        return dict((name, decode(d)) for name, d in zip(names, data) if d is not None)
+
+    def set_many(self, mapping, ttl=None, chunk_size=MANY_CHUNK_SIZE):
+        """mset command, or pipelined set commands with ttl,
+        chunk_size names per round trip
+        """
+        items = [(self._key(name), self._dumps_value(self._key(name), value)) for name, value in mapping.items()
+                 if self.valid(name) and self.valid(value)]
+        for chunk in self._chunks(items, chunk_size):
+            pipe = self.__pipeline(transaction=False)
+            ttls = [self._ttl(name, ttl) for name, data in chunk]
+            if not any(ttls):
+                pipe.mset(dict(chunk))
+            else:
+                for (name, data), name_ttl in zip(chunk, ttls):
+                    pipe.set(name, data, ex=name_ttl)
+            for name, data in chunk:
+                self._bloom_add(name)
+                if self.invalidation_channel:
+                    pipe.publish(self.invalidation_channel, name)
+            pipe.execute()
+
+    def delete_many(self, names, chunk_size=MANY_CHUNK_SIZE):
+        """del command, chunk_size names per round trip
+        :returns number of names deleted
+        """
+        names = [self._key(name) for name in names]
+        deleted = 0
+        for chunk in self._chunks(names, chunk_size):
+            pipe = self.__pipeline(transaction=False)
+            pipe.delete(*chunk)
+            if self.invalidation_channel:
+                for name in chunk:
+                    pipe.publish(self.invalidation_channel, name)
+            deleted += pipe.execute()[0]
+        return deleted
+
+    def set_large(self, name, value, ttl=None, chunk_size=CHUNK_SIZE):
+        """store value across chunk keys of chunk_size bytes with a manifest
+        at name. The chunks are written in one pipelined round trip and the
+        manifest is swapped in a second one once every chunk is stored, so
+        readers see the old value or the new one, never a mix; the chunks
+        of the old value expire REPLACED_GRACE seconds later.
+
+        Without ttl the chunks never expire: remove the value with
+        delete_large, delete only removes the manifest.
+        """
+        if not self.valid(name) or not self.valid(value):
+            return
+
+        name = self._key(name)
+        ttl = self._ttl(name, ttl)
+        data = self._dumps_value(name, value)
+        manifest = Manifest.new(len(data), chunk_size)
+        keys = manifest.chunk_keys(name)
+        pipe = self.__pipeline(transaction=False)
+        for key, chunk in zip(keys, split(data, chunk_size)):
+            pipe.set(key, chunk, ex=ttl)
+        try:
+            pipe.execute()
+        except Exception:
+            # e.g. OOM: the current manifest stays, drop what was written
+            try:
+                self.__delete(*keys)
+            except Exception as e:
+                redis_cache_log.exception(e)
+            raise
+
+        pipe = self.__pipeline(transaction=False)
+        pipe.getset(name, manifest.pack())
+        if ttl:
+            pipe.expire(name, ttl)
+        replaced = Manifest.unpack(pipe.execute()[0])
+        self._bloom_add(name)
+        self._invalidate(name)
+
+        if replaced is not None:
+            pipe = self.__pipeline(transaction=False)
+            for key in replaced.chunk_keys(name):
+                pipe.expire(key, REPLACED_GRACE)
+            pipe.execute()
+        return value
+
+    def get_large(self, name, window=CHUNK_WINDOW):
+        """value stored with set_large, reassembled in one preallocated
+        buffer from window chunks per round trip. Values stored with set
+        are returned as get does.
+        """
+        name = self._key(name)
+        data = self.__get(name)
+        manifest = Manifest.unpack(data)
+        if manifest is None:
+            return self._decode_value(data)
+
+        assembler = Assembler(manifest)
+        try:
+            for chunk in self._read_chunks(name, manifest, window):
+                assembler.add(chunk)
+        except ChunkMissing:
+            return None
+        return self._decode_value(assembler.buffer) if assembler.complete else None
+
+    def iter_large(self, name, window=CHUNK_WINDOW):
+        """serialized bytes of a value stored with set_large, chunk by chunk,
+        for streaming them elsewhere
+        :raises ChunkMissing when a chunk expired during the read
+        """
+        name = self._key(name)
+        manifest = Manifest.unpack(self.__get(name))
+        if manifest is None:
+            return
+
+        for chunk in self._read_chunks(name, manifest, window):
+            if chunk is None:
+                raise ChunkMissing('chunk of %s expired or evicted' % name)
+            yield chunk
+
+    def _read_chunks(self, name, manifest, window):
+        for keys in self._chunks(manifest.chunk_keys(name), window):
+            for chunk in self.__mget(keys):
+                yield chunk
+
+    def delete_large(self, name):
+        """delete a value stored with set_large and its chunks
+        """
+        name = self._key(name)
+        manifest = Manifest.unpack(self.__get(name))
+        keys = manifest.chunk_keys(name) if manifest is not None else []
+        result = self.__delete(name, *keys)
+        self._invalidate(name)
+        return result
+
     def exists(self, name):
         """redis exists command
         """
-        return bool(self.__exists(str(name)))
+        name = self._key(name)
+        if self.bloom is not None and name not in self.bloom:
+            return self._resolved(False)
+
+        return self._result(self.__exists(name), bool)
 
     def __contains__(self, item):
         return self.exists(item)
 
     def delete(self, name):
-        """redis delete command
+        """redis delete command, values stored with set_large are removed
+        with delete_large
         """
-        return self.__delete(str(name))
+        name = self._key(name)
+        result = self.__delete(name)
+        self._invalidate(name)
+        return result
+
+    def _bloom_add(self, name):
+        if self.bloom is not None:
+            self.bloom.add(name)
+
+    def rebuild_bloom(self):
+        """refill the bloom filter from every key of the db, reads keep using
+        the previous filter until the scan is done
+        """
+        self.bloom.rebuild(key for keys in self.scan_db() for key in keys)
+
+    def _invalidate(self, name):
+        if self.invalidation_channel:
+            self.__publish(self.invalidation_channel, name)
 
     def expire(self, name, expire):
         """redis expire command
         """
-        return self.__expire(str(name), expire)
+        return self.__expire(self._key(name), expire)
 
     def expireat(self, name, timestamp):
         """redis expireat command
         """
-        return self.__expireat(str(name), timestamp)
+        return self.__expireat(self._key(name), timestamp)
 
     def persist(self, name):
         """redis persist command
         """
-        return self.__persist(str(name))
+        return self.__persist(self._key(name))
 
     def move(self, name, db):
         """redis move command
         """
-        return self.__move(str(name), db)
+        return self.__move(self._key(name), db)
 
     def object(self, name, infotype='idletime'):
         """redis object command
         """
-        return self.__object(infotype, str(name))
+        return self.__object(infotype, self._key(name))
 
     def rename(self, name, newname):
         """redis rename command
         """
-        return self.__rename(str(name), str(newname))
+        name, newname = self._key(name), self._key(newname)
+        self._bloom_add(newname)
+        result = self.__rename(name, newname)
+        self._invalidate(name)
+        self._invalidate(newname)
+        return result
 
     def renamenx(self, name, newname):
         """redis renamenx command
         """
-        return self.__renamenx(str(name), str(newname))
+        name, newname = self._key(name), self._key(newname)
+        self._bloom_add(newname)
+        result = self.__renamenx(name, newname)
+        self._invalidate(name)
+        self._invalidate(newname)
+        return result
 
     def ttl(self, name):
         """redis ttl command
         """
-        return self.__ttl(str(name))
+        return self.__ttl(self._key(name))
 
     def type(self, name):
         """redis type command
         """
-        return self.__type(str(name))
+        return self.__type(self._key(name))
 
     def size(self, key):
-        """:
+        """: one round trip, the type is checked by the size script
         set: scard command
         zset: zcard command
         hash: hllen command
         list: llen command
         """
-        ctype = self.__type(key)
-        if ctype == 'set':
-            return self.__scard(key)
-
-        if ctype == 'zset':
-            return self.__zcard(key)
-
-        if ctype == 'hash':
-            return self.__hlen(key)
-
-        if ctype == 'string':
-            raise ValueError('%s is string type' % key)
+        def check(size):
+            if size < 0:
+                raise ValueError('%s is string type' % key)
+            return size
 
-        return self.__llen(key)
+        return self._result(self._script('size', [self._key(key)], read=True), check)
 
     def append(self, name, value):
         """redis append command
         """
-        return self.__append(str(name), value)
+        name = self._key(name)
+        self._bloom_add(name)
+        result = self.__append(name, value)
+        self._invalidate(name)
+        return result
+
+    def scan(self, match=None, count=SCAN_COUNT, type=None):
+        """smartcache.scanner.Scanner of the keys matching match, of type type
+        """
+        return Scanner(self.master_connection(), match, count, type)
 
     def scan_db(self):
-        start = 0
-        result_length = 10
-        while result_length:
-            start, result = self.__scan(start)
-            result_length = len(result)
-            yield result
+        """batches of every key of the db, see scan
+        """
+        return self.scan().batches()
 
     def _update_hash(self, name, key, value):
         if not self.valid(name):
@@ -203,8 +621,9 @@ class Cache(object):
         if not self.valid(value):
             return
 
-        name, key = str(name), str(key)
-        self.__hset(name, key, self.dumps(value))
+        name, key = self._key(name), str(key)
+        self._bloom_add(name)
+        self.__hset(name, key, self._dumps_value(name, value))
 
     def hash(self, name, key=None, value=None):
         """hset and hget command
@@ -215,50 +634,74 @@ class Cache(object):
         if value is not None:
             return self._update_hash(name, key, value)
         else:
-            data = self.__hget(str(name), key)
-            try:
-                return self.loads(data) if data else data
-            except:
-                return data
+            return self._result(self.__hget(self._key(name), key), self._loads_value)
 
     def hash_keys(self, name):
-        name = str(name)
+        name = self._key(name)
         return self.__hkeys(name)
 
     def hash_values(self, name):
-        name = str(name)
-        result = self.__hvals(name)
-        try:
-            return [self.loads(i) for i in result]
-        except:
-            return result
+        name = self._key(name)
+        return self._result(self.__hvals(name), self._loads_values)
+
+    def _loads_values(self, result):
+        return self._view(LazyList(result, self._loads_value))
+
+    def _view(self, view):
+        if self.lazy_views:
+            return view
+        return view.copy() if isinstance(view, LazyDict) else list(view)
 
     def hash_items(self, name):
-        return self._hash_all(name).items()
+        return self._result(self.__hgetall(self._key(name)), lambda result: self._loads_hash(result).items())
+
+    def iter_hash(self, name, match=None, count=SCAN_COUNT, prefetch=False):
+        """(field, value) pairs of hash name read with hscan, about count
+        fields per round trip, decoded a page at a time. With prefetch the
+        next page is read while the current one is consumed.
+        """
+        hscan, loads, name = self.__hscan, self._loads_value, self._key(name)
+        for page in scan_pages(lambda cursor: hscan(name, cursor, match=match, count=count), prefetch):
+            for pair in [(field, loads(value)) for field, value in page.items()]:
+                yield pair
+
+    def iter_set(self, name, match=None, count=SCAN_COUNT, prefetch=False):
+        """members of set name read with sscan, see iter_hash
+        """
+        sscan, loads, name = self.__sscan, self._loads_value, self._key(name)
+        for page in scan_pages(lambda cursor: sscan(name, cursor, match=match, count=count), prefetch):
+            for member in [loads(member) for member in page]:
+                yield member
+
+    def iter_sortedset(self, name, match=None, count=SCAN_COUNT, prefetch=False):
+        """(member, score) pairs of sortedset name read with zscan, see iter_hash
+        """
+        zscan, loads, name = self.__zscan, self._loads_value, self._key(name)
+        for page in scan_pages(lambda cursor: zscan(name, cursor, match=match, count=count), prefetch):
+            for pair in [(loads(member), score) for member, score in page]:
+                yield pair
 
     def _hash_all(self, name):
-        result = self.__hgetall(str(name))
-        try:
-            for k, v in result.items():
-                result[k] = pickle.loads(v)
-        finally:
-            return result
+        return self._result(self.__hgetall(self._key(name)), self._loads_hash)
+
+    def _loads_hash(self, result):
+        return self._view(LazyDict(result, self._loads_value))
 
     def lupdate(self, name, data):
         """lpush command
         """
-        self._update_list(name, data, self.__lpush)
+        self._update_list(name, data, 'lpush')
 
     def rupdate(self, name, data):
         """rpush command
         """
-        self._update_list(name, data, self.__rpush)
+        self._update_list(name, data, 'rpush')
 
     def list(self, name, skip=0, limit=1):
         """lrange command
         :returns list value
         """
-        return [self.loads(i) for i in self.__lrange(str(name), skip, skip+limit-1)]
+        return self._result(self.__lrange(self._key(name), skip, skip+limit-1), self._loads_values)
 
     def rpop(self, name):
         """rpop command
@@ -271,13 +714,9 @@ class Cache(object):
         return self._pop_list_value(name, self.__lpop)
 
     def _pop_list_value(self, name, func):
-        data = func(str(name))
-        if not data:
-            return
+        return self._result(func(self._key(name)), lambda data: self.loads(data) if data else None)
 
-        return self.loads(data)
-
-    def _update_list(self, name, data, func):
+    def _update_list(self, name, data, command):
         if not self.valid(name):
             return
 
@@ -289,12 +728,21 @@ class Cache(object):
 
         if not result:
             return
-        name = str(name)
+        name = self._key(name)
+        self._bloom_add(name)
         try:
-            func(name, *result)
+            getattr(self, '_Cache__' + command)(name, *result)
         except Exception as e:
-            [func(name, i) for i in result]
+            # Compatible for low version redis
+            self._per_member(command, name, result)
 
+    def _per_member(self, command, name, members):
+        """one command per member, pipelined into a single round trip
+        """
+        pipe = self.__pipeline(transaction=False)
+        for member in members:
+            getattr(pipe, command)(name, member)
+        return pipe.execute()
 
     @staticmethod
     def _is_iterable(data):
@@ -305,7 +753,7 @@ class Cache(object):
         :return set members
         """
         count = abs(count)
-        name = str(name)
+        name = self._key(name)
         result = None
         try:
             if with_all:
@@ -316,11 +764,14 @@ class Cache(object):
             # Compatible for low version redis
             result = self.__srandmember(name) # return one value
 
+        return self._result(result, self._loads_members)
+
+    def _loads_members(self, result):
         if result is None:
             return None
 
         if isinstance(result, list) or isinstance(result, set):
-            return [self.loads(i) for i in result]
+            return self._loads_values(result)
 
         return [self.loads(result)]
 
@@ -336,86 +787,57 @@ class Cache(object):
         if not self.valid(name):
             return
 
-        name = str(name)
+        name = self._key(name)
+        self._bloom_add(name)
         if self._is_iterable(member):
             result = [self.dumps(i) for i in member]
             try:
                 return self.__sadd(name, *result)
             except Exception as e:
                 # Compatible for low version redis
-                return sum([self.__sadd(name, i) for i in result])
+                return sum(self._per_member('sadd', name, result))
         else:
             return self.__sadd(name, self.dumps(member))
 
     def contains(self, name, key):
-        """implemented for sismember command and hexists command
+        """implemented for sismember command and hexists command, in one
+        round trip by the contains script
         """
-        ctype = self.__type(str(name))
-        if ctype == 'set':
-            return bool(self.__sismember(name, self.dumps(key)))
-
-        if ctype == 'hash':
-            return bool(self.__hexists(name, key))
-
-        return False
+        return self._result(self._script('contains', [self._key(name)], [self.dumps(key), str(key)], read=True), bool)
 
     def move_set_member(self, src, dst, member):
         """set smove command
         """
-        return self.__smove(str(src), str(dst), self.dumps(member))
+        dst = self._key(dst)
+        self._bloom_add(dst)
+        return self.__smove(self._key(src), dst, self.dumps(member))
 
     def pop_member(self, name, value=None):
-        """srem command and zrem command
+        """srem command and zrem command, in one round trip by the
+        pop_member script
+        :returns number of members removed
         """
-        name = str(name)
-        ctype = self.__type(name)
-        if ctype == 'set':
-            return self._pop_set(name, value) # return pop value number
-
-        if ctype == 'zset':
-            return self._pop_sortedset(name, value) # return pop value number
-
-        return 0
-
-    def _pop_sortedset(self, name, value):
-        name = str(name)
-        if self._is_iterable(value):
-            result = [self.dumps(i) for i in value]
-            try:
-                return self.__zrem(name, *result)
-            except Exception as e:
-                return sum([self.__zrem(name, i) for i in result])
-        else:
-            return self.__zrem(name, self.dumps(value))
-
-    def _pop_set(self, name, value):
-        name = str(name)
-        if self._is_iterable(value):
-            try:
-                return self.__srem(name, *[self.dumps(i) for i in value])
-            except Exception as e:
-                return sum([self.__srem(name, self.dumps(i)) for i in value])
-        else:
-            return self.__srem(name, self.dumps(value))
+        values = value if self._is_iterable(value) else [value]
+        return self._script('pop_member', [self._key(name)], [self.dumps(i) for i in values])
 
     def sortedset_members(self, name, skip=0, limit=1, min_score='-inf', max_score='inf', withscores=False):
         """sortedset members according to score
         """
-        result = self.__zrangebyscore(str(name), float(min_score), float(max_score),
+        result = self.__zrangebyscore(self._key(name), float(min_score), float(max_score),
                                       start=skip, num=limit, withscores=withscores)
         if withscores:
-            return [(self.loads(value), score) for value, score in result]
+            return self._result(result, lambda result: [(self.loads(value), score) for value, score in result])
 
-        return [self.loads(value) for value in result]
+        return self._result(result, lambda result: [self.loads(value) for value in result])
 
     def remove_member_with_score(self, name, min_score=0, max_score=0):
-        return self.__zremrangebyscore(str(name), float(min_score), float(max_score))
+        return self.__zremrangebyscore(self._key(name), float(min_score), float(max_score))
 
     def remove_member_with_rank(self):
         raise NotImplementedError
 
     def score(self, name, key):
-        return self.__zscore(str(name), self.dumps(key))
+        return self.__zscore(self._key(name), self.dumps(key))
 
     def zadd(self, name, value, score):
         return self.update_sortedset(name, (value, score))
@@ -441,21 +863,32 @@ class Cache(object):
         if not result:
             return
 
-        name = str(name)
+        name = self._key(name)
+        self._bloom_add(name)
         try:
             return self.__zadd(name, *result)
         except Exception as e:
             # Compatible for low version redis
             return sum([self.__zadd(name, *tuple(result[index:index+2])) for index in range(0, len(result), 2)])
 
+    def _dumps_value(self, name, value):
+        data = self.dumps(value)
+        if self.compressor is not None:
+            data = self.compressor.compress(name, data)
+        return data
+
     def loads(self, obj):
         """Override for object Deserialization
         """
+        if self.codecs is not None:
+            return self.codecs.loads(obj)
         return pickle.loads(obj)
 
     def dumps(self, obj):
         """Override for object Serialization
         """
+        if self.codecs is not None:
+            return self.codecs.dumps(obj)
         return pickle.dumps(obj)
 
 
@@ -495,14 +928,13 @@ class ShardClient(object):
             self._connections[self.node_name(s)] = self.connect_redis(**s)
 
     def connect_redis(self, host='localhost', port=6379, db=0, **kwargs):
-        return redis.StrictRedis(host=host, port=port, db=db)
+        return connections.client(host, port, db)
 
     def get_server(self, key):
-        return self._ring.get_node(key)
+        return self._ring.get_node(routing_key(key))
 
     def get_connection(self, key):
-        node = self._ring.get_node(key)
-        return self._connections[node]
+        return self._connections[self.get_server(key)]
 
 
 def shard_cache_wrap(shard_cache, cc):
@@ -536,6 +968,39 @@ class ShardCache(object):
     def get_cache(self):
         return Cache()
 
+    def _node_caches(self, names):
+        groups = {}
+        for name in names:
+            groups.setdefault(self.shard_client.get_server(name), []).append(name)
+
+        for node, group in groups.items():
+            cc = self.get_cache()
+            connection = self.shard_client._connections[node]
+            cc.inject_connection(lambda connection=connection: connection)
+            yield cc, group
+
+    def get_many(self, names, **kwargs):
+        result = {}
+        for cc, group in self._node_caches(names):
+            result.update(cc.get_many(group, **kwargs))
+        return result
+
+    def set_many(self, mapping, ttl=None, **kwargs):
+        for cc, group in self._node_caches(list(mapping)):
+            cc.set_many(dict((name, mapping[name]) for name in group), ttl, **kwargs)
+
+    def delete_many(self, names, **kwargs):
+        return sum(cc.delete_many(group, **kwargs) for cc, group in self._node_caches(names))
+
+    def scan(self, match=None, count=SCAN_COUNT, type=None):
+        """ParallelScanner over every shard, scanned in parallel
+        """
+        return ParallelScanner([Scanner(connection, match, count, type)
+                                for connection in self.shard_client._connections.values()])
+
+    def scan_db(self):
+        return self.scan().batches()
+
 
 NodeClient = namedtuple('NodeClient', ['node_name', 'client'])
 
@@ -571,7 +1036,7 @@ class MasterSlaveClient(object):
         self._slave_range = range(0, len(self._slave))
 
     def connect_redis(self, host='localhost', port=6379, db=0, **kwargs):
-        return redis.StrictRedis(host=host, port=port, db=db)
+        return connections.client(host, port, db)
 
     def get_master(self):
         return self._master.client
@@ -590,6 +1055,7 @@ def master_slave_cache_wrap(master_slave_cache, cc):
         def innerwrapper(key, *args, **kwargs):
             connection = master_slave_cache.master_slave_client.get_slave(key)
             cc.slave_connection = MethodType(lambda self: connection, cc)
+            cc._reset_dispatch()
             return func(key, *args, **kwargs)
 
         return innerwrapper
@@ -616,6 +1082,13 @@ class MasterSlaveCache(object):
     def get_cache(self):
         return Cache()
 
+    def _node_caches(self, names):
+        # every write goes to the master
+        cc = self.get_cache()
+        master = self.master_slave_client.get_master()
+        cc.inject_connection(lambda: master)
+        yield cc, list(names)
+
 
 if __name__ == '__main__':
     cc = Cache()
\ No newline at end of file
@@ -0,0 +1,71 @@
+#-*- coding:utf-8 -*-
+from __future__ import absolute_import, division, print_function, with_statement
+
+import math
+import time
+import random
+import threading
+from collections import namedtuple
+
+from smartcache.log import object_cache_log
+
+# value stored with a soft deadline, delta is the seconds it took to compute
+Envelope = namedtuple('Envelope', ['value', 'delta', 'soft_expire_at'])
+
+
+def make_envelope(loader, soft_expire):
+    '''
+    call loader and wrap its result, timing the call
+    '''
+    start = time.time()
+    value = loader()
+    now = time.time()
+    return Envelope(value, now - start, now + soft_expire)
+
+
+def should_refresh(envelope, beta=1.0, now=None):
+    '''
+    XFetch probabilistic early expiration: always true once the soft deadline
+    is passed, and increasingly likely before it for values that are slow to
+    compute, beta > 1 favours earlier refreshes
+    '''
+    if now is None:
+        now = time.time()
+    return now - envelope.delta * beta * math.log(1.0 - random.random()) >= envelope.soft_expire_at
+
+
+class Refresher(object):
+    '''
+    run refreshes in daemon threads, at most one in flight per key
+    '''
+
+    def __init__(self):
+        self._inflight = set()
+        self._lock = threading.Lock()
+
+    def submit(self, key, func):
+        with self._lock:
+            if key in self._inflight:
+                return False
+            self._inflight.add(key)
+
+        t = threading.Thread(target=self._run, args=(key, func), name='smartcache-refresh')
+        t.daemon = True
+        t.start()
+        return True
+
+    def _run(self, key, func):
+        try:
+            func()
+        except Exception as e:
+            object_cache_log.exception(e)
+        finally:
+            with self._lock:
+                self._inflight.discard(key)
+
+    def pending(self):
+        with self._lock:
+            return len(self._inflight)
+
+
+refresher = Refresher()
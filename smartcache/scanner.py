@@ -0,0 +1,224 @@
+#-*- coding:utf-8 -*-
+from __future__ import absolute_import, division, print_function, with_statement
+
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from redis.exceptions import ResponseError
+
+from smartcache.log import redis_cache_log
+
+# keys asked per SCAN call, redis may return more or fewer
+SCAN_COUNT = 1000
+
+
+class ScanActions(object):
+
+    """
+    flattened results of the batch actions of Scanner and ParallelScanner,
+    every action is pipelined: one round trip per scanned batch
+    """
+
+    def stream(self, action=None):
+        raise NotImplementedError
+
+    def __iter__(self):
+        for keys in self.stream():
+            for key in keys:
+                yield key
+
+    def batches(self):
+        """lists of keys, one per SCAN reply with keys
+        """
+        return self.stream()
+
+    def count(self):
+        return sum(len(keys) for keys in self.stream())
+
+    def ttl(self):
+        """(key, ttl) pairs
+        """
+        for pairs in self.stream(_ttl):
+            for pair in pairs:
+                yield pair
+
+    def memory_usage(self):
+        """(key, bytes) pairs from MEMORY USAGE
+        """
+        for pairs in self.stream(_memory_usage):
+            for pair in pairs:
+                yield pair
+
+    def unlink(self):
+        """unlink every scanned key, DEL on servers without UNLINK
+        :returns number of keys removed
+        """
+        return sum(removed for removed, in self.stream(_unlink))
+
+
+def _ttl(client, keys):
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+        pipe.ttl(key)
+    return list(zip(keys, pipe.execute()))
+
+
+def _memory_usage(client, keys):
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+        pipe.memory_usage(key)
+    return list(zip(keys, pipe.execute()))
+
+
+def _unlink(client, keys):
+    try:
+        return [client.unlink(*keys)]
+    except ResponseError:
+        # redis < 4.0
+        return [client.delete(*keys)]
+
+
+class Scanner(ScanActions):
+
+    """
+    streaming SCAN of one redis server. Iterating yields keys, the cursor is
+    followed until the server returns 0, empty replies included.
+
+    type filters with the TYPE option of SCAN, or with a pipelined TYPE per
+    batch on servers older than 6.0.
+
+    ::code-block
+        for key, ttl in cache.scan('session:*', type='hash').ttl():
+            ...
+        cache.scan('tmp:*').unlink()
+    """
+
+    def __init__(self, client, match=None, count=SCAN_COUNT, type=None):
+        self.client = client
+        self.match = match
+        self.count_hint = count
+        self.type = type
+        self._server_type = type is not None
+
+    def _scan(self, cursor):
+        if self._server_type:
+            try:
+                return self.client.scan(cursor, match=self.match, count=self.count_hint, _type=self.type)
+            except ResponseError:
+                redis_cache_log.info('SCAN TYPE is not supported, filtering with TYPE')
+                self._server_type = False
+        return self.client.scan(cursor, match=self.match, count=self.count_hint)
+
+    def _filter_type(self, keys):
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.type(key)
+        expected = (self.type, self.type.encode('utf-8'))
+        return [key for key, ktype in zip(keys, pipe.execute()) if ktype in expected]
+
+    def stream(self, action=None):
+        """keys, or action(client, keys), for every batch with keys
+        """
+        cursor = None
+        while cursor != 0:
+            cursor, keys = self._scan(cursor or 0)
+            if keys and self.type is not None and not self._server_type:
+                keys = self._filter_type(keys)
+            if keys:
+                yield keys if action is None else action(self.client, keys)
+
+
+class _Prefetch(threading.Thread):
+
+    def __init__(self, fetch, cursor):
+        super(_Prefetch, self).__init__(name='smartcache-prefetch')
+        self.daemon = True
+        self.fetch = fetch
+        self.cursor = cursor
+        self.reply = None
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            self.reply = self.fetch(self.cursor)
+        except Exception as e:
+            self.error = e
+
+    def result(self):
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.reply
+
+
+def scan_pages(fetch, prefetch=False):
+    """pages of a cursor command, fetch(cursor) returns (cursor, page).
+    With prefetch the next page is read in a thread while the caller
+    handles the current one.
+    """
+    cursor, page = fetch(0)
+    while True:
+        pending = _Prefetch(fetch, cursor) if prefetch and cursor != 0 else None
+        yield page
+        if cursor == 0:
+            return
+        cursor, page = pending.result() if pending is not None else fetch(cursor)
+
+
+_DONE = object()
+
+
+class ParallelScanner(ScanActions):
+
+    """
+    Scanners of several servers, e.g. the shards of a ShardCache, run in
+    one thread each. Batches are yielded as they arrive, at most
+    queue_size of them wait for the consumer.
+    """
+
+    def __init__(self, scanners, queue_size=16):
+        self.scanners = scanners
+        self.queue_size = queue_size
+
+    def stream(self, action=None):
+        results = queue.Queue(self.queue_size)
+        stop = threading.Event()
+
+        def run(scanner):
+            try:
+                for batch in scanner.stream(action):
+                    if stop.is_set():
+                        return
+                    results.put(batch)
+            except Exception as e:
+                results.put(e)
+            finally:
+                results.put(_DONE)
+
+        threads = [threading.Thread(target=run, args=(scanner,), name='smartcache-scan')
+                   for scanner in self.scanners]
+        for t in threads:
+            t.daemon = True
+            t.start()
+
+        running = len(threads)
+        try:
+            while running:
+                batch = results.get()
+                if batch is _DONE:
+                    running -= 1
+                elif isinstance(batch, Exception):
+                    raise batch
+                else:
+                    yield batch
+        finally:
+            # unblock the threads of an abandoned scan
+            stop.set()
+            while running:
+                if results.get() is _DONE:
+                    running -= 1
@@ -0,0 +1,100 @@
+#-*- coding:utf-8 -*-
+from __future__ import absolute_import, division, print_function, with_statement
+
+import hashlib
+
+from redis.exceptions import NoScriptError
+
+# delete the lock only if it still holds our token
+RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# length of a set, sorted set, hash or list, -1 for a string
+SIZE = """
+local t = redis.call('type', KEYS[1])['ok']
+if t == 'set' then return redis.call('scard', KEYS[1]) end
+if t == 'zset' then return redis.call('zcard', KEYS[1]) end
+if t == 'hash' then return redis.call('hlen', KEYS[1]) end
+if t == 'string' then return -1 end
+return redis.call('llen', KEYS[1])
+"""
+
+# ARGV[1] is the serialized set member, ARGV[2] the hash field
+CONTAINS = """
+local t = redis.call('type', KEYS[1])['ok']
+if t == 'set' then return redis.call('sismember', KEYS[1], ARGV[1]) end
+if t == 'hash' then return redis.call('hexists', KEYS[1], ARGV[2]) end
+return 0
+"""
+
+# remove the serialized members ARGV from a set or sorted set, unpack is
+# bounded by the lua stack so they are removed in batches
+POP_MEMBER = """
+local t = redis.call('type', KEYS[1])['ok']
+local command
+if t == 'set' then command = 'srem' elseif t == 'zset' then command = 'zrem' else return 0 end
+local removed = 0
+for i = 1, #ARGV, 4096 do
+    removed = removed + redis.call(command, KEYS[1], unpack(ARGV, i, math.min(i + 4095, #ARGV)))
+end
+return removed
+"""
+
+
+class Script(object):
+
+    __slots__ = ['name', 'source', 'sha']
+
+    def __init__(self, name, source):
+        self.name = name
+        self.source = source
+        self.sha = hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+class ScriptManager(object):
+
+    """
+    named lua scripts run with EVALSHA, so only their digest is sent.
+    A server that does not know a script, after a restart, failover or
+    SCRIPT FLUSH, answers NOSCRIPT: the script is loaded and run again.
+    """
+
+    def __init__(self):
+        self._scripts = {}
+
+    def register(self, name, source):
+        script = self._scripts[name] = Script(name, source)
+        return script
+
+    def get(self, name):
+        return self._scripts[name]
+
+    def __iter__(self):
+        return iter(self._scripts.values())
+
+    def preload(self, client):
+        """load every script into the server of client ahead of their first run
+        """
+        for script in self:
+            client.script_load(script.source)
+        return len(self._scripts)
+
+    def run(self, client, name, keys=(), args=()):
+        script = self._scripts[name]
+        argv = tuple(keys) + tuple(args)
+        try:
+            return client.evalsha(script.sha, len(keys), *argv)
+        except NoScriptError:
+            client.script_load(script.source)
+            return client.evalsha(script.sha, len(keys), *argv)
+
+
+scripts = ScriptManager()
+scripts.register('release_lock', RELEASE_LOCK)
+scripts.register('size', SIZE)
+scripts.register('contains', CONTAINS)
+scripts.register('pop_member', POP_MEMBER)
@@ -0,0 +1,173 @@
+#-*- coding:utf-8 -*-
+from __future__ import absolute_import, division, print_function, with_statement
+
+import json
+import math
+
+try:
+    import cPickle as pickle
+except Exception as e:
+    import pickle
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# msgpack >= 1.0 refuses non str map keys unless told otherwise
+MSGPACK_UNPACK_KWARGS = {'raw': False}
+if msgpack is not None and msgpack.version >= (0, 6, 1):
+    MSGPACK_UNPACK_KWARGS['strict_map_key'] = False
+
+try:
+    text_type = unicode
+except NameError:
+    text_type = str
+
+# first bytes of values written without a tag: ascii numbers, so that
+# INCR, INCRBYFLOAT and other services can use them, and pickles
+NUMBER_TAGS = frozenset(b'-0123456789'[i:i+1] for i in range(11))
+PICKLE_TAG = b'\x80'
+
+# first byte of smartcache.compression.COMPRESSED_HEADER
+COMPRESSED_TAG = b'\x1e'
+
+
+class Codec(object):
+
+    """
+    serializer for some python types, values are stored as tag + encode(obj)
+    """
+
+    tag = None
+    types = ()
+
+    def encode(self, obj):
+        raise NotImplementedError
+
+    def decode(self, data):
+        raise NotImplementedError
+
+
+class BytesCodec(Codec):
+    tag = b'\x01'
+    types = (bytes,)
+
+    def encode(self, obj):
+        return obj
+
+    def decode(self, data):
+        return bytes(data)
+
+
+class TextCodec(Codec):
+    tag = b'\x02'
+    types = (text_type,)
+
+    def encode(self, obj):
+        return obj.encode('utf-8')
+
+    def decode(self, data):
+        return text_type(data, 'utf-8')
+
+
+class JsonCodec(Codec):
+    """not registered by default: tuples come back as lists and dict keys as str
+    """
+    tag = b'\x05'
+    types = ()
+
+    def encode(self, obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def decode(self, data):
+        return json.loads(text_type(data, 'utf-8'))
+
+
+class MsgpackCodec(Codec):
+    """strict types: tuples, subclasses and other types msgpack would not
+    give back as they were raise TypeError, and are pickled instead
+    """
+    tag = b'\x06'
+    types = ()
+
+    def encode(self, obj):
+        return msgpack.packb(obj, use_bin_type=True, strict_types=True)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, **MSGPACK_UNPACK_KWARGS)
+
+
+class CodecRegistry(object):
+
+    """
+    type-dispatched serialization for Cache.dumps and Cache.loads
+
+    int and finite float values are stored as plain ascii numbers, bytes and
+    text behind a one byte tag, every other type is pickled. A value its
+    codec can not encode is pickled too. loads picks the decoder from the
+    first byte, so untagged pickles written by older versions stay readable.
+
+    ::code-block
+        registry = CodecRegistry()
+        registry.register(JsonCodec(), (dict, list))
+        cache.codecs = registry
+    """
+
+    def __init__(self, protocol=pickle.HIGHEST_PROTOCOL):
+        self.protocol = protocol
+        self._by_type = {}
+        self._by_tag = {}
+        self.register(BytesCodec())
+        self.register(TextCodec())
+
+    def register(self, codec, types=None):
+        if len(codec.tag) != 1 or codec.tag in NUMBER_TAGS or \
+                codec.tag in (PICKLE_TAG, COMPRESSED_TAG):
+            raise ValueError('%r can not be used as a tag' % codec.tag)
+
+        self._by_tag[codec.tag] = codec
+        for t in (codec.types if types is None else types):
+            self._by_type[t] = codec
+
+    def dumps(self, obj):
+        cls = obj.__class__
+        if cls is int:
+            return str(obj).encode('ascii')
+        if cls is float and not math.isinf(obj) and not math.isnan(obj):
+            return repr(obj).encode('ascii')
+
+        codec = self._by_type.get(cls)
+        if codec is not None:
+            try:
+                return codec.tag + codec.encode(obj)
+            except (TypeError, ValueError, OverflowError):
+                # e.g. a dict holding a set or a datetime
+                pass
+
+        return pickle.dumps(obj, self.protocol)
+
+    def loads(self, data):
+        """data may be any bytes-like object
+        """
+        tag = bytes(data[:1])
+        if tag in NUMBER_TAGS:
+            data = bytes(data)
+            if b'.' in data or b'e' in data:
+                return float(data)
+            return int(data)
+
+        codec = self._by_tag.get(tag)
+        if codec is not None:
+            return codec.decode(data[1:])
+
+        return pickle.loads(data)
+
+
+def default_registry():
+    """CodecRegistry with msgpack for dict and list values when it is installed
+    """
+    registry = CodecRegistry()
+    if msgpack is not None:
+        registry.register(MsgpackCodec(), (dict, list))
+    return registry
@@ -0,0 +1,347 @@
+#-*- coding:utf-8 -*-
+from __future__ import absolute_import, division, print_function, with_statement
+
+import os
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import tempfile
+import threading
+
+try:
+    import cPickle as pickle
+except Exception as e:
+    import pickle
+
+from smartcache.object_cache import DataObject, ObjectCache
+
+MAGIC = b'SCSHM001'
+
+# magic, slots, slot_size, count, evictions, expirations
+HEADER = struct.Struct('<8sIIIQQ')
+HEADER_SIZE = 64
+
+# seq, state, key hash, expire, last_update_atime, key length, value length
+SLOT = struct.Struct('<IB3xQddHI2x')
+SEQ = struct.Struct('<I')
+
+EMPTY, USED, DELETED = 0, 1, 2
+
+# slots probed from the home slot before the oldest one is evicted
+MAX_PROBE = 16
+
+# seqlock retries before a reader yields its time slice
+SPIN = 100
+
+# seqlock retries before a slot is read as deleted: its writer was killed
+# between the two sequence stores and left it odd
+MAX_SPINS = 100 * SPIN
+
+# what a reader sees of a slot left odd by a killed writer
+TORN_SLOT = (1, DELETED, 0, 0.0, 0.0, 0, 0)
+
+
+def shm_dir():
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+def key_hash(kb):
+    return struct.unpack('<Q', hashlib.md5(kb).digest()[:8])[0]
+
+
+class SharedStore(object):
+
+    """
+    fixed size open-addressing table in an mmap'd file shared by every
+    process that opens the same path, e.g. pre-fork workers.
+
+    Writers serialize on a process lock plus an fcntl lock of the file and
+    bump the slot sequence to odd while they write. Readers take no lock: a
+    slot is copied and used only if its sequence was even and unchanged
+    across the copy. A slot left odd by a writer killed mid-write reads as
+    deleted and is made even again by the next write to it.
+
+    Keys and values are pickled, an entry must fit in slot_size bytes.
+    """
+
+    def __init__(self, path, slots=65536, slot_size=1024):
+        if slot_size <= SLOT.size:
+            raise ValueError('slot_size must be larger than %s' % SLOT.size)
+
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.hits = 0
+        self.misses = 0
+        self._reap_cursor = 0
+        self._lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        self._pid = os.getpid()
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = HEADER_SIZE + self.slots * self.slot_size
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            current = os.fstat(self._fd).st_size
+            if current == 0:
+                os.ftruncate(self._fd, size)
+                # no os.pwrite on python 2, the file lock guards the offset
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                os.write(self._fd, HEADER.pack(MAGIC, self.slots, self.slot_size, 0, 0, 0))
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                magic, slots, slot_size = HEADER.unpack(os.read(self._fd, HEADER.size))[:3]
+                if magic != MAGIC or (slots, slot_size) != (self.slots, self.slot_size):
+                    raise ValueError('%s holds a different cache layout' % self.path)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        self._mm = mmap.mmap(self._fd, size)
+
+    def _check_fork(self):
+        # fcntl locks belong to the process and a thread lock held at fork
+        # time would never be released in the child
+        if self._pid != os.getpid():
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+
+    def _write_lock(self):
+        self._check_fork()
+        return _WriteLock(self)
+
+    def close(self):
+        self._mm.close()
+        os.close(self._fd)
+
+    def unlink(self):
+        self.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def _offset(self, index):
+        return HEADER_SIZE + index * self.slot_size
+
+    def _read_slot(self, off, locked=False):
+        """seqlock read, returns the slot header and its key and value bytes.
+        With locked the caller holds the write lock and an odd sequence can
+        only be a torn slot.
+        """
+        mm = self._mm
+        spins = 0
+        while True:
+            seq = SEQ.unpack_from(mm, off)[0]
+            if not seq & 1:
+                slot = SLOT.unpack_from(mm, off)
+                start = off + SLOT.size
+                data = mm[start:start + slot[5] + slot[6]] if slot[1] == USED else b''
+                if SEQ.unpack_from(mm, off)[0] == seq:
+                    return slot, data
+            elif locked:
+                return TORN_SLOT, b''
+            spins += 1
+            if spins >= MAX_SPINS:
+                return TORN_SLOT, b''
+            if spins % SPIN == 0:
+                time.sleep(0)
+
+    def _find(self, kb, h, locked=False):
+        """probe for kb
+        :returns (slot index, slot, data) of the key, or (None, None, None)
+        """
+        home = h % self.slots
+        for probe in range(MAX_PROBE):
+            index = (home + probe) % self.slots
+            slot, data = self._read_slot(self._offset(index), locked)
+            if slot[1] == EMPTY:
+                break
+            if slot[1] == USED and slot[2] == h and data[:slot[5]] == kb:
+                return index, slot, data
+        return None, None, None
+
+    def _write_slot(self, index, state, h=0, expire=0.0, updated=0.0, kb=b'', vb=b''):
+        mm = self._mm
+        off = self._offset(index)
+        seq = SEQ.unpack_from(mm, off)[0]
+        if seq & 1:
+            # torn by a killed writer, restore the parity
+            seq += 1
+        SEQ.pack_into(mm, off, (seq + 1) & 0xffffffff)
+        if state == USED:
+            start = off + SLOT.size
+            mm[start:start + len(kb) + len(vb)] = kb + vb
+        SLOT.pack_into(mm, off, (seq + 1) & 0xffffffff, state, h, expire, updated, len(kb), len(vb))
+        SEQ.pack_into(mm, off, (seq + 2) & 0xffffffff)
+
+    def _header(self):
+        return list(HEADER.unpack_from(self._mm, 0))
+
+    def _bump(self, count=0, evictions=0, expirations=0):
+        header = self._header()
+        header[3] += count
+        header[4] += evictions
+        header[5] += expirations
+        HEADER.pack_into(self._mm, 0, *header)
+
+    def __len__(self):
+        return self._header()[3]
+
+    def __contains__(self, key):
+        kb = pickle.dumps(key, 2)
+        index, slot, data = self._find(kb, key_hash(kb))
+        return index is not None and time.time() - slot[4] <= slot[3]
+
+    def get(self, key, default=None):
+        kb = pickle.dumps(key, 2)
+        index, slot, data = self._find(kb, key_hash(kb))
+        if index is None or time.time() - slot[4] > slot[3]:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        return pickle.loads(data[slot[5]:])
+
+    def set(self, key, value, expire):
+        kb = pickle.dumps(key, 2)
+        vb = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if SLOT.size + len(kb) + len(vb) > self.slot_size:
+            raise ValueError('%s is too large for slot_size %s' % (key, self.slot_size))
+
+        h = key_hash(kb)
+        now = time.time()
+        with self._write_lock():
+            index, reuse, oldest, oldest_time = None, None, None, None
+            home = h % self.slots
+            for probe in range(MAX_PROBE):
+                i = (home + probe) % self.slots
+                slot = SLOT.unpack_from(self._mm, self._offset(i))
+                state = slot[1] if not slot[0] & 1 else DELETED
+                if state == USED and slot[2] == h and self._key_bytes(i, slot) == kb:
+                    index = i
+                    break
+                if state == USED and now - slot[4] > slot[3]:
+                    state = DELETED
+                    self._bump(count=-1, expirations=1)
+                    self._write_slot(i, DELETED)
+                if state != USED and reuse is None:
+                    reuse = i
+                if state == EMPTY:
+                    break
+                if state == USED and (oldest_time is None or slot[4] < oldest_time):
+                    oldest, oldest_time = i, slot[4]
+
+            if index is None:
+                if reuse is not None:
+                    index = reuse
+                    self._bump(count=1)
+                else:
+                    index = oldest
+                    self._bump(evictions=1)
+
+            self._write_slot(index, USED, h, expire, now, kb, vb)
+
+    def _key_bytes(self, index, slot):
+        start = self._offset(index) + SLOT.size
+        return self._mm[start:start + slot[5]]
+
+    def pop(self, key):
+        kb = pickle.dumps(key, 2)
+        h = key_hash(kb)
+        with self._write_lock():
+            index, slot, data = self._find(kb, h, locked=True)
+            if index is None:
+                return None
+            self._write_slot(index, DELETED)
+            self._bump(count=-1)
+            return pickle.loads(data[slot[5]:])
+
+    def clear(self):
+        with self._write_lock():
+            for index in range(self.slots):
+                if self._mm[self._offset(index) + 4] != EMPTY:
+                    self._write_slot(index, EMPTY)
+            header = self._header()
+            header[3] = 0
+            HEADER.pack_into(self._mm, 0, *header)
+
+    def reap(self, steps=None):
+        """remove expired entries, scanning at most steps slots from where
+        the previous call stopped when given
+        """
+        now = time.time()
+        reaped = 0
+        steps = self.slots if steps is None else min(steps, self.slots)
+        with self._write_lock():
+            start, self._reap_cursor = self._reap_cursor, (self._reap_cursor + steps) % self.slots
+            for n in range(steps):
+                index = (start + n) % self.slots
+                slot = SLOT.unpack_from(self._mm, self._offset(index))
+                if slot[1] == USED and not slot[0] & 1 and now - slot[4] > slot[3]:
+                    self._write_slot(index, DELETED)
+                    reaped += 1
+            if reaped:
+                self._bump(count=-reaped, expirations=reaped)
+        return reaped
+
+    def configure(self, max_entries=None, max_bytes=None, segments=None):
+        if max_entries or max_bytes or segments:
+            raise ValueError('shared store is bounded by its slots and slot_size')
+
+    def items(self):
+        """snapshot of (key, DataObject) pairs
+        """
+        result = []
+        for index in range(self.slots):
+            slot, data = self._read_slot(self._offset(index))
+            if slot[1] == USED:
+                key = pickle.loads(data[:slot[5]])
+                obj = DataObject(key, pickle.loads(data[slot[5]:]), slot[3])
+                obj.last_update_atime = slot[4]
+                result.append((key, obj))
+        return result
+
+    def stats(self):
+        magic, slots, slot_size, count, evictions, expirations = self._header()
+        return {
+            'entries': count,
+            'bytes': HEADER_SIZE + slots * slot_size,
+            'slots': slots,
+            'slot_size': slot_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': evictions,
+            'expirations': expirations,
+        }
+
+
+class _WriteLock(object):
+
+    def __init__(self, store):
+        self.store = store
+
+    def __enter__(self):
+        self.store._lock.acquire()
+        fcntl.lockf(self.store._fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *args):
+        fcntl.lockf(self.store._fd, fcntl.LOCK_UN)
+        self.store._lock.release()
+
+
+class SharedCache(ObjectCache):
+
+    """
+    ObjectCache over a SharedStore, every process on the host opening the
+    same name shares one copy of the data
+
+    ::code-block
+        cache = SharedCache('pages', slots=1 << 16, slot_size=4096)
+        cache.set('home', html, expire=60)
+    """
+
+    def __init__(self, name, slots=65536, slot_size=1024, path=None, expire=24*3600):
+        path = path or os.path.join(shm_dir(), 'smartcache-%s' % name)
+        super(SharedCache, self).__init__(name, expire=expire, store=SharedStore(path, slots, slot_size))
@@ -0,0 +1,209 @@
+#-*- coding:utf-8 -*-
+
+import time
+import asyncio
+import warnings
+import unittest
+
+from smartcache.bloom import BloomFilter
+from smartcache.counters import CounterBuffer
+from smartcache.redis_cache import Cache
+from smartcache.async_cache import async_connections, AsyncCache, AsyncShardCache, AsyncMasterSlaveCache, OFFLOAD_BYTES
+from smartcache.test.shard_cache_test import servers as shard_servers
+from smartcache.test.master_slave_cache_test import servers as master_slave_servers
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class AsyncCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cc = AsyncCache()
+        self.key = str(time.time())
+
+    def tearDown(self):
+        run(AsyncCache().delete_many([self.key, self.key + '_list', self.key + '_set', self.key + '_zset']))
+
+    def test_set_get(self):
+        async def main():
+            await self.cc.set(self.key, {'a': 1})
+            self.assertEqual(await self.cc.get(self.key), {'a': 1})
+            self.assertTrue(await self.cc.exists(self.key))
+            self.assertEqual(await self.cc.ttl(self.key), -1)
+            self.assertEqual(await self.cc.delete(self.key), 1)
+            self.assertEqual(await self.cc.get(self.key), None)
+        run(main())
+
+    def test_write_commands(self):
+        async def main():
+            self.cc.invalidation_channel = 'smartcache:test:%s' % self.key
+            self.assertEqual(await self.cc.inc(self.key, 2), 2)
+            self.assertEqual(await self.cc.append(self.key, '1'), 2)
+            self.assertTrue(await self.cc.rename(self.key, self.key + '_list'))
+            self.assertEqual(await self.cc.get_connection().get(self.key + '_list'), b'21')
+        run(main())
+
+    def test_rebuild_bloom(self):
+        async def main():
+            self.cc.bloom = BloomFilter(1000)
+            await self.cc.set(self.key, 1)
+            self.cc.bloom.clear()
+            self.assertFalse(await self.cc.exists(self.key))
+            await self.cc.rebuild_bloom()
+            self.assertTrue(await self.cc.exists(self.key))
+        run(main())
+
+    def test_warmup(self):
+        async def main():
+            with warnings.catch_warnings():
+                warnings.simplefilter('error')
+                self.assertEqual(await async_connections.warmup('127.0.0.1', 6379, 0, connections=2), 2)
+        run(main())
+
+    def test_large_value(self):
+        async def main():
+            value = u'x' * OFFLOAD_BYTES
+            await self.cc.set(self.key, value)
+            self.assertEqual(await self.cc.get(self.key), value)
+        run(main())
+
+    def test_many(self):
+        async def main():
+            names = ['%s_%s' % (self.key, i) for i in range(20)]
+            await self.cc.set_many(dict((name, i) for i, name in enumerate(names)), chunk_size=7)
+            result = await self.cc.get_many(names + [self.key + '_missing'], chunk_size=7)
+            self.assertEqual(result, dict((name, i) for i, name in enumerate(names)))
+            self.assertEqual(await self.cc.delete_many(names, chunk_size=7), 20)
+        run(main())
+
+    def test_hash(self):
+        async def main():
+            await self.cc.hash(self.key, 'a', 1)
+            await self.cc.hash(self.key, 'b', [2])
+            self.assertEqual(await self.cc.hash(self.key, 'b'), [2])
+            self.assertEqual(await self.cc.size(self.key), 2)
+            self.assertTrue(await self.cc.contains(self.key, 'a'))
+            self.assertEqual(len(await self.cc.hash(self.key)), 2)
+        run(main())
+
+    def test_collections(self):
+        async def main():
+            await self.cc.rupdate(self.key + '_list', [1, 2, 3])
+            self.assertEqual(await self.cc.list(self.key + '_list', limit=3), [1, 2, 3])
+            self.assertEqual(await self.cc.lpop(self.key + '_list'), 1)
+
+            await self.cc.update_set(self.key + '_set', [1, 2])
+            self.assertEqual(sorted(await self.cc.members(self.key + '_set', with_all=True)), [1, 2])
+            self.assertTrue(await self.cc.contains(self.key + '_set', 1))
+            self.assertEqual(await self.cc.pop_member(self.key + '_set', 1), 1)
+
+            await self.cc.update_sortedset(self.key + '_zset', [('a', 2), ('b', 1)])
+            self.assertEqual(await self.cc.sortedset_members(self.key + '_zset', limit=2), ['b', 'a'])
+            self.assertEqual(await self.cc.pop_member(self.key + '_zset', ['a', 'b']), 2)
+        run(main())
+
+    def test_scan_db(self):
+        async def main():
+            await self.cc.set(self.key, 1)
+            keys = []
+            async for batch in self.cc.scan_db():
+                keys.extend(batch)
+            self.assertTrue(self.key.encode('utf-8') in keys)
+        run(main())
+
+    def test_scan_type(self):
+        async def main():
+            await self.cc.set(self.key + '_list', 1)
+            await self.cc.update_set(self.key + '_set', [1, 2])
+            return [k async for k in self.cc.scan(self.key + '_*', count=7, type='set')]
+        self.assertEqual(run(main()), [(self.key + '_set').encode('utf-8')])
+
+    def test_large(self):
+        async def main():
+            value = dict(('row%s' % i, u'x' * 100) for i in range(1000))
+            await self.cc.set_large(self.key, value, chunk_size=4096)
+            self.assertEqual(await self.cc.get_large(self.key), value)
+            chunks = [chunk async for chunk in self.cc.iter_large(self.key)]
+            self.assertEqual(self.cc.loads(b''.join(chunks)), value)
+            await self.cc.delete_large(self.key)
+        run(main())
+
+    def test_iter_collections(self):
+        async def main():
+            await self.cc.update_set(self.key + '_set', list(range(100)))
+            for i in range(100):
+                await self.cc.hash(self.key, 'f%s' % i, i)
+            for prefetch in (False, True):
+                members = [m async for m in self.cc.iter_set(self.key + '_set', count=10, prefetch=prefetch)]
+                self.assertEqual(sorted(members), list(range(100)))
+                fields = dict([p async for p in self.cc.iter_hash(self.key, count=10, prefetch=prefetch)])
+                self.assertEqual(len(fields), 100)
+        run(main())
+
+    def test_get_or_set(self):
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'value'
+
+        async def main():
+            values = await asyncio.gather(*[self.cc.get_or_set(self.key, loader, ttl=10) for i in range(5)])
+            self.assertEqual(values, ['value'] * 5)
+            self.assertEqual(len(calls), 1)
+        run(main())
+
+    def test_refresh_task(self):
+        async def main():
+            await self.cc.get_or_set(self.key, lambda: 1, ttl=10, soft_ttl=0.01)
+            await asyncio.sleep(0.02)
+            self.assertEqual(await self.cc.get_or_set(self.key, lambda: 2, ttl=10, soft_ttl=10), 1)
+            self.assertEqual(len(self.cc._tasks), 1)
+            for i in range(100):
+                if not self.cc._tasks:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(len(self.cc._tasks), 0)
+            self.assertEqual(await self.cc.get_or_set(self.key, lambda: 3, ttl=10), 2)
+        run(main())
+
+    def test_counters(self):
+        async def main():
+            self.assertEqual(await self.cc.set(self.key, 1), None)
+            self.assertEqual(await self.cc.inc(self.key + '_list', 2), 2)
+            self.assertEqual(await self.cc.hinc(self.key + '_set', 'f', 3), 3)
+            self.assertEqual(await self.cc.inc_score(self.key + '_zset', 'a', 4), 4.0)
+
+            counters = CounterBuffer(Cache(), interval=0)
+            self.cc.counters = counters
+            self.assertEqual(await self.cc.inc(self.key + '_list'), None)
+            self.assertEqual(await self.cc.hinc(self.key + '_set', 'f'), None)
+            self.assertEqual(counters.stats()['pending'], 2)
+            counters.flush()
+            self.assertEqual(await self.cc.get_connection().get(self.key + '_list'), b'3')
+        run(main())
+
+    def test_shard_master_slave(self):
+        async def main():
+            for cc in (AsyncShardCache(shard_servers), AsyncMasterSlaveCache(master_slave_servers)):
+                names = ['%s_%s' % (self.key, i) for i in range(10)]
+                await cc.set(names[0], 'a')
+                self.assertEqual(await cc.get(names[0]), 'a')
+                await cc.set_many(dict((name, name) for name in names))
+                self.assertEqual(await cc.get_many(names), dict((name, name) for name in names))
+                scanned = [key async for key in cc.scan(self.key + '_*')]
+                self.assertEqual(sorted(set(scanned)), sorted(name.encode('utf-8') for name in names))
+                batches = [key async for batch in cc.scan_db() for key in batch]
+                self.assertTrue(names[0].encode('utf-8') in batches)
+                self.assertEqual(await cc.delete_many(names), 10)
+        run(main())
+
+if __name__ == '__main__':
+    unittest.main()
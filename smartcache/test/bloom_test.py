@@ -0,0 +1,130 @@
+#-*- coding:utf-8 -*-
+
+import time
+import unittest
+
+from smartcache.bloom import BloomFilter, ScalableBloomFilter
+from smartcache.redis_cache import Cache
+
+
+class BloomFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.key = str(time.time())
+
+    def test_add_contains(self):
+        bf = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bf.add('%s_%s' % (self.key, i))
+        for i in range(1000):
+            self.assertTrue('%s_%s' % (self.key, i) in bf)
+        false_positives = sum(1 for i in range(1000) if 'missing_%s' % i in bf)
+        self.assertTrue(false_positives < 50)
+        self.assertTrue(self.key.encode('utf-8') not in bf or self.key in bf)
+
+    def test_scalable(self):
+        bf = ScalableBloomFilter(capacity=100)
+        for i in range(1000):
+            bf.add(i)
+        self.assertTrue(len(bf.filters) > 1)
+        for i in range(1000):
+            self.assertTrue(i in bf)
+
+    def test_repeated_add(self):
+        bf = ScalableBloomFilter(capacity=100)
+        for i in range(20000):
+            bf.add('hot')
+        self.assertEqual(len(bf.filters), 1)
+        self.assertEqual(bf.stats()['count'], 1)
+        self.assertFalse(bf.filters[0].add('hot'))
+
+    def test_rebuild(self):
+        bf = BloomFilter(1000)
+        bf.add('old')
+        bf.add('deleted')
+
+        def keys():
+            yield 'old'
+            # reads during the rebuild still see the previous bits
+            self.assertTrue('deleted' in bf)
+            bf.add('written')
+            yield 'new'
+
+        bf.rebuild(keys())
+        self.assertTrue('old' in bf and 'new' in bf and 'written' in bf)
+        self.assertFalse('deleted' in bf)
+
+        sbf = ScalableBloomFilter(capacity=10)
+        sbf.add('deleted')
+        sbf.rebuild(str(i) for i in range(100))
+        self.assertTrue(all(str(i) in sbf for i in range(100)))
+        self.assertTrue(len(sbf.filters) > 1)
+
+    def test_redis_bitmap(self):
+        cc = Cache()
+        conn = cc.master_connection()
+        name = self.key + ':bloom'
+        first, second = BloomFilter(100), BloomFilter(100)
+        first.add('a')
+        second.add('b')
+        try:
+            first.save(conn, name)
+            pos = first._positions('a')[0]
+            self.assertEqual(conn.getbit(name, pos), 1)
+            second.sync(conn, name)
+            self.assertTrue('a' in second and 'b' in second)
+            loaded = BloomFilter(100)
+            self.assertTrue(loaded.load(conn, name))
+            self.assertTrue('a' in loaded and 'b' in loaded)
+        finally:
+            conn.delete(name)
+
+    def test_cache_guard(self):
+        cc = Cache()
+        cc.bloom = BloomFilter(1000)
+        try:
+            self.assertEqual(cc.get(self.key), None)
+            self.assertFalse(cc.exists(self.key))
+            self.assertEqual(cc.bloom.stats()['negatives'], 2)
+            cc.set(self.key, self.key)
+            self.assertEqual(cc.get(self.key), self.key)
+            self.assertTrue(cc.exists(self.key))
+
+            cc.bloom.clear()
+            self.assertFalse(cc.exists(self.key))
+            cc.rebuild_bloom()
+            self.assertTrue(cc.exists(self.key))
+        finally:
+            cc.delete(self.key)
+
+    def test_stale_copy(self):
+        cc = Cache()
+        cc.bloom = BloomFilter(1000)
+        try:
+            self.assertEqual(cc.get_or_set(self.key, lambda: 1, stale_ttl=60), 1)
+            cc.delete(self.key)
+            token = cc.acquire_lock(self.key + ':lock')
+            self.assertEqual(cc.get_or_set(self.key, lambda: 2, stale_ttl=60, wait=0), 1)
+            cc.release_lock(self.key + ':lock', token)
+        finally:
+            cc.delete_many([self.key, self.key + ':stale'])
+
+    def test_pipeline_guard(self):
+        cc = Cache()
+        cc.bloom = BloomFilter(1000)
+        try:
+            cc.set(self.key, self.key)
+            with cc.pipeline() as p:
+                missing = p.get(self.key + ':missing')
+                absent = p.exists(self.key + ':missing')
+                found = p.get(self.key)
+                checked = missing.then(lambda value: value is None)
+            self.assertEqual(missing.value, None)
+            self.assertEqual(absent.value, False)
+            self.assertEqual(found.value, self.key)
+            self.assertTrue(checked.value)
+        finally:
+            cc.delete(self.key)
+
+if __name__ == '__main__':
+    unittest.main()
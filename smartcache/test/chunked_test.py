@@ -0,0 +1,86 @@
+#-*- coding:utf-8 -*-
+
+import time
+import unittest
+
+from redis.exceptions import ResponseError
+
+from smartcache.chunked import Manifest, ChunkMissing
+from smartcache.redis_cache import Cache
+
+
+class ChunkedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cc = Cache()
+        self.key = str(time.time())
+        self.value = dict(('row%s' % i, u'x' * 100) for i in range(1000))
+
+    def tearDown(self):
+        self.cc.delete_large(self.key)
+
+    def test_manifest(self):
+        manifest = Manifest.new(10, 4)
+        self.assertEqual(manifest.chunks, 3)
+        copy = Manifest.unpack(manifest.pack())
+        self.assertEqual((copy.version, copy.size, copy.chunk_size), (manifest.version, 10, 4))
+        self.assertEqual(Manifest.unpack(b'plain'), None)
+        self.assertEqual(Manifest.unpack(None), None)
+
+    def test_set_get(self):
+        self.cc.set_large(self.key, self.value, chunk_size=4096)
+        self.assertEqual(self.cc.get_large(self.key, window=3), self.value)
+        data = b''.join(self.cc.iter_large(self.key))
+        self.assertEqual(self.cc.loads(data), self.value)
+
+        # a plain value reads the same
+        self.cc.set(self.key, 'small')
+        self.assertEqual(self.cc.get_large(self.key), 'small')
+        self.assertEqual(self.cc.get_large(self.key + ':missing'), None)
+
+    def test_replace(self):
+        self.cc.set_large(self.key, self.value, chunk_size=4096)
+        old = Manifest.unpack(self.cc.master_connection().get(self.key))
+        self.cc.set_large(self.key, [1, 2], ttl=100, chunk_size=4096)
+        self.assertEqual(self.cc.get_large(self.key), [1, 2])
+        self.assertTrue(0 < self.cc.ttl(self.key) <= 100)
+        # chunks of the replaced value stay readable for a while
+        for key in old.chunk_keys(self.key):
+            self.assertTrue(self.cc.ttl(key) > 0)
+        self.cc.delete_many(old.chunk_keys(self.key))
+
+    def test_failed_chunk_write(self):
+        self.cc.set_large(self.key, self.value, chunk_size=4096)
+        chunks = self.cc.scan(self.key + ':chunk:*').count()
+        pipeline = self.cc._Cache__pipeline
+
+        class FailingPipeline(object):
+            def __init__(self, pipe):
+                self.pipe = pipe
+
+            def __getattr__(self, name):
+                return getattr(self.pipe, name)
+
+            def execute(self):
+                self.pipe.execute()
+                raise ResponseError('OOM command not allowed when used memory > maxmemory')
+
+        self.cc._Cache__pipeline = lambda **kwargs: FailingPipeline(pipeline(**kwargs))
+        with self.assertRaises(ResponseError):
+            self.cc.set_large(self.key, {'new': 1}, chunk_size=4096)
+        del self.cc._Cache__pipeline
+
+        self.assertEqual(self.cc.get_large(self.key), self.value)
+        self.assertEqual(self.cc.scan(self.key + ':chunk:*').count(), chunks)
+
+    def test_missing_chunk(self):
+        self.cc.set_large(self.key, self.value, chunk_size=4096)
+        manifest = Manifest.unpack(self.cc.master_connection().get(self.key))
+        self.cc.delete(manifest.chunk_keys(self.key)[1])
+        self.assertEqual(self.cc.get_large(self.key), None)
+        with self.assertRaises(ChunkMissing):
+            list(self.cc.iter_large(self.key))
+        self.assertEqual(self.cc.delete_large(self.key), manifest.chunks)
+
+if __name__ == '__main__':
+    unittest.main()
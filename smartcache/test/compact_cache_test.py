@@ -0,0 +1,69 @@
+#-*- coding:utf-8 -*-
+
+import os
+import time
+import unittest
+import tempfile
+
+from smartcache.compact_cache import CompactCache
+from smartcache.object_cache import ObjectCache
+
+
+class CompactCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.key = str(time.time())
+        self.cc = CompactCache(capacity=8)
+
+    def test_get_set(self):
+        self.assertEqual(self.cc.get(self.key), None)
+        self.cc.set(self.key, self.key)
+        self.assertTrue(self.cc.exists(self.key))
+        self.assertEqual(self.cc.get(self.key), self.key)
+        self.cc.set(self.key, None)
+        self.assertEqual(self.cc.get(self.key, 1), None)
+        self.cc.delete(self.key)
+        self.assertFalse(self.cc.exists(self.key))
+        self.assertEqual(len(self.cc), 0)
+
+    def test_grow(self):
+        for i in range(10000):
+            self.cc.set(i, str(i))
+        for i in range(0, 10000, 2):
+            self.cc.delete(i)
+        for i in range(10000):
+            self.assertEqual(self.cc.get(i), None if i % 2 == 0 else str(i))
+        self.assertEqual(len(self.cc), 5000)
+
+    def test_expire(self):
+        for i in range(100):
+            self.cc.set(i, i, expire=0.01)
+        self.cc.set(self.key, self.key)
+        time.sleep(0.05)
+        self.assertEqual(self.cc.get(0), None)
+        self.cc.reap()
+        self.assertEqual(len(self.cc), 1)
+        self.assertEqual(self.cc.stats()['expirations'], 100)
+
+    def test_eviction(self):
+        self.cc.configure(max_entries=100)
+        for i in range(1000):
+            self.cc.set(i, i)
+        self.assertEqual(len(self.cc), 100)
+        self.assertEqual(self.cc.get(999), 999)
+        self.assertEqual(self.cc.stats()['evictions'], 900)
+
+    def test_snapshot(self):
+        path = os.path.join(tempfile.mkdtemp(), 'snapshot')
+        self.cc.set(self.key, [self.key])
+        self.assertEqual(self.cc.dump(path), 1)
+        other = ObjectCache()
+        other.load(path)
+        self.assertEqual(other.get(self.key), [self.key])
+        restored = CompactCache()
+        restored.load(path)
+        self.assertEqual(restored.get(self.key), [self.key])
+        os.remove(path)
+
+if __name__ == '__main__':
+    unittest.main()
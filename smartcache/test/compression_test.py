@@ -0,0 +1,65 @@
+#-*- coding:utf-8 -*-
+
+import time
+import pickle
+import unittest
+
+from smartcache.compression import Compressor, ZlibCodec, LzmaCodec, lzma, decompress, is_compressed
+from smartcache.redis_cache import Cache
+
+
+class CompressorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cc = Cache()
+        self.key = str(time.time())
+        self.large = pickle.dumps(u'<div>fragment</div>' * 1000)
+
+    def tearDown(self):
+        self.cc.delete(self.key)
+
+    def test_threshold(self):
+        compressor = Compressor(threshold=1024)
+        self.assertEqual(compressor.compress('page', b'small'), b'small')
+        data = compressor.compress('page', self.large)
+        self.assertTrue(is_compressed(data))
+        self.assertTrue(len(data) < len(self.large))
+        self.assertEqual(compressor.decompress(data), self.large)
+        self.assertEqual(decompress(data), self.large)
+        self.assertEqual(decompress(b'plain'), b'plain')
+
+        stats = compressor.stats()
+        self.assertEqual(stats['compressed'], 1)
+        self.assertEqual(stats['decompressed'], 1)
+        self.assertTrue(stats['ratio'] > 1)
+
+    def test_policies(self):
+        policies = {'raw:': (None, 0), 'raw:zip:': (ZlibCodec(9), 10)}
+        if lzma is not None:
+            policies['html:'] = (LzmaCodec(), 10)
+        compressor = Compressor(policies=policies)
+        self.assertFalse(is_compressed(compressor.compress('raw:page', self.large)))
+        self.assertTrue(is_compressed(compressor.compress('raw:zip:page', self.large)))
+        if lzma is not None:
+            data = compressor.compress('html:page', self.large)
+            self.assertEqual(data[2:3], LzmaCodec.id)
+            self.assertEqual(decompress(data), self.large)
+
+    def test_cache(self):
+        value = u'<div>fragment</div>' * 1000
+        self.cc.compressor = Compressor()
+        self.cc.set(self.key, value)
+        self.assertTrue(is_compressed(self.cc.master_connection().get(self.key)))
+        self.assertEqual(self.cc.get(self.key), value)
+        self.assertEqual(self.cc.get_many([self.key]), {self.key: value})
+
+        # readers without a compressor still decode the value
+        self.assertEqual(Cache().get(self.key), value)
+
+        # compression stays out of dumps and loads
+        self.assertEqual(self.cc.dumps(value), pickle.dumps(value))
+        self.assertEqual(self.cc.loads(self.cc.dumps(value)), value)
+        self.assertRaises(Exception, self.cc.loads, self.cc.master_connection().get(self.key))
+
+if __name__ == '__main__':
+    unittest.main()
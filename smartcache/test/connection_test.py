@@ -0,0 +1,108 @@
+#-*- coding:utf-8 -*-
+
+import os
+import pickle
+import warnings
+import unittest
+
+from smartcache.connection import ConnectionManager, connections
+from smartcache.redis_cache import Cache
+
+
+class Recorder(object):
+
+    def __init__(self, role, calls):
+        self.role = role
+        self.calls = calls
+
+    def __getattr__(self, command):
+        def call(*args, **kwargs):
+            self.calls.append((self.role, command))
+        return call
+
+
+class ConnectionManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = ConnectionManager()
+
+    def tearDown(self):
+        self.manager.disconnect()
+
+    def test_client_per_endpoint(self):
+        client = self.manager.client('127.0.0.1', 6379, 0)
+        self.assertTrue(self.manager.client('127.0.0.1', 6379, 0) is client)
+        self.assertFalse(self.manager.client('127.0.0.1', 6379, 1) is client)
+
+        self.manager.configure(max_connections=4)
+        self.assertFalse(self.manager.client('127.0.0.1', 6379, 0) is client)
+
+    def test_warmup(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            self.assertEqual(self.manager.warmup('127.0.0.1', 6379, 0, connections=2), 2)
+
+    def test_pid_change(self):
+        client = self.manager.client('127.0.0.1', 6379, 0)
+        # as seen by a child forked without register_at_fork
+        self.manager._pid = -1
+        self.assertFalse(self.manager.client('127.0.0.1', 6379, 0) is client)
+        self.assertEqual(self.manager._pid, os.getpid())
+
+    @unittest.skipIf(not hasattr(os, 'fork'), 'needs fork')
+    def test_fork(self):
+        client = self.manager.client('127.0.0.1', 6379, 0)
+        pool_id = id(client.connection_pool)
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                child = self.manager.client('127.0.0.1', 6379, 0)
+                os.write(write, pickle.dumps((child is client, id(child.connection_pool) == pool_id)))
+            finally:
+                os._exit(0)
+
+        os.close(write)
+        data = b''
+        chunk = os.read(read, 1024)
+        while chunk:
+            data += chunk
+            chunk = os.read(read, 1024)
+        os.close(read)
+        os.waitpid(pid, 0)
+        self.assertEqual(pickle.loads(data), (False, False))
+        self.assertTrue(self.manager.client('127.0.0.1', 6379, 0) is client)
+
+
+class DispatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.cc = Cache()
+        master, slave = Recorder('master', self.calls), Recorder('slave', self.calls)
+        self.cc.master_connection = lambda: master
+        self.cc.slave_connection = lambda: slave
+
+    def test_read_write(self):
+        self.cc.get('a')
+        self.cc.set('a', 1)
+        self.cc.exists('a')
+        self.cc.delete('a')
+        self.assertEqual(self.calls, [('slave', 'get'), ('master', 'set'), ('slave', 'exists'), ('master', 'delete')])
+
+    def test_dispatch_table(self):
+        self.cc.get('a')
+        self.assertTrue('_Cache__get' in self.cc.__dict__)
+        self.cc.inject_connection(lambda: None)
+        self.assertFalse('_Cache__get' in self.cc.__dict__)
+
+    def test_dispatch_after_fork(self):
+        self.cc.get('a')
+        self.assertTrue(self.cc in connections._caches)
+        manager = ConnectionManager()
+        manager.track(self.cc)
+        manager._after_fork()
+        self.assertFalse('_Cache__get' in self.cc.__dict__)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+#-*- coding:utf-8 -*-
+
+import gc
+import time
+import weakref
+import unittest
+
+from redis.exceptions import ConnectionError
+
+from smartcache import counters as counters_module
+from smartcache.counters import CounterBuffer
+from smartcache.redis_cache import Cache, ShardCache, MasterSlaveCache
+from smartcache.test.shard_cache_test import servers
+from smartcache.test.master_slave_cache_test import servers as master_slave_servers
+
+
+class CounterBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cc = Cache()
+        self.key = 'counter%s' % time.time()
+        self.counters = CounterBuffer(self.cc, interval=0)
+
+    def tearDown(self):
+        self.cc.delete(self.key)
+        self.cc.delete(self.key + ':hash')
+
+    def test_coalesce(self):
+        for i in range(100):
+            self.counters.inc(self.key)
+            self.counters.hinc(self.key + ':hash', 'a', 2)
+        self.assertEqual(self.cc.get_connection().get(self.key), None)
+        self.assertEqual(self.counters.stats()['pending'], 2)
+
+        self.assertEqual(self.counters.flush(), 2)
+        self.assertEqual(int(self.cc.get_connection().get(self.key)), 100)
+        self.assertEqual(int(self.cc.get_connection().hget(self.key + ':hash', 'a')), 200)
+
+        stats = self.counters.stats()
+        self.assertEqual(stats['added'], 200)
+        self.assertEqual(stats['sent'], 2)
+        self.assertEqual(stats['coalesced'], 198)
+        self.assertEqual(stats['pending'], 0)
+        self.assertEqual(self.counters.flush(), 0)
+
+    def test_thresholds(self):
+        counters = CounterBuffer(self.cc, interval=0, max_pending=2)
+        counters.inc(self.key, 5)
+        counters.inc(self.key, -5)
+        self.assertEqual(counters.stats()['pending'], 1)
+        counters.hinc(self.key + ':hash', 'a')
+        self.assertEqual(counters.stats()['pending'], 0)
+        self.assertEqual(self.cc.get_connection().get(self.key), None)
+        self.assertEqual(int(self.cc.get_connection().hget(self.key + ':hash', 'a')), 1)
+
+        counters = CounterBuffer(self.cc, interval=0.05)
+        counters.inc(self.key, 3)
+        time.sleep(0.3)
+        self.assertEqual(int(self.cc.get_connection().get(self.key)), 3)
+        counters.close()
+
+    def test_cache_counters(self):
+        cc = Cache()
+        cc.counters = self.counters
+        self.assertEqual(cc.inc(self.key), None)
+        cc.inc(self.key, 2)
+        self.counters.flush()
+        self.assertEqual(int(self.cc.get_connection().get(self.key)), 3)
+        with cc.pipeline() as p:
+            value = p.inc(self.key)
+        self.assertEqual(value.value, 4)
+
+    def test_shard(self):
+        cc = ShardCache(servers)
+        counters = CounterBuffer(cc, interval=0)
+        keys = ['%s_%s' % (self.key, i) for i in range(20)]
+        try:
+            for key in keys * 3:
+                counters.inc(key)
+            for node_cache, group in counters._groups(counters._pending):
+                for counter in group:
+                    self.assertTrue(node_cache.get_connection() is cc.shard_client.get_connection(counter[1]))
+            self.assertEqual(counters.flush(), 20)
+            self.assertEqual(dict((k, int(v)) for k, v in cc.get_many(keys).items()), dict((key, 3) for key in keys))
+        finally:
+            cc.delete_many(keys)
+
+    def test_master_slave(self):
+        cc = MasterSlaveCache(master_slave_servers)
+        counters = CounterBuffer(cc, interval=0)
+        counters.inc(self.key, 2)
+        counters.hinc(self.key + ':hash', 'a')
+        self.assertEqual(counters.flush(), 2)
+        self.assertEqual(int(self.cc.get_connection().get(self.key)), 2)
+
+    def test_invalidation_not_sent(self):
+        cc = Cache()
+        cc.invalidation_channel = 'invalidate%s' % self.key
+        counters = CounterBuffer(cc, interval=0)
+        counters.inc(self.key, 2)
+        counters.inc(self.key + ':other')
+        self.assertEqual(counters.flush(), 2)
+        self.assertEqual(counters.stats()['sent'], 2)
+        self.cc.delete(self.key + ':other')
+
+    def test_exit_hooks(self):
+        counters = CounterBuffer(self.cc, interval=0.05)
+        counters.inc(self.key, 2)
+        counters_module._flush_all()
+        self.assertEqual(int(self.cc.get_connection().get(self.key)), 2)
+
+        # neither the hooks nor the flusher thread keep a buffer alive
+        ref = weakref.ref(counters)
+        del counters
+        gc.collect()
+        self.assertEqual(ref(), None)
+
+        class Down(object):
+            def pipeline(self):
+                raise ConnectionError('redis is down')
+
+        down = CounterBuffer(Down(), interval=0)
+        down.inc(self.key)
+        counters_module._flush_all()
+        self.assertEqual(down.stats()['pending'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
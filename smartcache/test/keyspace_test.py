@@ -0,0 +1,91 @@
+#-*- coding:utf-8 -*-
+
+import time
+import unittest
+
+from smartcache.keyspace import KeySpace, Key, routing_key
+from smartcache.redis_cache import Cache, ShardCache
+from smartcache.test.shard_cache_test import servers
+
+
+class KeySpaceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cc = Cache()
+        self.stamp = int(time.time() * 1000)
+        self.profiles = KeySpace('profile%s' % self.stamp, [('user_id', int), ('part', str)],
+                                 hash_tag=['user_id'], ttl=100)
+
+    def test_encode_decode(self):
+        key = self.profiles(42, u'avatar')
+        self.assertTrue(isinstance(key, Key))
+        self.assertEqual(key, ('profile%s:{42}:avatar' % self.stamp).encode('utf-8'))
+        self.assertEqual(self.profiles.parse(key), (42, u'avatar'))
+        self.assertEqual(key.fields().user_id, 42)
+        self.assertEqual(self.profiles.key(user_id=42, part=u'avatar'), key)
+        self.assertTrue(key in self.profiles)
+
+        for part in [u'a_b', u'a:b', u'{x}', u'100%', u'中文', u'']:
+            self.assertEqual(self.profiles.parse(self.profiles(-1, part)).part, part)
+
+        space = KeySpace('raw', [('data', bytes)])
+        self.assertEqual(space.parse(space(b'\x00:\xff')).data, b'\x00:\xff')
+
+        with self.assertRaises(ValueError):
+            KeySpace('a:b', [('id', int)])
+        with self.assertRaises(TypeError):
+            self.profiles(1)
+
+    def test_routing(self):
+        self.assertEqual(self.profiles(7, u'a').tag, b'7')
+        self.assertEqual(routing_key(self.profiles(7, u'a')), routing_key(self.profiles(7, u'b')))
+        self.assertEqual(routing_key('plain'), 'plain')
+
+        cc = ShardCache(servers)
+        nodes = set(cc.shard_client.get_server(self.profiles(7, u'part%s' % i)) for i in range(20))
+        self.assertEqual(len(nodes), 1)
+
+    def test_cache(self):
+        key = self.profiles(1, u'name')
+        try:
+            self.cc.set(key, u'value')
+            self.assertEqual(self.cc.get(key), u'value')
+            self.assertTrue(0 < self.cc.ttl(key) <= 100)
+            self.assertEqual(self.cc.get_or_set(self.profiles(2, u'name'), lambda: 2), 2)
+            self.assertTrue(0 < self.cc.ttl(self.profiles(2, u'name')) <= 100)
+            self.cc.set_many({self.profiles(3, u'a'): 3})
+            self.assertEqual(self.cc.get_many([self.profiles(3, u'a')]), {self.profiles(3, u'a'): 3})
+            self.cc.hash(self.profiles(4, u'h'), 'f', 1)
+            self.assertEqual(self.cc.hash(self.profiles(4, u'h'), 'f'), 1)
+            keys = set(self.cc.scan(self.profiles.pattern()))
+            self.assertEqual(len(keys), 4)
+        finally:
+            self.cc.scan(self.profiles.pattern()).unlink()
+
+    def test_get_or_set_stale(self):
+        key = self.profiles(5, u'stale')
+        try:
+            self.assertEqual(self.cc.get_or_set(key, lambda: u'first', stale_ttl=100), u'first')
+            self.assertTrue(self.cc.get_connection().exists(key + u':stale'))
+
+            self.cc.delete(key)
+            token = self.cc.acquire_lock(key + u':lock')
+            self.assertTrue(self.cc.get_connection().exists(key + u':lock'))
+            self.assertEqual(self.cc.get_or_set(key, lambda: u'second', stale_ttl=100, wait=0), u'first')
+            self.cc.release_lock(key + u':lock', token)
+        finally:
+            self.cc.scan(self.profiles.pattern()).unlink()
+
+    def test_bytes_names(self):
+        key = ('bytes%s' % self.stamp).encode('utf-8')
+        try:
+            self.assertEqual(self.cc.get_or_set(key, lambda: 1, stale_ttl=100), 1)
+            self.assertTrue(self.cc.get_connection().exists(key + b':stale'))
+            self.cc.set_large(key + b':large', u'x' * 100, chunk_size=16)
+            self.assertEqual(self.cc.get_large(key + b':large'), u'x' * 100)
+            self.cc.delete_large(key + b':large')
+        finally:
+            self.cc.scan('bytes%s*' % self.stamp).unlink()
+
+if __name__ == '__main__':
+    unittest.main()
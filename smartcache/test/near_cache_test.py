@@ -0,0 +1,89 @@
+#!/usr/bin/python
+# coding=utf-8
+
+from smartcache.near_cache import NearCache
+from smartcache.redis_cache import Cache
+import unittest
+import time
+
+
+class NearCacheTest(unittest.TestCase):
+    """
+    redis 2.88.11
+    """
+    def setUp(self):
+        self.key = str(time.time())
+        self.nc = NearCache(Cache())
+        self.other = NearCache(Cache())
+
+    def tearDown(self):
+        self.nc.delete(self.key)
+        self.nc.stop()
+        self.other.stop()
+
+    def wait_for(self, func, timeout=2):
+        start = time.time()
+        while not func() and time.time() - start < timeout:
+            time.sleep(0.01)
+        return func()
+
+    def test_get_set(self):
+        self.nc.set(self.key, self.key)
+        self.assertEqual(self.nc.get(self.key), self.key)
+        self.assertTrue(self.key in self.nc.local)
+        self.assertEqual(self.nc.stats()['hits'], 0)
+        self.assertEqual(self.nc.get(self.key), self.key)
+        self.assertEqual(self.nc.stats()['hits'], 1)
+
+    def test_invalidation(self):
+        self.nc.set(self.key, 1)
+        self.assertEqual(self.other.get(self.key), 1)
+        self.assertTrue(self.key in self.other.local)
+
+        self.nc.set(self.key, 2)
+        self.assertTrue(self.wait_for(lambda: self.key not in self.other.local))
+        self.assertEqual(int(self.other.get(self.key)), 2)
+
+        self.nc.cache.set_large(self.key, u'large')
+        self.assertTrue(self.wait_for(lambda: self.key not in self.other.local))
+        self.nc.cache.delete_large(self.key)
+
+        self.nc.delete(self.key)
+        self.assertTrue(self.wait_for(lambda: self.key not in self.other.local))
+        self.assertEqual(self.other.get(self.key), None)
+
+    def test_invalidation_during_read(self):
+        self.nc.set(self.key, 1)
+        read = self.nc.cache.get
+
+        def get(name):
+            value = read(name)
+            self.nc.invalidate(name)
+            return value
+
+        self.nc.cache.get = get
+        self.assertEqual(self.nc.get(self.key), 1)
+        self.assertFalse(self.key in self.nc.local)
+        del self.nc.cache.get
+        self.assertEqual(self.nc.get(self.key), 1)
+        self.assertTrue(self.key in self.nc.local)
+
+    def test_write_commands(self):
+        self.nc.set(self.key, 1)
+        self.assertEqual(self.other.get(self.key), 1)
+        self.other.cache.rename(self.key, self.key + ':renamed')
+        self.assertTrue(self.wait_for(lambda: self.key not in self.other.local))
+        self.nc.delete(self.key + ':renamed')
+
+        self.nc.cache.get_connection().set(self.key, 1)
+        self.assertEqual(int(self.other.get(self.key)), 1)
+        self.nc.inc(self.key)
+        self.assertTrue(self.wait_for(lambda: self.key not in self.other.local))
+        self.assertEqual(int(self.other.get(self.key)), 2)
+
+        self.nc.cache.set_large(self.key, u'large')
+        self.assertTrue(self.wait_for(lambda: self.key not in self.other.local))
+        self.nc.cache.delete_large(self.key)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,10 +4,12 @@ import os
 import sys
 import unittest
 import random
+import gc
 import time
 import threading
+import tempfile
 
-from smartcache.object_cache import Cache
+from smartcache.object_cache import Cache, ObjectCache, get_cache, remove_cache, cache_stats, memoize
 
 THREAD_COUNT = 0
 
@@ -26,6 +28,7 @@ class ObjectCacheTest(unittest.TestCase):
         self.key = str(time.time())
 
     def tearDown(self):
+        self.oc.configure(max_entries=0, max_bytes=0, segments=1)
         del self.oc
 
     def test_get_set(self):
@@ -61,5 +64,212 @@ class ObjectCacheTest(unittest.TestCase):
 
         self.assertEqual(threads_number, THREAD_COUNT)
 
+    def test_lru_eviction(self):
+        keys = ['%s_%s' % (self.key, i) for i in range(3)]
+        self.oc.clear()
+        self.oc.configure(max_entries=2)
+        evictions = self.oc.stats()['evictions']
+        self.oc.set(keys[0], 0)
+        self.oc.set(keys[1], 1)
+        self.oc.get(keys[0])
+        self.oc.set(keys[2], 2)
+        self.assertEqual(self.oc.get(keys[0]), 0)
+        self.assertEqual(self.oc.get(keys[1]), None)
+        self.assertEqual(self.oc.get(keys[2]), 2)
+        self.assertEqual(self.oc.stats()['evictions'], evictions + 1)
+
+    def test_configure_keeps_limits(self):
+        self.oc.configure(max_entries=100, max_bytes=1 << 20)
+        self.oc.configure(segments=8)
+        stats = self.oc.stats()
+        self.assertEqual((stats['max_entries'], stats['max_bytes'], stats['segments']), (100, 1 << 20, 8))
+        self.oc.configure(max_entries=0)
+        stats = self.oc.stats()
+        self.assertEqual((stats['max_entries'], stats['max_bytes']), (0, 1 << 20))
+
+    def test_byte_budget(self):
+        self.oc.configure(max_bytes=4096)
+        for i in range(100):
+            self.oc.set('%s_%s' % (self.key, i), 'x' * 100)
+        stats = self.oc.stats()
+        self.assertTrue(stats['bytes'] <= 4096)
+        self.assertTrue(stats['evictions'] > 0)
+        self.assertEqual(self.oc.get('%s_%s' % (self.key, 99)), 'x' * 100)
+
+    def test_striped_multi_thread(self):
+        self.oc.configure(max_entries=512, segments=8)
+        errors = []
+
+        def worker(n):
+            try:
+                for i in range(2000):
+                    key = '%s_%s' % (self.key, i % 64)
+                    self.oc.set(key, n, expire=0 if i % 7 == 0 else 60)
+                    self.oc.get(key)
+                    if i % 5 == 0:
+                        self.oc.delete(key)
+            except Exception as e:
+                errors.append(e)
+
+        thread_list = [threading.Thread(target=worker, args=(n,)) for n in range(16)]
+        for t in thread_list:
+            t.start()
+        for t in thread_list:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.oc.stats()['segments'], 8)
+        self.oc.set(self.key, self.key)
+        self.oc.configure(segments=2)
+        self.assertEqual(self.oc.get(self.key), self.key)
+
+    def test_resegment_expire(self):
+        self.oc.clear()
+        for i in range(100):
+            self.oc.set('%s_%s' % (self.key, i), i, expire=0.01)
+        self.oc.configure(segments=4)
+        self.assertEqual(self.oc.stats()['entries'], 100)
+        time.sleep(0.05)
+        self.assertEqual(self.oc.reap(), 100)
+        self.assertEqual(self.oc.stats()['entries'], 0)
+
+    def test_active_expire(self):
+        self.oc.clear()
+        for i in range(100):
+            self.oc.set('%s_%s' % (self.key, i), i, expire=0.01)
+        self.oc.set(self.key, self.key)
+        time.sleep(0.05)
+        self.assertEqual(self.oc.reap(10), 10)
+        # every write reclaims a few more expired entries
+        for i in range(5):
+            self.oc.set(self.key, self.key)
+        self.assertTrue(self.oc.stats()['entries'] < 91)
+        self.oc.reap()
+        self.assertEqual(self.oc.stats()['entries'], 1)
+        self.assertEqual(self.oc.get(self.key), self.key)
+
+    def test_reaper_thread(self):
+        self.oc.clear()
+        self.oc.set(self.key, self.key, expire=0.01)
+        self.oc.start_reaper(interval=0.01)
+        try:
+            time.sleep(0.2)
+            self.assertEqual(self.oc.stats()['entries'], 0)
+        finally:
+            self.oc.stop_reaper()
+
+    def test_instances(self):
+        first = get_cache('first_%s' % self.key, max_entries=1, expire=60)
+        second = ObjectCache('second_%s' % self.key)
+        try:
+            self.assertTrue(get_cache(first.name) is first)
+            with self.assertRaises(ValueError):
+                ObjectCache(second.name)
+
+            first.set(self.key, 1)
+            first.set(self.key + '1', 1)
+            second.set(self.key, 2)
+            self.assertEqual(first.get(self.key), None)
+            self.assertEqual(second.get(self.key), 2)
+            self.assertEqual(self.oc.get(self.key), None)
+
+            stats = cache_stats()
+            self.assertEqual(stats[first.name]['evictions'], 1)
+            self.assertEqual(stats[first.name]['expire'], 60)
+            self.assertEqual(stats[second.name]['hits'], 1)
+            self.assertTrue('default' in stats)
+        finally:
+            remove_cache(first.name)
+            remove_cache(second.name)
+
+    def test_memoize(self):
+        calls = []
+
+        @memoize(ttl=60, maxsize=10)
+        def add(a, b=0):
+            calls.append((a, b))
+            return a + b
+
+        class Profile(object):
+            @memoize()
+            def load(self, user_id):
+                calls.append(user_id)
+                return None
+
+        try:
+            self.assertEqual(add(1), 1)
+            self.assertEqual(add(1), 1)
+            self.assertEqual(add(1, b=2), 3)
+            self.assertEqual(add(1, b=2), 3)
+            self.assertEqual(len(calls), 2)
+            add.invalidate(1, b=2)
+            self.assertEqual(add(1, b=2), 3)
+            self.assertEqual(len(calls), 3)
+            info = add.cache_info()
+            self.assertEqual((info['hits'], info['misses']), (2, 3))
+
+            profile = Profile()
+            self.assertEqual(profile.load(1), None)
+            self.assertEqual(profile.load(1), None)
+            self.assertEqual(len(calls), 4)
+            profile.load.invalidate(1)
+            profile.load(1)
+            self.assertEqual(len(calls), 5)
+            self.assertTrue(add.cache.name in cache_stats())
+        finally:
+            remove_cache(add.cache.name)
+            remove_cache(Profile.load.cache.name)
+
+    def test_memoize_registry(self):
+        def make():
+            @memoize()
+            def square(x):
+                return x * x
+            return square
+
+        first, second = make(), make()
+        self.assertNotEqual(first.cache.name, second.cache.name)
+        self.assertTrue(first.cache.name in cache_stats())
+        self.assertEqual(first(3), 9)
+
+        names = [first.cache.name, second.cache.name]
+        del first, second
+        gc.collect()
+        self.assertFalse(any(name in cache_stats() for name in names))
+
+    def test_soft_expire(self):
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(self.oc.default.get_or_set(self.key, loader, expire=60, soft_expire=0.05), 1)
+        self.assertEqual(self.oc.get(self.key), 1)
+        time.sleep(0.1)
+        # past the soft deadline the cached value is returned right away
+        self.assertEqual(self.oc.default.get_or_set(self.key, loader, expire=60, soft_expire=0.05), 1)
+        start = time.time()
+        while self.oc.get(self.key) != 2 and time.time() - start < 2:
+            time.sleep(0.01)
+        self.assertEqual(self.oc.get(self.key), 2)
+        self.assertEqual(len(calls), 2)
+
+    def test_snapshot(self):
+        path = os.path.join(tempfile.mkdtemp(), 'snapshot')
+        source = ObjectCache()
+        source.set(self.key, {'value': self.key}, expire=60)
+        source.set(self.key + '1', 1, expire=0.01)
+        time.sleep(0.05)
+        self.assertEqual(source.dump(path), 1)
+
+        target = ObjectCache()
+        self.assertEqual(target.load(path), 1)
+        self.assertEqual(target.get(self.key), {'value': self.key})
+        self.assertEqual(target.get(self.key + '1'), None)
+        self.assertEqual(target.dump(path), 1)
+        self.assertEqual(ObjectCache().load(path + '1'), 0)
+        os.remove(path)
+
 if __name__ == '__main__':
     unittest.main()
@@ -228,5 +228,143 @@ class CacheTest(unittest.TestCase):
         v = self.cc.sortedset_members(self.key, withscores=True)
         self.assertEqual(v, [(self.key, 3)])
 
+    def test_lock(self):
+        lock_name = self.key + ':lock'
+        token = self.cc.acquire_lock(lock_name, 5)
+        self.assertTrue(token)
+        self.assertEqual(self.cc.acquire_lock(lock_name, 5), None)
+        self.assertFalse(self.cc.release_lock(lock_name, 'other'))
+        self.assertTrue(self.cc.release_lock(lock_name, token))
+        self.assertFalse(self.cc.exists(lock_name))
+
+    def test_get_or_set(self):
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return self.key
+
+        self.assertEqual(self.cc.get_or_set(self.key, loader, ttl=60, stale_ttl=60), self.key)
+        self.assertEqual(self.cc.get_or_set(self.key, loader, ttl=60), self.key)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(0 < self.cc.ttl(self.key) <= 60)
+
+        # another process holds the lock: the stale copy is served
+        self.cc.delete(self.key)
+        token = self.cc.acquire_lock(self.key + ':lock', 5)
+        try:
+            self.assertEqual(self.cc.get_or_set(self.key, loader, ttl=60, stale_ttl=60), self.key)
+            self.assertEqual(len(calls), 1)
+        finally:
+            self.cc.release_lock(self.key + ':lock', token)
+            self.cc.delete(self.key + ':stale')
+
+    def test_soft_ttl(self):
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(self.cc.get_or_set(self.key, loader, ttl=60, soft_ttl=0.05), 1)
+        self.assertEqual(self.cc.get(self.key), 1)
+        time.sleep(0.1)
+        self.assertEqual(self.cc.get_or_set(self.key, loader, ttl=60, soft_ttl=0.05), 1)
+        start = time.time()
+        while self.cc.get(self.key) != 2 and time.time() - start < 2:
+            time.sleep(0.01)
+        self.assertEqual(self.cc.get(self.key), 2)
+        self.assertEqual(len(calls), 2)
+
+    def test_many(self):
+        names = ['%s_%s' % (self.key, i) for i in range(12)]
+        mapping = dict((name, {'name': name}) for name in names)
+        self.cc.set_many(mapping, chunk_size=5)
+        self.assertEqual(self.cc.get_many(names + [self.key], chunk_size=5), mapping)
+        self.assertEqual(self.cc.delete_many(names, chunk_size=5), len(names))
+        self.assertEqual(self.cc.get_many(names), {})
+
+        self.cc.set_many(mapping, ttl=60)
+        self.assertTrue(0 < self.cc.ttl(names[0]) <= 60)
+        self.cc.delete_many(names)
+
+    def test_pipeline(self):
+        other = self.key + '1'
+        with self.cc.pipeline() as p:
+            self.assertTrue(p.set(self.key, {'value': self.key}) is None)
+            p.lupdate(other, [1, 2])
+            value = p.get(self.key)
+            missing = p.get(self.key + '2')
+            items = p.list(other, limit=2)
+            exists = p.exists(self.key)
+            self.assertFalse(value.done)
+        self.assertEqual(value.value, {'value': self.key})
+        self.assertEqual(missing.value, None)
+        self.assertEqual(sorted(items.value), [1, 2])
+        self.assertTrue(exists.value)
+
+        with self.cc.pipeline() as p:
+            p.set_many({other: 1})
+            many = p.get_many([self.key, other])
+            deleted = p.delete_many([other])
+        self.assertEqual(many.value, {self.key: {'value': self.key}, other: 1})
+        self.assertEqual(deleted.value, 1)
+
+        p = self.cc.pipeline()
+        p.set(other, 1)
+        p.delete(other)
+        self.assertEqual(len(p), 2)
+        self.assertEqual(p.execute(), [True, 1])
+        with self.assertRaises(NotImplementedError):
+            p.get_or_set(self.key, lambda: 1)
+
+    def test_codecs(self):
+        from smartcache.serializers import CodecRegistry
+        self.cc.codecs = CodecRegistry()
+        self.cc.set(self.key, 1)
+        self.cc.inc(self.key, 2)
+        self.assertEqual(self.cc.get(self.key), 3)
+        self.cc.set(self.key, u'text')
+        self.assertEqual(self.cc.get(self.key), u'text')
+        self.cc.set(self.key, {'a': 1})
+        self.assertEqual(self.cc.get(self.key), {'a': 1})
+
+    def test_scripts(self):
+        self.cc.update_set(self.key, [1, 2, 3])
+        self.cc.master_connection().script_flush()
+        # NOSCRIPT is answered by loading the script again
+        self.assertEqual(self.cc.size(self.key), 3)
+        self.assertTrue(self.cc.contains(self.key, 2))
+        self.assertEqual(self.cc.pop_member(self.key, [1, 2, 4]), 2)
+        self.assertEqual(self.cc.pop_member(self.key, []), 0)
+
+        with self.cc.pipeline() as p:
+            size = p.size(self.key)
+            contains = p.contains(self.key, 3)
+        self.assertEqual((size.value, contains.value), (1, True))
+
+        self.cc.set(self.key, 1)
+        with self.assertRaises(ValueError):
+            self.cc.size(self.key)
+
+    def test_iter_collections(self):
+        names = [self.key + ':hash', self.key + ':set', self.key + ':zset']
+        try:
+            for i in range(300):
+                self.cc.hash(names[0], 'f%s' % i, i)
+            self.cc.update_set(names[1], list(range(300)))
+            self.cc.master_connection().zadd(names[2], dict((self.cc.dumps(i), i) for i in range(300)))
+
+            for prefetch in (False, True):
+                self.assertEqual(dict(self.cc.iter_hash(names[0], count=50, prefetch=prefetch)),
+                                 dict((('f%s' % i).encode('utf-8'), i) for i in range(300)))
+                self.assertEqual(sorted(self.cc.iter_set(names[1], count=50, prefetch=prefetch)), list(range(300)))
+                self.assertEqual(sorted(self.cc.iter_sortedset(names[2], count=50, prefetch=prefetch)),
+                                 [(i, float(i)) for i in range(300)])
+            self.assertEqual(sorted(field for field, value in self.cc.iter_hash(names[0], match='f29*')),
+                             sorted(('f29%s' % i).encode('utf-8') for i in [''] + list(range(10))))
+        finally:
+            self.cc.delete_many(names)
+
 if __name__ == '__main__':
     unittest.main()
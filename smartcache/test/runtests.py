@@ -1,15 +1,33 @@
 #-*- coding:utf-8 -*-
 from __future__ import absolute_import, division, print_function, with_statement
 
+import sys
+
 from smartcache.test.util import unittest
 
 TEST_MODULES = [
     'redis_cache_test',
     'object_cache_test',
     'shard_cache_test',
-    'master_slave_cache_test'
+    'master_slave_cache_test',
+    'near_cache_test',
+    'shm_cache_test',
+    'compact_cache_test',
+    'bloom_test',
+    'serializers_test',
+    'compression_test',
+    'scanner_test',
+    'views_test',
+    'chunked_test',
+    'keyspace_test',
+    'counters_test',
+    'connection_test',
 ]
 
+# async syntax
+if sys.version_info >= (3, 6):
+    TEST_MODULES.append('async_cache_test')
+
 
 def main():
     testSuite = unittest.TestSuite()
@@ -0,0 +1,54 @@
+#-*- coding:utf-8 -*-
+
+import time
+import unittest
+
+from smartcache.redis_cache import Cache, ShardCache
+from smartcache.test.shard_cache_test import servers
+
+
+class ScannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cc = Cache()
+        self.key = str(time.time())
+        self.names = ['%s:%s' % (self.key, i) for i in range(50)]
+        self.cc.set_many(dict((name, i) for i, name in enumerate(self.names)))
+        self.cc.update_set(self.key + ':set', [1, 2])
+
+    def tearDown(self):
+        self.cc.delete_many(self.names + [self.key + ':set'])
+
+    def test_match(self):
+        keys = [k.decode('utf-8') for k in self.cc.scan(self.key + ':*', count=7)]
+        self.assertEqual(sorted(keys), sorted(self.names + [self.key + ':set']))
+        self.assertEqual(self.cc.scan(self.key + ':1*', count=7).count(), 11)
+
+    def test_type(self):
+        for server_type in (True, False):
+            scanner = self.cc.scan(self.key + ':*', type='set')
+            scanner._server_type = server_type
+            self.assertEqual([k.decode('utf-8') for k in scanner], [self.key + ':set'])
+
+    def test_actions(self):
+        self.cc.expire(self.names[0], 100)
+        ttls = dict(self.cc.scan(self.key + ':*').ttl())
+        self.assertEqual(ttls[self.names[0].encode('utf-8')], 100)
+        self.assertEqual(ttls[self.names[1].encode('utf-8')], -1)
+        self.assertEqual(self.cc.scan(self.key + ':*').unlink(), 51)
+        self.assertEqual(self.cc.scan(self.key + ':*').count(), 0)
+
+    def test_shard(self):
+        cc = ShardCache(servers)
+        names = ['%s:shard:%s' % (self.key, i) for i in range(50)]
+        cc.set_many(dict((name, 1) for name in names))
+        pattern = self.key + ':shard:*'
+        self.assertEqual(set(k.decode('utf-8') for k in cc.scan(pattern, count=5)), set(names))
+        # stop early, the shard threads must not block
+        for key in cc.scan(pattern, count=5):
+            break
+        cc.scan(pattern).unlink()
+        self.assertEqual(cc.scan(pattern).count(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#-*- coding:utf-8 -*-
+
+import time
+import pickle
+import unittest
+
+from smartcache.serializers import CodecRegistry, JsonCodec, Codec, msgpack, default_registry
+
+
+class CodecRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = CodecRegistry()
+
+    def test_round_trip(self):
+        for value in [0, -12, 2 ** 70, 1.5, -0.25, float('inf'), u'text', u'中文', b'\x00bytes',
+                      True, None, (1, 2), {'a': [1, 2]}]:
+            data = self.registry.dumps(value)
+            self.assertEqual(self.registry.loads(data), value)
+            self.assertEqual(type(self.registry.loads(data)), type(value))
+            self.assertEqual(self.registry.loads(bytearray(data)), value)
+
+    def test_scalar_layout(self):
+        self.assertEqual(self.registry.dumps(12), b'12')
+        self.assertEqual(self.registry.dumps(-1.5), b'-1.5')
+        self.assertEqual(self.registry.dumps(u'abc'), b'\x02abc')
+        self.assertEqual(self.registry.dumps(b'abc'), b'\x01abc')
+        # counters written by INCR are read back as int
+        self.assertEqual(self.registry.loads(b'42'), 42)
+
+    def test_legacy_pickle(self):
+        for protocol in range(0, pickle.HIGHEST_PROTOCOL + 1):
+            self.assertEqual(self.registry.loads(pickle.dumps({'a': 1}, protocol)), {'a': 1})
+
+    def test_register(self):
+        self.registry.register(JsonCodec(), (dict,))
+        self.assertEqual(self.registry.dumps({'a': 1}), b'\x05{"a":1}')
+        self.assertEqual(self.registry.loads(b'\x05{"a":1}'), {'a': 1})
+
+        class BadCodec(Codec):
+            tag = b'1'
+
+        with self.assertRaises(ValueError):
+            self.registry.register(BadCodec())
+
+    def test_encode_fallback(self):
+        self.registry.register(JsonCodec(), (dict,))
+        value = {'a': set([1, 2])}
+        self.assertEqual(self.registry.dumps(value)[:1], b'\x80')
+        self.assertEqual(self.registry.loads(self.registry.dumps(value)), value)
+
+    def test_default_registry(self):
+        registry = default_registry()
+        value = {'a': [1, 2]}
+        self.assertEqual(registry.loads(registry.dumps(value)), value)
+        if msgpack is not None:
+            self.assertEqual(registry.dumps(value)[:1], b'\x06')
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        registry = default_registry()
+        for value in [{1: u'a', 2: b'b'}, {'a': (1, 2)}, [set([1])], {(1, 2): 1}, [1.5, None, True]]:
+            self.assertEqual(registry.loads(registry.dumps(value)), value)
+
+if __name__ == '__main__':
+    unittest.main()
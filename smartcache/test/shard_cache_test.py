@@ -35,5 +35,11 @@ class CacheTest(unittest.TestCase):
             conn = self.cc.shard_client.connect_redis(host, int(port), int(db))
             self.assertEqual(pickle.loads(conn.get(k)), k)
 
+    def test_shard_many(self):
+        keys = ['%s_%s' % (self.keys[0], i) for i in range(100)]
+        self.cc.set_many(dict((k, k) for k in keys))
+        self.assertEqual(self.cc.get_many(keys), dict((k, k) for k in keys))
+        self.assertEqual(self.cc.delete_many(keys), len(keys))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
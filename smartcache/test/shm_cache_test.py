@@ -0,0 +1,98 @@
+#-*- coding:utf-8 -*-
+
+import os
+import time
+import pickle
+import unittest
+import tempfile
+
+from smartcache.object_cache import remove_cache
+from smartcache.shm_cache import SharedCache, SEQ, key_hash
+
+
+class SharedCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.key = str(time.time())
+        self.path = os.path.join(tempfile.mkdtemp(), 'smartcache-test')
+        self.sc = SharedCache('shm_%s' % self.key, slots=64, slot_size=256, path=self.path)
+
+    def tearDown(self):
+        remove_cache(self.sc.name)
+        self.sc._store.unlink()
+
+    def test_get_set(self):
+        self.assertEqual(self.sc.get(self.key), None)
+        self.assertFalse(self.sc.exists(self.key))
+        self.sc.set(self.key, {'value': self.key})
+        self.assertTrue(self.sc.exists(self.key))
+        self.assertEqual(self.sc.get(self.key), {'value': self.key})
+        self.sc.set(self.key, 1)
+        self.assertEqual(self.sc.get(self.key), 1)
+        self.assertEqual(len(self.sc), 1)
+        self.sc.delete(self.key)
+        self.assertEqual(self.sc.get(self.key), None)
+        self.assertEqual(len(self.sc), 0)
+
+        with self.assertRaises(ValueError):
+            self.sc.set(self.key, 'x' * 1024)
+
+    def test_torn_slot(self):
+        store = self.sc._store
+        self.sc.set(self.key, 1)
+        index = store._find(*self._key_hash(self.key))[0]
+        off = store._offset(index)
+        # a writer killed between the two sequence stores
+        SEQ.pack_into(store._mm, off, SEQ.unpack_from(store._mm, off)[0] + 1)
+
+        start = time.time()
+        self.assertEqual(self.sc.get(self.key), None)
+        self.assertEqual(store.pop(self.key), None)
+        self.assertTrue(time.time() - start < 5)
+
+        self.sc.set(self.key, 2)
+        self.assertEqual(self.sc.get(self.key), 2)
+        index = store._find(*self._key_hash(self.key))[0]
+        self.assertEqual(SEQ.unpack_from(store._mm, store._offset(index))[0] % 2, 0)
+
+    def _key_hash(self, key):
+        kb = pickle.dumps(key, 2)
+        return kb, key_hash(kb)
+
+    def test_expire(self):
+        self.sc.set(self.key, self.key, expire=0.01)
+        time.sleep(0.05)
+        self.assertEqual(self.sc.get(self.key), None)
+        self.assertEqual(self.sc.reap(), 1)
+        self.assertEqual(self.sc.stats()['expirations'], 1)
+
+    def test_eviction(self):
+        for i in range(200):
+            self.sc.set(i, i)
+        self.assertEqual(self.sc.get(199), 199)
+        self.assertTrue(self.sc.stats()['evictions'] > 0)
+        self.assertTrue(len(self.sc) <= 64)
+
+    def test_shared_between_processes(self):
+        self.sc.set(self.key, 'parent')
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                if self.sc.get(self.key) != 'parent':
+                    code = 1
+                self.sc.set(self.key, 'child')
+            finally:
+                os._exit(code)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+        self.assertEqual(self.sc.get(self.key), 'child')
+
+        other = SharedCache('shm_other_%s' % self.key, slots=64, slot_size=256, path=self.path)
+        try:
+            self.assertEqual(other.get(self.key), 'child')
+        finally:
+            remove_cache(other.name)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#-*- coding:utf-8 -*-
+
+import time
+import pickle
+import unittest
+
+from smartcache.redis_cache import Cache
+from smartcache.views import LazyDict, LazyList
+
+
+class CountingDecode(object):
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, data):
+        self.calls += 1
+        return pickle.loads(data)
+
+
+class ViewsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cc = Cache()
+        self.key = str(time.time())
+
+    def tearDown(self):
+        self.cc.delete(self.key)
+
+    def test_lazy_dict(self):
+        decode = CountingDecode()
+        view = LazyDict(dict(('f%s' % i, pickle.dumps(i)) for i in range(1000)), decode)
+        self.assertEqual(len(view), 1000)
+        self.assertEqual(view['f3'], 3)
+        self.assertEqual(view['f3'], 3)
+        self.assertTrue('f999' in view)
+        self.assertEqual(decode.calls, 1)
+        self.assertEqual(view.raw('f4'), pickle.dumps(4))
+
+        view['f3'] = 'new'
+        self.assertEqual(view['f3'], 'new')
+        del view['f4']
+        self.assertEqual(len(view.copy()), 999)
+
+    def test_lazy_list(self):
+        decode = CountingDecode()
+        view = LazyList([pickle.dumps(i) for i in range(1000)], decode)
+        self.assertEqual(view[-1], 999)
+        self.assertEqual(view[1:3], [1, 2])
+        self.assertEqual(decode.calls, 3)
+        self.assertEqual(view, list(range(1000)))
+        self.assertNotEqual(view, [])
+
+    def test_cache(self):
+        for i in range(100):
+            self.cc.hash(self.key, 'f%s' % i, i)
+        self.assertEqual(self.cc.hash(self.key)[b'f1'], 1)
+        self.assertTrue(isinstance(self.cc.hash(self.key), dict))
+        self.assertTrue(isinstance(self.cc.hash_values(self.key), list))
+
+        self.cc.lazy_views = True
+        fields = self.cc.hash(self.key)
+        self.assertTrue(isinstance(fields, LazyDict))
+        self.assertEqual(fields[b'f42'], 42)
+        self.assertEqual(sorted(self.cc.hash_values(self.key)), list(range(100)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#-*- coding:utf-8 -*-
+from __future__ import absolute_import, division, print_function, with_statement
+
+try:
+    from collections.abc import MutableMapping, Sequence
+except ImportError:
+    from collections import MutableMapping, Sequence
+
+_MISSING = object()
+
+
+class LazyDict(MutableMapping):
+
+    """
+    mapping over the raw fields of a hash reply, a value is decoded on its
+    first read and kept. Fields that are never read are never decoded.
+    """
+
+    __slots__ = ['_raw', '_decoded', '_decode']
+
+    def __init__(self, raw, decode):
+        self._raw = raw
+        self._decoded = {}
+        self._decode = decode
+
+    def __getitem__(self, key):
+        value = self._decoded.get(key, _MISSING)
+        if value is _MISSING:
+            value = self._decoded[key] = self._decode(self._raw[key])
+        return value
+
+    def __setitem__(self, key, value):
+        self._raw[key] = None
+        self._decoded[key] = value
+
+    def __delitem__(self, key):
+        del self._raw[key]
+        self._decoded.pop(key, None)
+
+    def __iter__(self):
+        return iter(self._raw)
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __contains__(self, key):
+        return key in self._raw
+
+    def raw(self, key):
+        """the undecoded bytes of key
+        """
+        return self._raw[key]
+
+    def copy(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return '<LazyDict %d fields, %d decoded>' % (len(self._raw), len(self._decoded))
+
+
+class LazyList(Sequence):
+
+    """
+    sequence over the raw items of a list or set reply, an item is decoded
+    on its first read and kept
+    """
+
+    __slots__ = ['_raw', '_decoded', '_decode']
+
+    def __init__(self, raw, decode):
+        self._raw = list(raw)
+        self._decoded = [_MISSING] * len(self._raw)
+        self._decode = decode
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._raw)))]
+
+        value = self._decoded[index]
+        if value is _MISSING:
+            value = self._decoded[index] = self._decode(self._raw[index])
+        return value
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, LazyList)):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def raw(self, index):
+        return self._raw[index]
+
+    def __repr__(self):
+        return '<LazyList %d items>' % len(self._raw)